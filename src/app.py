@@ -2,21 +2,51 @@
 # @File   : app.py
 # @Time   : 2025/9/6
 
+import copy
+import os
 import streamlit as st
-from data_loader import load_data, filter_data
-from overview import render_overview
-from retention import render_retention_funnel
-from simulation_trend import render_trend
-from correlation import render_correlation
-from clustering import render_clustering
-from prediction import render_prediction
-from report_export import export_full_report
+from data_loader import select_rows, take_rows
+from figure_data import LazyFigures
+from instrument import ENABLED as INSTRUMENT_DEFAULT, Trace, show_trace, span
+from result_cache import ResultCache, fingerprint
+from shared import DataService, JobPool
+# section modules (and the scipy / sklearn / reportlab stacks behind them)
+# are imported when a section or the export first needs them
 
 # page setting
 st.set_page_config(page_title="Player behavior analysis dashboard", layout="wide")
 
-# load data
-df, df_europe = load_data()
+@st.cache_resource
+def get_result_cache():
+    # shared by every session of this server process
+    return ResultCache(persist_dir=os.environ.get("GDA_RESULT_CACHE_DIR"))
+
+@st.cache_resource
+def get_data_service():
+    return DataService()
+
+@st.cache_resource
+def get_job_pool():
+    # heavy jobs of all sessions share one bounded pool; identical requests
+    # that are already running are merged instead of computed twice
+    return JobPool(get_result_cache())
+
+result_cache = get_result_cache()
+job_pool = get_job_pool()
+
+# instrumentation of this run, switched on in the debug panel at the bottom
+# of the sidebar (widget values of the previous run are already known here)
+trace = None
+if st.session_state.get("gda_instrument", INSTRUMENT_DEFAULT):
+    trace = Trace(profile=st.session_state.get("gda_profile", False))
+    trace.start()
+
+# load data (one read-only, memory-mapped snapshot shared by all sessions)
+with span("load dataset"):
+    dataset = get_data_service().dataset()
+df, df_europe = dataset.df, dataset.df_europe
+index, cube, moments, timeline = dataset.index, dataset.cube, dataset.moments, dataset.timeline
+retention = dataset.retention
 
 # Sidebar filters
 st.sidebar.header("🌍 Filters")
@@ -31,57 +61,155 @@ section = st.sidebar.radio(
     "📑 Module Navigation",
     ["Overview",
      "Retention & Funnel",
-     "Simulated Trend",
+     "Trend Analysis",
      "Correlation Analysis",
      "Cluster Analysis",
-     "Predictive Modeling"],
+     "Predictive Modeling",
+     "Segment Comparison"],
     index=0
 )
 
 # filter global data
-filtered_data = filter_data(df, selected_region, genres, genders, purchase_filter)
-if len(filtered_data) == 0:
+with span("filter rows") as s:
+    rows = select_rows(df, selected_region, genres, genders, purchase_filter, index=index)
+    s.set(rows=len(rows))
+if len(rows) == 0:
+    if trace is not None:
+        trace.stop()
     st.warning("There is no data under the current filter conditions. Please adjust the filter conditions.")
     st.stop()
 
-# --- Run selected module ---
-metrics, figs_overview = render_overview(filtered_data, selected_region) if section == "Overview" else (None, {})
-fig_retention, fig_funnel = render_retention_funnel(filtered_data) if section == "Retention & Funnel" else (None, None)
-fig_new, fig_purchase_trend, fig_sessions_trend = render_trend(filtered_data) if section == "Simulated Trend" else (None, None, None)
-results_df, fig_corr, fig_scatter, fig_box = render_correlation(filtered_data) if section == "Correlation Analysis" else (None, None, None, None)
-fig_cluster, fig_summary = render_clustering(filtered_data) if section == "Cluster Analysis" else (None, None)
-model_acc, fig_cm = render_prediction(filtered_data) if section == "Predictive Modeling" else (None, None)
+# overview and retention read aggregated cube cells; the other modules need rows
+with span("query aggregates"):
+    filtered_cube = cube.query(selected_region, genres, genders, purchase_filter)
+    filtered_moments = moments.query(selected_region, genres, genders, purchase_filter)
+    filtered_timeline = timeline.query(selected_region, genres, genders, purchase_filter)
+    filtered_retention = retention.query(selected_region, genres, genders, purchase_filter) if retention is not None else None
+
+# --- Run selected module (results are cached per dataset version + filters) ---
+def result_key(*options):
+    return fingerprint(df.attrs.get("store_version"), selected_region, genres, genders, purchase_filter, section, *options)
+
+def cached(compute, *options):
+    with span(f"compute: {section}", rows=len(rows)):
+        return job_pool.run(result_key(*options), compute)
+
+def cached_view(compute, *options):
+    # the cached figures are shared by every session, and built Plotly figures
+    # are mutable and not counted by the cache bound: each session builds and
+    # keeps its own copy of the current view's figures
+    *result, figs = cached(compute, *options)
+    key = result_key(*options)
+    held = st.session_state.get("gda_figures")
+    if held is None or held[0] != key:
+        held = st.session_state["gda_figures"] = (key, copy.copy(figs))
+    return (*result, held[1])
+
+# every section returns cheap results plus lazy figures, built when shown or exported
+metrics, results_df, model_acc = None, None, None
+figs = LazyFigures()
+options = ()
+
+if section == "Overview":
+    from overview import render_overview, show_overview
+    metrics, figs = cached_view(lambda: render_overview(filtered_cube, selected_region, render=False))
+    with span(f"show: {section}"):
+        show_overview(metrics, figs)
+elif section == "Retention & Funnel":
+    from retention import render_retention_funnel, show_retention_funnel
+    # the event log is versioned separately from the store
+    options = (dataset.events,)
+    _, _, figs = cached_view(lambda: render_retention_funnel(filtered_cube, render=False, curves=filtered_retention),
+                             *options)
+    with span(f"show: {section}"):
+        show_retention_funnel(figs)
+elif section == "Trend Analysis":
+    from simulation_trend import render_trend, show_trend
+    freq = {"Month": "M", "Week": "W", "Day": "D"}[st.sidebar.selectbox("Trend granularity", ["Month", "Week", "Day"])]
+    window = st.sidebar.slider("Rolling window (periods)", 1, 12, 1)
+    options = (freq, window)
+    trend, figs = cached_view(
+        lambda: render_trend(None, render=False, timeline=filtered_timeline, freq=freq, window=window), *options)
+    with span(f"show: {section}"):
+        show_trend(trend, figs)
+elif section == "Correlation Analysis":
+    from correlation import render_correlation, show_correlation
+    robust = st.sidebar.checkbox("Robust statistics", value=False,
+                                 help="Bootstrap confidence intervals, permutation tests and "
+                                      "Benjamini-Hochberg correction over all pairs")
+    options = (robust,)
+    results_df, figs = cached_view(
+        lambda: render_correlation(take_rows(df, rows), render=False, moments=filtered_moments, robust=robust),
+        *options)
+    with span(f"show: {section}"):
+        show_correlation(results_df, figs)
+elif section == "Cluster Analysis":
+    from clustering import render_clustering, show_clustering
+    cluster_summary, figs = cached_view(lambda: render_clustering(take_rows(df, rows), render=False))
+    with span(f"show: {section}"):
+        show_clustering(cluster_summary, figs)
+elif section == "Predictive Modeling":
+    from prediction import render_prediction, show_prediction
+    all_features = st.sidebar.checkbox("Train on all feature columns", value=False)
+    cv_folds = st.sidebar.selectbox("Cross-validation folds", [0, 3, 5, 10], index=0)
+    options = (all_features, cv_folds)
+    model_acc, figs = cached_view(lambda: render_prediction(take_rows(df, rows), render=False,
+                                                            all_features=all_features, cv_folds=cv_folds),
+                                  *options)
+    with span(f"show: {section}"):
+        show_prediction(model_acc, figs)
+elif section == "Segment Comparison":
+    from comparison import render_comparison, show_comparison
+    from segment_compare import DIMENSIONS, segments_by
+    # every value of the chosen dimension under the current filters, in one pass
+    compare_by = st.sidebar.selectbox("Compare by", DIMENSIONS)
+    fit_models = st.sidebar.checkbox("Fit models per segment", value=True,
+                                     help="KMeans and payer model for every segment, trained in parallel")
+    segments = segments_by(cube, compare_by, selected_region, genres, genders, purchase_filter)
+    options = (compare_by, fit_models, dataset.events)
+    comparison, figs = cached_view(lambda: render_comparison(df, index, cube, moments, segments, render=False,
+                                                             curves=retention, models=fit_models),
+                                   *options)
+    with span(f"show: {section}"):
+        show_comparison(comparison, figs)
 
 # --- Export Report ---
 st.sidebar.header("📑 Export Report")
 
-# Collect all charts
-all_figs = {}
-all_figs.update(figs_overview or {})
-if fig_retention: all_figs["Retention Rate"] = fig_retention
-if fig_funnel: all_figs["Funnel Analysis"] = fig_funnel
-if fig_corr: all_figs["Correlation Heatmap"] = fig_corr
-if fig_scatter: all_figs["Correlation Scatter"] = fig_scatter
-if fig_box: all_figs["Correlation Boxplot"] = fig_box
-if fig_cluster: all_figs["Clustering Result"] = fig_cluster
-if fig_cm: all_figs["Prediction Confusion Matrix"] = fig_cm
-if fig_new: all_figs["New Players Trend"] = fig_new
-if fig_purchase_trend: all_figs["Purchase Trend"] = fig_purchase_trend
-if fig_sessions_trend: all_figs["Average Sessions Trend"] = fig_sessions_trend
-
 # select charts(default: all)
 selected_charts = st.sidebar.multiselect(
     "Select charts to include in the report",
-    list(all_figs.keys()),
-    default=list(all_figs.keys())
+    list(figs),
+    default=list(figs)
 )
 
 if st.sidebar.button("⬇️ Download Report"):
+    from report_export import export_full_report
     with st.spinner("Generating report... please wait..."):
-        pdf = export_full_report(metrics, results_df, all_figs, model_acc, selected_charts)
+        with span("export report", charts=len(selected_charts)):
+            pdf = cached(lambda: export_full_report(metrics, results_df, figs, model_acc, selected_charts).getvalue(),
+                         *options, "report", selected_charts)
     st.sidebar.download_button(
         "Save Report",
         pdf,
         file_name=f"{section}_report.pdf",
         mime="application/pdf"
     )
+
+cache_stats = result_cache.stats()
+st.sidebar.caption(f"Result cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses, "
+                   f"{cache_stats['entries']} entries ({cache_stats['bytes'] / 2**20:.1f} MB)")
+pool_stats = job_pool.stats()
+st.sidebar.caption(f"Job pool: {pool_stats['in_flight']} running on {pool_stats['workers']} workers, "
+                   f"{pool_stats['merged']} duplicate requests merged")
+
+# --- Debug: instrumentation of this run ---
+if trace is not None:
+    trace.stop()
+st.sidebar.header("🛠 Debug")
+st.sidebar.checkbox("Instrument this view", value=INSTRUMENT_DEFAULT, key="gda_instrument",
+                    help="Time loading, filtering, module compute, figures and export on every rerun")
+st.sidebar.checkbox("Sampling profiler", value=False, key="gda_profile", disabled=trace is None,
+                    help="Sample the stacks of instrumented threads (adds a little overhead)")
+if trace is not None:
+    show_trace(trace, st.sidebar)
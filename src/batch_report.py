@@ -0,0 +1,191 @@
+# @Author : Yulia
+# @File   : batch_report.py
+# @Time   : 2026/10/18
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import chart_render
+from data_loader import load_data, load_filter_index, load_cube, load_moments, load_timeline, load_retention, take_rows
+from overview import render_overview
+from retention import render_retention_funnel
+from simulation_trend import render_trend
+from correlation import render_correlation
+from clustering import render_clustering
+from prediction import render_prediction
+from report_export import export_full_report
+
+# Headless nightly reporting: computes every module for a grid of segments
+# (Location x GameGenre x paid/not-paid by default) and writes one PDF per
+# segment. Data, filter index and cube are loaded once and shared with the
+# worker processes; finished segments are recorded so a rerun resumes.
+
+PURCHASE_LABELS = {"Paid players": "paid", "Not-paid players": "notpaid", "All": "all"}
+MANIFEST = "progress.json"
+
+_shared = {}
+
+
+def segment_name(region, genre, purchase_filter):
+    parts = [region, genre or "AllGenres", PURCHASE_LABELS[purchase_filter]]
+    return re.sub(r"[^A-Za-z0-9_-]+", "-", "_".join(parts))
+
+
+def _load_shared():
+    df, _ = load_data()
+    _shared.update(df=df, index=load_filter_index(df), cube=load_cube(df),
+                   moments=load_moments(df), timeline=load_timeline(df), retention=load_retention(df))
+
+
+def _init_worker(render_workers):
+    # segments already run in parallel, so by default each worker rasterizes
+    # its own charts instead of starting a nested renderer pool
+    chart_render.RENDER_WORKERS = render_workers
+    if not _shared:
+        _load_shared()
+
+
+def compute_report(df, cube, rows, selected_region, genres, genders, purchase_filter, moments=None, timeline=None,
+                   retention=None):
+    filters = (selected_region, genres, genders, purchase_filter)
+    filtered_cube = cube.query(*filters)
+    filtered_moments = moments.query(*filters) if moments is not None else None
+    filtered_timeline = timeline.query(*filters) if timeline is not None else None
+    filtered_retention = retention.query(*filters) if retention is not None else None
+    filtered_data = take_rows(df, rows)
+
+    metrics, all_figs = render_overview(filtered_cube, selected_region, render=False)
+    _, _, figs_retention = render_retention_funnel(filtered_cube, render=False, curves=filtered_retention)
+    results_df, figs_correlation = render_correlation(filtered_data, render=False, moments=filtered_moments)
+    _, figs_cluster = render_clustering(filtered_data, render=False)
+    model_acc, figs_prediction = render_prediction(filtered_data, render=False)
+    _, figs_trend = render_trend(filtered_data, render=False, timeline=filtered_timeline)
+
+    # same chart order as the dashboard export
+    for figs in (figs_retention, figs_correlation, figs_cluster, figs_prediction, figs_trend):
+        all_figs.update(figs)
+    return metrics, results_df, all_figs, model_acc
+
+
+def run_segment(segment, out_dir):
+    region, genre, purchase_filter = segment
+    genres = [genre] if genre else []
+    started = time.time()
+    rows = _shared["index"].select(region, genres, [], purchase_filter)
+    name = segment_name(region, genre, purchase_filter)
+    if len(rows) == 0:
+        return name, "empty", 0, time.time() - started
+
+    metrics, results_df, all_figs, model_acc = compute_report(
+        _shared["df"], _shared["cube"], rows, region, genres, [], purchase_filter,
+        moments=_shared["moments"], timeline=_shared["timeline"], retention=_shared["retention"])
+
+    path = os.path.join(out_dir, f"{name}.pdf")
+    tmp = f"{path}.tmp-{os.getpid()}"
+    try:
+        with open(tmp, "wb") as f:
+            export_full_report(metrics, results_df, all_figs, model_acc, list(all_figs), output=f)
+        os.replace(tmp, path)
+    except BaseException:
+        # a failed export leaves no partial file behind in the output directory
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    return name, "done", int(len(rows)), time.time() - started
+
+
+def build_grid(index, regions=None, genres=None, purchases=None):
+    regions = regions or index.values("Location")
+    genres = genres or index.values("GameGenre")
+    purchases = purchases or ["Paid players", "Not-paid players"]
+    return list(itertools.product(regions, genres, purchases))
+
+
+def _read_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(f"{path}.tmp", path)
+
+
+def run_batch(out_dir, segments, jobs=None, render_workers=0, resume=True):
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = _read_manifest(out_dir) if resume else {}
+
+    def finished(segment):
+        name = segment_name(*segment)
+        entry = manifest.get(name, {})
+        if entry.get("status") == "empty":
+            return True
+        return entry.get("status") == "done" and os.path.exists(os.path.join(out_dir, f"{name}.pdf"))
+
+    todo = [s for s in segments if not finished(s)]
+    print(f"{len(segments)} segments, {len(segments) - len(todo)} already done, {len(todo)} to run", flush=True)
+    if not todo:
+        return manifest
+
+    # fork shares the memory-mapped store with the workers; other platforms
+    # load it once per worker in the initializer
+    context = multiprocessing.get_context("fork" if sys.platform.startswith("linux") else None)
+    started = time.time()
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=context,
+                             initializer=_init_worker, initargs=(render_workers,)) as pool:
+        futures = {pool.submit(run_segment, segment, out_dir): segment for segment in todo}
+        for i, future in enumerate(as_completed(futures), 1):
+            segment = futures[future]
+            name = segment_name(*segment)
+            try:
+                name, status, n_rows, seconds = future.result()
+                manifest[name] = {"status": status, "rows": n_rows, "seconds": round(seconds, 2)}
+            except Exception as exc:
+                manifest[name] = {"status": "failed", "error": repr(exc)}
+            _write_manifest(out_dir, manifest)
+            elapsed = time.time() - started
+            eta = elapsed / i * (len(todo) - i)
+            print(f"[{i}/{len(todo)}] {name}: {manifest[name]['status']} "
+                  f"(elapsed {elapsed:.0f}s, eta {eta:.0f}s)", flush=True)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate one PDF report per player segment")
+    parser.add_argument("--out-dir", default="reports")
+    parser.add_argument("--regions", nargs="*", help="default: every Location")
+    parser.add_argument("--genres", nargs="*", help="default: every GameGenre")
+    parser.add_argument("--purchase", nargs="*", choices=list(PURCHASE_LABELS),
+                        help="default: Paid players and Not-paid players")
+    parser.add_argument("--jobs", type=int, default=None, help="segment worker processes")
+    parser.add_argument("--render-workers", type=int, default=0,
+                        help="chart renderer processes per worker (0 renders inline)")
+    parser.add_argument("--no-resume", action="store_true", help="recompute finished segments")
+    args = parser.parse_args(argv)
+
+    _load_shared()
+    segments = build_grid(_shared["index"], args.regions, args.genres, args.purchase)
+    manifest = run_batch(args.out_dir, segments, args.jobs, args.render_workers, resume=not args.no_resume)
+    failed = [name for name, entry in manifest.items() if entry.get("status") == "failed"]
+    if failed:
+        print(f"{len(failed)} segments failed: {', '.join(failed)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,326 @@
+# @Author : Yulia
+# @File   : benchmark.py
+# @Time   : 2026/10/18
+
+import argparse
+import copy
+import gc
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+# Benchmarks every stage of the dashboard on synthetic player tables with the
+# schema and category mix of gaming_data_cleaned.csv: loading (cold ingest and
+# warm open), derived artifacts, filtering, each render_*(render=False) and
+# the PDF export. Each step records the median wall time over --repeat runs
+# and the peak Python/numpy allocation of one extra traced run. Results are
+# written as JSON and compared against a baseline to flag regressions.
+#
+#   python benchmark.py --sizes 10k 1M 10M --out benchmark_results.json
+#   python benchmark.py --sizes 1M --baseline baseline.json
+
+SIZES = ["10k", "1M", "10M"]
+CHUNK_ROWS = 1_000_000
+TOLERANCE = 0.3
+# differences below these are noise, whatever the ratio
+MIN_SECONDS = 0.1
+MIN_MB = 16
+
+# category shares of the real dataset
+CATEGORIES = {
+    "Gender": {"Male": 0.598, "Female": 0.402},
+    "Location": {"USA": 0.4, "Europe": 0.3, "Asia": 0.202, "Other": 0.098},
+    "GameGenre": {"Sports": 0.201, "Action": 0.201, "Strategy": 0.2, "Simulation": 0.199, "RPG": 0.199},
+    "GameDifficulty": {"Easy": 0.5, "Medium": 0.3, "Hard": 0.2},
+}
+# inclusive integer ranges of the (uniform) numeric columns
+INT_RANGES = {
+    "Age": (15, 49),
+    "SessionsPerWeek": (0, 19),
+    "AvgSessionDurationMinutes": (10, 179),
+    "PlayerLevel": (1, 99),
+    "AchievementsUnlocked": (0, 49),
+}
+PAID_SHARE = 0.2
+# engagement follows weekly minutes played: bottom / top shares as in the data
+ENGAGEMENT_SHARES = (0.258, 0.484, 0.258)
+ENGAGEMENT_NOISE = 0.1
+
+RENDER_FILTER = ("Global", [], [], "All")
+FILTER_CASES = {
+    "filter_data (region)": ("USA", [], [], "All"),
+    "filter_data (region+genre+paid)": ("Europe", ["RPG", "Action"], [], "Paid players"),
+}
+
+
+def parse_size(text):
+    text = text.strip().lower().replace("_", "")
+    scale = {"k": 10 ** 3, "m": 10 ** 6}.get(text[-1], 1)
+    return int(float(text[:-1] if scale > 1 else text) * scale)
+
+
+def generate_players(n_rows, seed=0, start_id=9000):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({"PlayerID": np.arange(start_id, start_id + n_rows, dtype=np.int64)})
+    df["Age"] = rng.integers(*_bounds("Age"), n_rows)
+    for col in ("Gender", "Location", "GameGenre"):
+        df[col] = _draw(rng, CATEGORIES[col], n_rows)
+    df["PlayTimeHours"] = rng.uniform(0, 24, n_rows)
+    df["InGamePurchases"] = (rng.random(n_rows) < PAID_SHARE).astype(np.int64)
+    df["GameDifficulty"] = _draw(rng, CATEGORIES["GameDifficulty"], n_rows)
+    for col in ("SessionsPerWeek", "AvgSessionDurationMinutes", "PlayerLevel", "AchievementsUnlocked"):
+        df[col] = rng.integers(*_bounds(col), n_rows)
+
+    minutes = df["SessionsPerWeek"] * df["AvgSessionDurationMinutes"] + rng.random(n_rows)
+    low, high = np.quantile(minutes, [ENGAGEMENT_SHARES[0], 1 - ENGAGEMENT_SHARES[2]])
+    level = np.select([minutes < low, minutes > high], ["Low", "High"], "Medium").astype(object)
+    noisy = rng.random(n_rows) < ENGAGEMENT_NOISE
+    level[noisy] = rng.choice(["Low", "Medium", "High"], int(noisy.sum()), p=ENGAGEMENT_SHARES)
+    df["EngagementLevel"] = level
+    return df
+
+
+def _bounds(col):
+    lo, hi = INT_RANGES[col]
+    return lo, hi + 1
+
+
+def _draw(rng, shares, n_rows):
+    values = list(shares)
+    p = np.array([shares[v] for v in values])
+    return np.array(values, dtype=object)[rng.choice(len(values), n_rows, p=p / p.sum())]
+
+
+def write_dataset(directory, n_rows, seed=0):
+    # cleaned and Europe CSVs as data_clean.ipynb writes them, chunk by chunk
+    from data_loader import CLEANED_CSV, EUROPE_CSV
+
+    os.makedirs(directory, exist_ok=True)
+    cleaned, europe = os.path.join(directory, CLEANED_CSV), os.path.join(directory, EUROPE_CSV)
+    marker = os.path.join(directory, "generated.json")
+    spec = {"rows": n_rows, "seed": seed}
+    if os.path.exists(marker) and os.path.exists(cleaned):
+        with open(marker, encoding="utf-8") as f:
+            if json.load(f) == spec:
+                return
+    for start in range(0, n_rows, CHUNK_ROWS):
+        chunk = generate_players(min(CHUNK_ROWS, n_rows - start), seed=seed + start, start_id=9000 + start)
+        mode, header = ("w", True) if start == 0 else ("a", False)
+        chunk.to_csv(cleaned, mode=mode, header=header, index=False)
+        chunk[chunk["Location"] == "Europe"].to_csv(europe, mode=mode, header=header, index=False)
+    with open(marker, "w", encoding="utf-8") as f:
+        json.dump(spec, f)
+
+
+def measure(fn, repeat=3, setup=None, memory=True):
+    # median wall time of `repeat` runs, then one traced run for peak memory
+    runs, result = [], None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        gc.collect()
+        started = time.perf_counter()
+        result = fn()
+        runs.append(time.perf_counter() - started)
+    entry = {"seconds": statistics.median(runs), "runs": [round(r, 4) for r in runs]}
+    if memory:
+        if setup:
+            setup()
+        gc.collect()
+        tracemalloc.start()
+        try:
+            fn()
+            entry["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+        finally:
+            tracemalloc.stop()
+    return result, entry
+
+
+def _check_scratch(directory):
+    # the cold steps delete the store, model registries and image cache; they
+    # must live inside the benchmark directory, never the user's real ones
+    import chart_render
+    for name, path in (("GDA_STORE_DIR", chart_render.STORE_ROOT), ("GDA_IMAGE_CACHE_DIR", chart_render.IMAGE_CACHE_DIR)):
+        resolved = os.path.realpath(os.path.join(directory, path))
+        if os.path.commonpath([resolved, os.path.realpath(directory)]) != os.path.realpath(directory):
+            raise SystemExit(f"{name}={path} points outside the benchmark directory; "
+                             f"unset it before running the benchmark")
+
+
+def run_size(n_rows, work_dir, repeat=3, memory=True, skip=(), seed=0, log=print):
+    import cluster_engine
+    import data_loader
+    from model_registry import MODEL_DIR
+    from store import STORE_ROOT
+
+    directory = os.path.join(work_dir, f"players-{n_rows}")
+    _check_scratch(directory)
+    started = time.perf_counter()
+    write_dataset(directory, n_rows, seed)
+    log(f"[{n_rows:,} rows] data ready ({time.perf_counter() - started:.1f}s)")
+
+    cwd = os.getcwd()
+    os.chdir(directory)
+    results = {}
+
+    def step(name, fn, setup=None, runs=repeat):
+        if any(s in name for s in skip):
+            return None
+        try:
+            result, entry = measure(fn, runs, setup, memory)
+        except Exception as exc:
+            results[name] = {"error": repr(exc)}
+            log(f"  {name:<36} failed: {exc!r}")
+            return None
+        results[name] = entry
+        peak = f", peak {entry['peak_mb']:.0f} MB" if "peak_mb" in entry else ""
+        log(f"  {name:<36} {entry['seconds']:8.3f}s{peak}")
+        return result
+
+    def remove(path):
+        return lambda: shutil.rmtree(path, ignore_errors=True)
+
+    try:
+        step("load_data (cold)", data_loader.load_data, setup=remove(STORE_ROOT), runs=1)
+        df, _ = step("load_data (warm)", data_loader.load_data) or data_loader.load_data()
+
+        def artifacts():
+            return (data_loader.load_filter_index(df), data_loader.load_cube(df),
+                    data_loader.load_moments(df), data_loader.load_timeline(df))
+
+        artifact_dir = os.path.join(df.attrs["store_path"], "artifacts")
+        step("artifacts (cold)", artifacts, setup=remove(artifact_dir), runs=1)
+        index, cube, moments, timeline = artifacts()
+
+        for name, filters in FILTER_CASES.items():
+            step(name, lambda f=filters: data_loader.filter_data(df, *f, index=index))
+
+        from overview import render_overview
+        from retention import render_retention_funnel
+        from simulation_trend import render_trend
+        from correlation import render_correlation
+        from clustering import render_clustering
+        from prediction import render_prediction
+
+        rows = data_loader.select_rows(df, *RENDER_FILTER, index=index)
+        data = data_loader.take_rows(df, rows)
+        region = RENDER_FILTER[0]
+        metrics, figs = step("render_overview",
+                             lambda: render_overview(cube.query(*RENDER_FILTER), region, render=False)) or (None, {})
+        sections = [
+            step("render_retention_funnel",
+                 lambda: render_retention_funnel(cube.query(*RENDER_FILTER), render=False)),
+            step("render_trend", lambda: render_trend(data, render=False, timeline=timeline.query(*RENDER_FILTER))),
+            step("render_correlation",
+                 lambda: render_correlation(data, render=False, moments=moments.query(*RENDER_FILTER))),
+            # both registries would serve a trained model on every run after the first
+            step("render_clustering", lambda: render_clustering(data, render=False),
+                 setup=remove(cluster_engine.MODEL_DIR)),
+            step("render_prediction", lambda: render_prediction(data, render=False), setup=remove(MODEL_DIR)),
+        ]
+        results_df = sections[2][0] if sections[2] else None
+        model_acc = sections[4][0] if sections[4] else None
+
+        from figure_data import LazyFigures
+        all_figs = LazyFigures()
+        if metrics is not None:
+            all_figs.update(figs)
+        for section in sections:
+            if section:
+                all_figs.update(section[-1])
+        titles = list(all_figs)
+
+        def build_figures():
+            # copies carry the builders only, so every run builds the figures
+            fresh = copy.copy(all_figs)
+            return [fresh[t] for t in titles]
+
+        step("build figures", build_figures)
+
+        def export():
+            from report_export import export_full_report
+            return export_full_report(metrics, results_df, copy.copy(all_figs), model_acc, titles)
+
+        def clear_images():
+            # rasterized charts are cached by spec; every run has to render them
+            import chart_render
+            chart_render.image_cache().clear()
+            shutil.rmtree(chart_render.IMAGE_CACHE_DIR, ignore_errors=True)
+
+        step("export_full_report", export, setup=clear_images, runs=1)
+    finally:
+        os.chdir(cwd)
+    return results
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    # steps slower (or hungrier) than the baseline by more than the tolerance
+    regressions = []
+    for size, steps in results.items():
+        for name, entry in steps.items():
+            base = baseline.get(size, {}).get(name)
+            if not base or "error" in entry or "error" in base:
+                continue
+            for metric, floor in (("seconds", MIN_SECONDS), ("peak_mb", MIN_MB)):
+                if metric in entry and metric in base:
+                    old, new = base[metric], entry[metric]
+                    if new > old * (1 + tolerance) and new - old > floor:
+                        regressions.append((size, name, metric, old, new))
+    return regressions
+
+
+def _environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "numpy": np.__version__, "pandas": pd.__version__, "commit": commit,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark every dashboard stage on synthetic player tables")
+    parser.add_argument("--sizes", nargs="+", default=SIZES, help="row counts, e.g. 10k 1M 10M")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per step (median is kept)")
+    parser.add_argument("--work-dir", default=os.path.join(tempfile.gettempdir(), "gda-benchmark"),
+                        help="generated datasets are kept here and reused")
+    parser.add_argument("--out", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="allowed slowdown, 0.3 = 30%%")
+    parser.add_argument("--skip", nargs="*", default=[], help="skip steps whose name contains any of these")
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced peak-memory run")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    report = {"environment": _environment(), "results": {}}
+    for size in args.sizes:
+        n_rows = parse_size(size)
+        report["results"][str(n_rows)] = run_size(n_rows, args.work_dir, args.repeat, not args.no_memory,
+                                                  args.skip, args.seed)
+        # written after every size, so a long run leaves partial results
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+    print(f"results written to {args.out}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(report["results"], baseline, args.tolerance)
+        for size, name, metric, old, new in regressions:
+            print(f"REGRESSION {int(size):,} rows {name}: {metric} {old:.3f} -> {new:.3f} ({new / old - 1:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
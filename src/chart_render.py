@@ -0,0 +1,202 @@
+# @Author : Yulia
+# @File   : chart_render.py
+# @Time   : 2026/10/18
+
+import asyncio
+import atexit
+import hashlib
+import json
+import os
+import signal
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.util import Finalize
+
+import plotly.io as pio
+
+from instrument import count, span
+from pools import mp_context
+from result_cache import ResultCache
+from store import STORE_ROOT
+
+# Rasterizes Plotly figures to PNG in a pool of long-lived renderer processes
+# (each keeps one Kaleido browser alive). Images are cached by a hash of the
+# figure spec, so an unchanged chart is never rasterized twice.
+
+RENDER_WORKERS = int(os.environ.get("GDA_RENDER_WORKERS", min(4, os.cpu_count() or 1)))
+IMAGE_CACHE_MB = int(os.environ.get("GDA_IMAGE_CACHE_MB", "128"))
+IMAGE_CACHE_DIR = os.environ.get("GDA_IMAGE_CACHE_DIR", os.path.join(STORE_ROOT, "images"))
+# longest wait for one chart before the export fails instead of hanging
+RENDER_TIMEOUT = float(os.environ.get("GDA_RENDER_TIMEOUT", "120"))
+
+_image_cache = None
+_pool = None
+_started = None
+# (event loop, open browser) of a renderer process, or why it failed to start
+_renderer = None
+_pool_lock = threading.Lock()
+_inline_lock = threading.Lock()
+_inline_ready = False
+
+
+def _layout_size(fig, name):
+    layout = fig.get("layout", {})
+    return layout.get(name) or layout.get("template", {}).get("layout", {}).get(name)
+
+
+def _init_renderer(started=None):
+    # one browser per renderer process, opened through kaleido's public API
+    # and closed when the process exits; a failed start is kept and raised by
+    # every render instead of hanging it
+    global _renderer
+    if started is not None:
+        # the browser joins this process group, so a reset can kill both
+        if hasattr(os, "setpgrp"):
+            os.setpgrp()
+        started.put(os.getpid())
+    try:
+        import kaleido
+        browser = kaleido.Kaleido
+    except (ImportError, AttributeError):
+        # older kaleido releases start their own process per call
+        return
+    defaults = pio.defaults
+    options = {name: getattr(defaults, name) for name in ("plotlyjs", "mathjax", "headers") if getattr(defaults, name)}
+    try:
+        renderer = browser(n=1, timeout=RENDER_TIMEOUT, **options)
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(renderer.open())
+    except Exception as exc:
+        _renderer = exc
+        return
+    _renderer = loop, renderer
+    Finalize(None, _close_renderer, exitpriority=10)
+
+
+def _close_renderer():
+    loop, renderer = _renderer
+    loop.run_until_complete(renderer.close())
+
+
+def _render(spec, fmt, width, height):
+    if isinstance(_renderer, Exception):
+        raise RuntimeError(f"Kaleido could not start a browser: {_renderer}")
+    if _renderer is None:
+        return pio.to_image(json.loads(spec), format=fmt, width=width, height=height, validate=False)
+    fig = json.loads(spec)
+    defaults = pio.defaults
+    opts = {
+        "format": fmt,
+        "width": width or _layout_size(fig, "width") or defaults.default_width,
+        "height": height or _layout_size(fig, "height") or defaults.default_height,
+        "scale": defaults.default_scale,
+    }
+    loop, renderer = _renderer
+    return loop.run_until_complete(renderer.calc_fig(fig, opts=opts, topojson=defaults.topojson))
+
+
+def _get_pool():
+    global _pool, _started
+    with _pool_lock:
+        if _pool is None:
+            context = mp_context()
+            # workers report their pids, so a reset can kill a hung one
+            _started = context.SimpleQueue()
+            # export jobs run on the dashboard's threads, so no plain fork
+            _pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS, mp_context=context,
+                                        initializer=_init_renderer, initargs=(_started,))
+            atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+        return _pool
+
+
+def _reset_pool():
+    # shutdown alone leaves a hung worker, and its browser, running
+    global _pool
+    with _pool_lock:
+        pool, started, _pool = _pool, _started, None
+    if pool is None:
+        return
+    pool.shutdown(wait=False, cancel_futures=True)
+    while not started.empty():
+        pid = started.get()
+        try:
+            if hasattr(os, "killpg"):
+                os.killpg(pid, signal.SIGKILL)
+            else:
+                os.kill(pid, signal.SIGTERM)
+        except OSError:
+            pass
+
+
+def image_cache():
+    # built on first use, so importing this module (renderer processes, the
+    # benchmark before it changes directory) creates no cache directory
+    global _image_cache
+    with _pool_lock:
+        if _image_cache is None:
+            _image_cache = ResultCache(max_bytes=IMAGE_CACHE_MB << 20, persist_dir=IMAGE_CACHE_DIR)
+        return _image_cache
+
+
+def image_key(spec, fmt, width, height):
+    return hashlib.sha256(f"{fmt}:{width}x{height}:{spec}".encode("utf-8")).hexdigest()[:32]
+
+
+def _done(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def _render_inline(spec, fmt, width, height):
+    global _inline_ready
+    # one browser and event loop for the whole process
+    with _inline_lock:
+        if not _inline_ready:
+            _init_renderer()
+            _inline_ready = True
+        return _done(_render(spec, fmt, width, height))
+
+
+def _submit(spec, fmt, width, height):
+    # RENDER_WORKERS = 0 renders in the calling process, for callers that are
+    # already worker processes themselves
+    if RENDER_WORKERS <= 0:
+        return _render_inline(spec, fmt, width, height)
+    try:
+        return _get_pool().submit(_render, spec, fmt, width, height)
+    except (BrokenProcessPool, RuntimeError):
+        _reset_pool()
+        return _get_pool().submit(_render, spec, fmt, width, height)
+
+
+def render_images(figs, fmt="png", width=None, height=None):
+    # every uncached figure is submitted right away; the returned generator
+    # hands the images back in order as they are needed
+    cache = image_cache()
+    jobs = []
+    for title, fig in figs.items():
+        with span("figure to_json", title=title):
+            spec = fig.to_json()
+        key = image_key(spec, fmt, width, height)
+        cached = cache.get(key)
+        count("image cache hit" if cached is not None else "image cache miss")
+        future = _done(cached) if cached is not None else _submit(spec, fmt, width, height)
+        jobs.append((title, key, cached is None, future))
+    return _results(jobs, cache)
+
+
+def _results(jobs, cache):
+    for title, key, fresh, future in jobs:
+        # time spent waiting for the rasterizer pool (zero for cached images)
+        with span("rasterize", title=title, cached=not fresh):
+            try:
+                image = future.result(timeout=RENDER_TIMEOUT)
+            except TimeoutError:
+                # a stuck renderer would hold every later export too
+                _reset_pool()
+                raise RuntimeError(f"Rendering '{title}' did not finish within {RENDER_TIMEOUT:g}s") from None
+        if fresh:
+            cache.put(key, image)
+        yield title, image
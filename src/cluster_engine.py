@@ -0,0 +1,193 @@
+# @Author : Yulia
+# @File   : cluster_engine.py
+# @Time   : 2026/10/18
+
+import os
+import pickle
+import threading
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.metrics import silhouette_score
+
+from store import STORE_ROOT
+
+# Mini-batch KMeans trained chunk by chunk with partial_fit. k is picked by
+# silhouette on a sample (candidates fitted in parallel), fitted centroids are
+# persisted per segment so a repeated view only assigns labels, and a new
+# segment warm-starts from the most recent centroids for the same k.
+
+CLUSTER_FEATURES = ["Age", "SessionsPerWeek", "PlayerLevel"]
+K_RANGE = range(2, 9)
+CHUNK_ROWS = 8192
+EPOCHS = 3
+SILHOUETTE_SAMPLE = 5000
+MODEL_DIR = os.path.join(STORE_ROOT, "models", "clustering")
+# segment models beyond this are removed, least recently used first
+MAX_MODELS = int(os.environ.get("GDA_MAX_MODELS", "500"))
+LATEST_PREFIX = "latest-"
+
+# the warm-start table is shared by every fit of the process (dashboard jobs run on threads)
+_latest_lock = threading.Lock()
+
+
+class ClusterModel:
+    def __init__(self, features, mean, scale, centers, silhouette=None):
+        self.features = list(features)
+        self.mean = mean
+        self.scale = scale
+        self.centers = centers
+        self.silhouette = silhouette
+
+    @property
+    def k(self):
+        return len(self.centers)
+
+    def transform(self, X):
+        return (np.asarray(X, dtype=np.float64) - self.mean) / self.scale
+
+    def raw_centers(self):
+        return self.centers * self.scale + self.mean
+
+    def predict(self, X, chunk_rows=1 << 18):
+        labels = np.empty(len(X), dtype=np.int32)
+        sq_centers = (self.centers ** 2).sum(axis=1)
+        for start in range(0, len(X), chunk_rows):
+            Z = self.transform(X[start:start + chunk_rows])
+            # |z - c|^2 without the |z|^2 term, which does not change argmin
+            labels[start:start + chunk_rows] = np.argmin(sq_centers - 2 * Z @ self.centers.T, axis=1)
+        return labels
+
+
+def _scaler(X):
+    mean = X.mean(axis=0)
+    scale = X.std(axis=0)
+    scale[scale == 0] = 1.0
+    return mean, scale
+
+
+def _chunks(n_rows, chunk_rows, rng):
+    order = rng.permutation(n_rows)
+    for start in range(0, n_rows, chunk_rows):
+        yield np.sort(order[start:start + chunk_rows])
+
+
+def fit_minibatch(Z, k, init=None, random_state=42, chunk_rows=CHUNK_ROWS, epochs=EPOCHS):
+    # warm starts reuse the previous centroids, cold starts use k-means++
+    kmeans = MiniBatchKMeans(
+        n_clusters=k,
+        init=init if init is not None else "k-means++",
+        n_init=1 if init is not None else 3,
+        batch_size=chunk_rows,
+        random_state=random_state,
+    )
+    # small segments still get several mini-batch steps per epoch
+    chunk_rows = max(min(chunk_rows, len(Z) // 8), 32 * k)
+    rng = np.random.default_rng(random_state)
+    for _ in range(epochs):
+        for rows in _chunks(len(Z), chunk_rows, rng):
+            if len(rows) >= k:
+                kmeans.partial_fit(Z[rows])
+    return kmeans.cluster_centers_
+
+
+def _score(Z, centers, sample_rows, random_state):
+    rng = np.random.default_rng(random_state)
+    sample = Z if len(Z) <= sample_rows else Z[rng.choice(len(Z), sample_rows, replace=False)]
+    labels = np.argmin(((sample[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2), axis=1)
+    if len(np.unique(labels)) < 2:
+        return -1.0
+    return float(silhouette_score(sample, labels))
+
+
+def _fit_candidate(Z, k, init, random_state):
+    centers = fit_minibatch(Z, k, init=init, random_state=random_state)
+    return k, centers, _score(Z, centers, SILHOUETTE_SAMPLE, random_state)
+
+
+def _model_path(key):
+    return os.path.join(MODEL_DIR, f"{key}.pkl")
+
+
+def load_model(key):
+    path = _model_path(key)
+    try:
+        with open(path, "rb") as f:
+            model = pickle.load(f)
+    except Exception:
+        # missing, truncated, or pickled by code that has since changed: refitted
+        return None
+    try:
+        # the modification time orders models for _prune
+        os.utime(path)
+    except OSError:
+        pass
+    return model
+
+
+def save_model(key, model):
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    path = _model_path(key)
+    tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp, "wb") as f:
+        pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+    _prune()
+
+
+def _prune():
+    # the warm-start tables are few and always kept
+    entries = []
+    for name in os.listdir(MODEL_DIR):
+        if name.endswith(".pkl") and not name.startswith(LATEST_PREFIX):
+            path = os.path.join(MODEL_DIR, name)
+            try:
+                entries.append((os.stat(path).st_mtime, path))
+            except OSError:
+                continue
+    for _, path in sorted(entries)[:max(len(entries) - MAX_MODELS, 0)]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _warm_init(previous, k, mean, scale):
+    model = previous.get(k)
+    if model is None:
+        return None
+    # previous centroids live in the previous segment's scaled space
+    return (model.raw_centers() - mean) / scale
+
+
+def fit_clusters(X, features, n_clusters=None, key=None, random_state=42, n_jobs=-1):
+    if key is not None:
+        model = load_model(key)
+        if isinstance(model, ClusterModel) and model.features == list(features) and (n_clusters in (None, model.k)):
+            return model
+
+    X = np.asarray(X, dtype=np.float64)
+    mean, scale = _scaler(X)
+    Z = (X - mean) / scale
+
+    latest_key = LATEST_PREFIX + "-".join(features)
+    previous = load_model(latest_key) or {}
+    candidates = [n_clusters] if n_clusters else [k for k in K_RANGE if k < len(X)]
+    results = Parallel(n_jobs=n_jobs if len(candidates) > 1 else 1)(
+        delayed(_fit_candidate)(Z, k, _warm_init(previous, k, mean, scale), random_state)
+        for k in candidates
+    )
+    best_k = max(results, key=lambda r: r[2])[0]
+
+    fitted = {k: ClusterModel(features, mean, scale, centers, score) for k, centers, score in results}
+    model = fitted[best_k]
+    with _latest_lock:
+        # re-read so fits that finished meanwhile are kept
+        latest = load_model(latest_key) or {}
+        latest.update(fitted)
+        save_model(latest_key, latest)
+    if key is not None:
+        save_model(key, model)
+    return model
+
@@ -4,46 +4,60 @@
 
 import streamlit as st
 import plotly.express as px
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
+from cluster_engine import CLUSTER_FEATURES, fit_clusters
+from figure_data import LazyFigures, density_sample, sampled_title
+from instrument import span
+from result_cache import frame_fingerprint
 
 
-def render_clustering(filtered_data, render=True):
-    needed = ["Age", "SessionsPerWeek", "PlayerLevel"]
+def render_clustering(filtered_data, render=True, n_clusters=None):
+    needed = CLUSTER_FEATURES
     if not all(c in filtered_data.columns for c in needed):
         if render:
             st.warning("❌ Cluster analysis cannot be performed because the columns required for clustering are missing.")
-        return None, None
+        return None, LazyFigures()
 
     data_clu = filtered_data[needed].dropna()
     if len(data_clu) <= 10:
         if render:
             st.warning("⚠️ The amount of data is insufficient to perform cluster analysis.")
-        return None, None
+        return None, LazyFigures()
 
-    # Standardization + KMeans
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(data_clu)
-
-    kmeans = KMeans(n_clusters=3, random_state=42, n_init=10)
-    labels = kmeans.fit_predict(X_scaled)
+    # Mini-batch KMeans, k chosen by silhouette unless given; centroids are
+    # persisted per segment so a repeated view only assigns labels
+    X = data_clu.to_numpy(dtype="float64")
+    key = frame_fingerprint(data_clu, needed + [f"k={n_clusters}"])
+    with span("kmeans fit", rows=len(X)):
+        model = fit_clusters(X, needed, n_clusters=n_clusters, key=key)
+    with span("kmeans assign", rows=len(X)):
+        labels = model.predict(X)
 
     data_show = data_clu.copy()
     data_show["Cluster"] = labels
 
-    # 3D clustering results
-    fig_cluster = px.scatter_3d(
-        data_show, x="Age", y="SessionsPerWeek", z="PlayerLevel",
-        color="Cluster", title="Player Clustering (3D Results)"
-    )
+    # 3D clustering results (bounded, density-preserving within each cluster)
+    with span("figure data: clustering"):
+        points = density_sample(data_show, needed, by="Cluster")
+    figs = LazyFigures()
+    figs.add("Clustering Result", px.scatter_3d, points, x="Age", y="SessionsPerWeek", z="PlayerLevel",
+             color="Cluster",
+             title=sampled_title(f"Player Clustering (3D Results, k={model.k})", len(points), len(data_show)))
 
     # Cluster mean
     cluster_summary = data_show.groupby("Cluster").mean(numeric_only=True).round(2)
 
     if render:
-        st.subheader("🧩 Player Cluster Analysis (KMeans)")
-        st.plotly_chart(fig_cluster, use_container_width=True)
-        st.write("**📊 Average Value of Each Cluster:**")
-        st.dataframe(cluster_summary, use_container_width=True)
+        show_clustering(cluster_summary, figs)
+
+    return cluster_summary, figs
+
+
+def show_clustering(cluster_summary, figs):
+    if cluster_summary is None:
+        st.warning("⚠️ The amount of data is insufficient to perform cluster analysis.")
+        return
 
-    return fig_cluster, cluster_summary
+    st.subheader("🧩 Player Cluster Analysis (KMeans)")
+    st.plotly_chart(figs["Clustering Result"], use_container_width=True)
+    st.write("**📊 Average Value of Each Cluster:**")
+    st.dataframe(cluster_summary, use_container_width=True)
@@ -0,0 +1,95 @@
+# @Author : Yulia
+# @File   : comparison.py
+# @Time   : 2026/10/18
+
+import streamlit as st
+import numpy as np
+import plotly.express as px
+from figure_data import LazyFigures
+from segment_compare import compare_segments, pair_columns
+
+
+def render_comparison(df, index, cube, moments, segments, render=True, curves=None, models=True):
+    if len(segments) < 2:
+        if render:
+            st.warning("⚠️ The current filters leave fewer than two segments to compare.")
+        return None, LazyFigures()
+
+    result = compare_segments(df, index, cube, moments, segments, curves=curves, models=models)
+
+    # side-by-side tables: one column per segment
+    tables = {
+        "Overview": result["metrics"],
+        f"Retention ({result['retention_source']})": result["retention"].T,
+        "Funnel": result["funnels"].T,
+        "Correlations (Pearson r)": pair_columns(result["correlations"]),
+    }
+    if "models" in result:
+        tables["Models"] = result["models"]
+
+    # small multiples, one panel per metric or segment
+    figs = LazyFigures()
+    figs.add("Segment Metrics", _metric_figure, result["metrics"].T, "Overview by Segment")
+    if result["curves"] is not None:
+        figs.add("Segment Retention", _facets, px.line, result["curves"], x="Day", y="RetentionRate",
+                 facet_col="Segment", markers=True, title="N-day Retention by Segment")
+    else:
+        retention = result["retention"].rename_axis("Segment").reset_index().melt(
+            id_vars="Segment", var_name="Day", value_name="RetentionRate")
+        figs.add("Segment Retention", _facets, px.bar, retention, x="Day", y="RetentionRate",
+                 facet_col="Segment", title="Player Retention Rate by Segment")
+    funnels = result["funnels"].rename_axis("Segment").reset_index().melt(
+        id_vars="Segment", var_name="Stage", value_name="Players")
+    figs.add("Segment Funnels", _facets, px.funnel, funnels, x="Players", y="Stage", facet_col="Segment",
+             title="Funnel by Segment")
+    figs.add("Segment Correlations", _correlation_figure, result["correlations"])
+    if "models" in result:
+        figs.add("Segment Models", _metric_figure, result["models"].T[["Accuracy", "Silhouette"]],
+                 "Payer Model Accuracy and Cluster Silhouette by Segment")
+
+    if render:
+        show_comparison(tables, figs)
+
+    return tables, figs
+
+
+def _facets(plot, data, facet_col, title, **kwargs):
+    n = data[facet_col].nunique()
+    fig = plot(data, facet_col=facet_col, facet_col_wrap=min(n, 4), title=title, **kwargs)
+    # "Segment=USA" -> "USA"
+    fig.for_each_annotation(lambda a: a.update(text=a.text.split("=", 1)[-1]))
+    return fig
+
+
+def _metric_figure(table, title):
+    # each metric on its own axis, segments side by side
+    values = table.rename_axis("Segment").reset_index().melt(id_vars="Segment", var_name="Metric",
+                                                             value_name="Value")
+    fig = _facets(px.bar, values, x="Segment", y="Value", color="Segment", facet_col="Metric", title=title)
+    fig.update_yaxes(matches=None, showticklabels=True)
+    return fig
+
+
+def _correlation_figure(matrices):
+    labels = list(matrices)
+    columns = matrices[labels[0]].columns.tolist()
+    fig = px.imshow(np.stack([m.to_numpy() for m in matrices.values()]), x=columns, y=columns,
+                    facet_col=0, facet_col_wrap=min(len(labels), 4), zmin=-1, zmax=1,
+                    color_continuous_scale="RdBu_r", title="Correlation Heatmap by Segment (Pearson)")
+    for annotation, label in zip(fig.layout.annotations, labels):
+        annotation.update(text=label)
+    return fig
+
+
+def show_comparison(tables, figs):
+    if tables is None:
+        st.warning("⚠️ The current filters leave fewer than two segments to compare.")
+        return
+
+    st.subheader("🆚 Segment Comparison")
+    for name, table in tables.items():
+        st.markdown(f"**📊 {name}**")
+        st.dataframe(table.round(3), use_container_width=True)
+
+    for fig in figs.values():
+        st.plotly_chart(fig, use_container_width=True)
@@ -0,0 +1,110 @@
+# @Author : Yulia
+# @File   : corr_engine.py
+# @Time   : 2026/10/18
+
+import numpy as np
+import pandas as pd
+
+# All-pairs Pearson and Spearman correlations with p-values in one matrix
+# pass. Missing values are handled with pairwise masks, so every pair uses
+# exactly the rows where both columns are present (like DataFrame.corr).
+# scipy is imported on first use; numeric_columns is needed at start-up.
+
+
+def numeric_columns(df, exclude_ids=True):
+    cols = df.select_dtypes("number").columns.tolist()
+    if exclude_ids:
+        cols = [c for c in cols if not c.endswith("ID")]
+    return cols
+
+
+def _pairwise_pearson(X):
+    valid = ~np.isnan(X)
+    mask = valid.astype(np.float64)
+    # centre on the column means first to keep the raw-moment sums well conditioned
+    X0 = np.where(valid, X, 0.0)
+    X0 -= X0.sum(axis=0) / np.maximum(valid.sum(axis=0), 1)
+    X0[~valid] = 0.0
+
+    n = mask.T @ mask
+    sx = X0.T @ mask
+    sxx = (X0 * X0).T @ mask
+    sxy = X0.T @ X0
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = sxy - sx * sx.T / n
+        var_x = sxx - sx * sx / n
+        var_y = var_x.T
+        r = cov / np.sqrt(var_x * var_y)
+    r = np.clip(r, -1.0, 1.0)
+    np.fill_diagonal(r, np.where(np.diag(n) > 1, 1.0, np.nan))
+    return r, n
+
+
+def _p_values(r, n):
+    from scipy.special import stdtr
+
+    df = n - 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = r * np.sqrt(df / ((1.0 - r) * (1.0 + r)))
+        p = 2 * stdtr(df, -np.abs(t))
+    p = np.where(np.abs(r) >= 1.0, 0.0, p)
+    return np.where(df > 0, p, np.nan)
+
+
+def _rank_columns(X):
+    # average ranks per column, computed once; NaNs stay NaN
+    from scipy.stats import rankdata
+
+    return rankdata(X, axis=0, nan_policy="omit")
+
+
+def correlation_matrices(df, columns, pearson=None, ranks=None):
+    # pearson: optional precomputed (r, n), e.g. from incremental co-moments;
+    # ranks: optional precomputed _rank_columns of the same rows
+    X = df[columns].to_numpy(dtype=np.float64)
+    r_p, n = pearson if pearson is not None else _pairwise_pearson(X)
+
+    R = ranks if ranks is not None else _rank_columns(X)
+    r_s, _ = _pairwise_pearson(R)
+
+    # with missing values the ranks of a pair must be taken over the rows
+    # both columns share, so only those pairs are re-ranked
+    has_nan = np.isnan(X).any(axis=0)
+    if has_nan.any():
+        from scipy.stats import rankdata
+
+        for i in range(len(columns)):
+            for j in range(i + 1, len(columns)):
+                if not (has_nan[i] or has_nan[j]):
+                    continue
+                both = ~np.isnan(X[:, i]) & ~np.isnan(X[:, j])
+                pair = rankdata(X[both][:, [i, j]], axis=0)
+                r_s[i, j] = r_s[j, i] = _pairwise_pearson(pair)[0][0, 1]
+
+    def frame(values):
+        return pd.DataFrame(values, index=columns, columns=columns)
+
+    return {
+        "n": frame(n.astype(np.int64)),
+        "pearson": frame(r_p),
+        "pearson_p": frame(_p_values(r_p, n)),
+        "spearman": frame(r_s),
+        "spearman_p": frame(_p_values(r_s, n)),
+    }
+
+
+def pair_table(matrices, min_rows=5):
+    columns = matrices["pearson"].columns.tolist()
+    iu, ju = np.triu_indices(len(columns), k=1)
+    n = matrices["n"].to_numpy()[iu, ju]
+    table = pd.DataFrame({
+        "col1": [columns[i] for i in iu],
+        "col2": [columns[j] for j in ju],
+        "n": n,
+        "pearson": matrices["pearson"].to_numpy()[iu, ju],
+        "pearson_p": matrices["pearson_p"].to_numpy()[iu, ju],
+        "spearman": matrices["spearman"].to_numpy()[iu, ju],
+        "spearman_p": matrices["spearman_p"].to_numpy()[iu, ju],
+    })
+    return table[table["n"] >= min_rows].reset_index(drop=True)
@@ -5,84 +5,126 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from scipy.stats import pearsonr, spearmanr
+from corr_engine import numeric_columns, correlation_matrices, pair_table
+from figure_data import LazyFigures, density_sample, sampled_title, box_stats, box_figure
+from instrument import span
 
 
-def render_correlation(filtered_data, render=True):
-    numeric_cols = ["Age", "SessionsPerWeek", "PlayerLevel", "InGamePurchases"]
-    if not all(col in filtered_data.columns for col in numeric_cols):
+def render_correlation(filtered_data, render=True, moments=None, robust=False):
+    numeric_cols = numeric_columns(filtered_data)
+    if len(numeric_cols) < 2:
         if render:
             st.warning("⚠️ The current data is missing the necessary numeric columns to calculate correlations.")
-        return None, None, None, None
-
-    # calculate Pearson & Spearman
-    results = []
-    for i in range(len(numeric_cols)):
-        for j in range(i + 1, len(numeric_cols)):
-            col1, col2 = numeric_cols[i], numeric_cols[j]
-            try:
-                series = filtered_data[[col1, col2]].dropna()
-                if len(series) < 5:
-                    continue
-                r_p, p_p = pearsonr(series[col1], series[col2])
-                r_s, p_s = spearmanr(series[col1], series[col2])
-                results.append({
-                    "Variable Pairs": f"{col1} vs {col2}",
-                    "Pearson r": round(r_p, 3),
-                    "Pearson p": round(p_p, 4),
-                    "Spearman ρ": round(r_s, 3),
-                    "Spearman p": round(p_s, 4),
-                    "Significant?": "✅ YES" if (p_p < 0.05 or p_s < 0.05) else "❌ NO"
-                })
-            except Exception:
-                continue
-
-    if len(results) == 0:
+        return None, LazyFigures()
+
+    # calculate Pearson & Spearman for every pair in one matrix pass; Pearson
+    # comes from the maintained co-moments of the filtered cells when given
+    pearson = moments.pearson(numeric_cols) if moments is not None else None
+    with span("correlation matrices", rows=len(filtered_data), columns=len(numeric_cols),
+              pearson="co-moments" if pearson is not None else "rows"):
+        matrices = correlation_matrices(filtered_data, numeric_cols, pearson=pearson)
+    pairs = pair_table(matrices, min_rows=5)
+
+    if len(pairs) == 0:
         if render:
             st.info("Insufficient data to calculate correlations.")
-        return None, None, None, None
+        return None, LazyFigures()
+
+    significant = (pairs["pearson_p"] < 0.05) | (pairs["spearman_p"] < 0.05)
+    results_df = pd.DataFrame({
+        "Variable Pairs": pairs["col1"] + " vs " + pairs["col2"],
+        "Pearson r": pairs["pearson"].round(3),
+        "Pearson p": pairs["pearson_p"].round(4),
+        "Spearman ρ": pairs["spearman"].round(3),
+        "Spearman p": pairs["spearman_p"].round(4),
+    })
+
+    # robust mode: bootstrap intervals, permutation p-values and significance
+    # after Benjamini-Hochberg correction over all pairs
+    intervals = None
+    if robust:
+        from robust_stats import robust_correlations
+
+        with span("robust statistics", rows=len(filtered_data), pairs=len(pairs)) as s:
+            intervals = robust_correlations(filtered_data, numeric_cols, matrices=matrices)
+            s.set(resamples=int(intervals["resamples"].max()), permutations=int(intervals["permutations"].max()))
+        for name, label in (("pearson", "Pearson"), ("spearman", "Spearman")):
+            results_df[f"{label} 95% CI"] = [f"[{lo:.3f}, {hi:.3f}]"
+                                             for lo, hi in zip(intervals[f"{name}_lo"], intervals[f"{name}_hi"])]
+            results_df[f"{label} q (BH)"] = intervals[f"{name}_q"].round(4)
+        significant = intervals["significant"]
+    results_df["Significant?"] = significant.map({True: "✅ YES", False: "❌ NO"})
 
-    results_df = pd.DataFrame(results).reset_index(drop=True)
+    # Heatmap (reuses the Pearson matrix)
+    figs = LazyFigures()
+    figs.add("Correlation Heatmap", px.imshow, matrices["pearson"], text_auto=".2f",
+             color_continuous_scale="RdBu_r", title="Numerical Variable Correlation Heatmap (Pearson)")
+    if intervals is not None:
+        figs.add("Correlation Confidence Intervals", _interval_figure, intervals)
 
-    # highlight
-    def highlight_sig(val):
-        return "background-color: lightgreen" if val == "✅ YES" else "background-color: lightcoral"
+    # Visualization: Scatter & Boxplot (bounded payload: sampled points, box stats)
+    if all(c in filtered_data.columns for c in ["Age", "SessionsPerWeek", "PlayerLevel", "InGamePurchases"]):
+        hover = ["GameGenre"] if "GameGenre" in filtered_data.columns else []
+        with span("figure data: scatter sample"):
+            points = density_sample(filtered_data[["Age", "SessionsPerWeek", "PlayerLevel", "InGamePurchases"] + hover],
+                                    ["Age", "SessionsPerWeek"], by="InGamePurchases")
+        title = sampled_title("Age vs. Sessions Per Week (By Paid/Not-paid)", len(points), len(filtered_data))
+        figs.add("Correlation Scatter", _scatter_figure, points, hover, title)
+
+    if "GameGenre" in filtered_data.columns:
+        with span("figure data: box stats"):
+            stats, outliers = box_stats(filtered_data, "GameGenre", "SessionsPerWeek")
+        figs.add("Correlation Boxplot", box_figure, stats, outliers, "GameGenre", "SessionsPerWeek",
+                 "Sessions Distribution by Game Type")
 
     if render:
-        st.subheader("🔗 Correlation Analysis (Pearson & Spearman)")
+        show_correlation(results_df, figs)
+
+    return results_df, figs
+
+
+def _scatter_figure(points, hover, title):
+    return px.scatter(
+        points,
+        x="Age", y="SessionsPerWeek",
+        color=points["InGamePurchases"].map({1: "Paid", 0: "Not-paid"}),
+        size="PlayerLevel",
+        hover_data=hover or None,
+        title=title
+    )
+
+
+def _interval_figure(intervals):
+    labels = intervals["col1"] + " vs " + intervals["col2"]
+    points = pd.concat([
+        pd.DataFrame({"Variable Pairs": labels, "Method": label, "r": intervals[name],
+                      "low": intervals[name] - intervals[f"{name}_lo"],
+                      "high": intervals[f"{name}_hi"] - intervals[name]})
+        for name, label in (("pearson", "Pearson"), ("spearman", "Spearman"))
+    ])
+    fig = px.scatter(points, x="r", y="Variable Pairs", color="Method", error_x="high", error_x_minus="low",
+                     title="Bootstrap 95% Confidence Intervals")
+    fig.add_vline(x=0, line_dash="dot", line_color="gray")
+    return fig
+
+
+# highlight
+def highlight_sig(val):
+    return "background-color: lightgreen" if val == "✅ YES" else "background-color: lightcoral"
+
+
+def show_correlation(results_df, figs):
+    if results_df is None:
+        st.info("Insufficient data to calculate correlations.")
+        return
+
+    st.subheader("🔗 Correlation Analysis (Pearson & Spearman)")
+    if "Pearson q (BH)" in results_df.columns:
+        st.markdown("**📊 Correlation test results** (✅ when at least one method stays significant after "
+                    "Benjamini-Hochberg correction; intervals from the bootstrap)")
+    else:
         st.markdown("**📊 Correlation test results** (at least one significant method is marked as ✅)")
-        st.write(results_df.style.applymap(highlight_sig, subset=["Significant?"]))
-
-        # Heatmap
-        corr_matrix = filtered_data[numeric_cols].corr()
-        fig_corr = px.imshow(
-            corr_matrix, text_auto=True, color_continuous_scale="RdBu_r",
-            title="Numerical Variable Correlation Heatmap (Pearson)"
-        )
-        st.plotly_chart(fig_corr, use_container_width=True)
-
-        # Visualization: Scatter & Boxplot
-        fig_scatter, fig_box = None, None
-        if "Age" in filtered_data.columns and "SessionsPerWeek" in filtered_data.columns:
-            fig_scatter = px.scatter(
-                filtered_data,
-                x="Age", y="SessionsPerWeek",
-                color=filtered_data["InGamePurchases"].map({1: "Paid", 0: "Not-paid"}),
-                size="PlayerLevel",
-                hover_data=["GameGenre"] if "GameGenre" in filtered_data.columns else None,
-                title="Age vs. Sessions Per Week (By Paid/Not-paid)"
-            )
-            st.plotly_chart(fig_scatter, use_container_width=True)
-
-        if "GameGenre" in filtered_data.columns:
-            fig_box = px.box(
-                filtered_data,
-                x="GameGenre", y="SessionsPerWeek",
-                color="GameGenre",
-                title="Sessions Distribution by Game Type"
-            )
-            st.plotly_chart(fig_box, use_container_width=True)
-
-        return results_df, fig_corr, fig_scatter, fig_box
-
-    return results_df, None, None, None
+    st.write(results_df.style.map(highlight_sig, subset=["Significant?"]))
+
+    for fig in figs.values():
+        st.plotly_chart(fig, use_container_width=True)
@@ -0,0 +1,151 @@
+# @Author : Yulia
+# @File   : cube.py
+# @Time   : 2026/10/18
+
+import numpy as np
+import pandas as pd
+
+# Pre-aggregated cube keyed by the filter/engagement dimensions. Every cell
+# holds additive statistics (count, sum, sum of squares) and per-value
+# histograms, so any sidebar filter combination is answered by summing cells.
+
+CUBE_KEYS = ["Location", "GameGenre", "Gender", "InGamePurchases", "EngagementLevel"]
+HIST_COLS = ["Age", "SessionsPerWeek", "PlayerLevel"]
+
+CHUNK_ROWS = 1 << 20
+
+
+def _aggregate(chunk, keys, stat_cols):
+    by = [chunk[k] for k in keys]
+    grouped = chunk.groupby(by, observed=True, dropna=False)
+    table = grouped.size().to_frame("count")
+
+    hists = {}
+    for col in stat_cols:
+        x = chunk[col].astype("float64")
+        table[f"sum_{col}"] = x.groupby(by, observed=True, dropna=False).sum()
+        table[f"sumsq_{col}"] = (x * x).groupby(by, observed=True, dropna=False).sum()
+        hists[col] = chunk.groupby(by + [chunk[col]], observed=True).size().unstack(col, fill_value=0)
+    return table, hists
+
+
+def cell_mask(index, selected_region, genres, genders, purchase_filter):
+    # sidebar filters evaluated on the key levels of any cell-keyed table
+    level = index.get_level_values
+    mask = np.ones(len(index), dtype=bool)
+    if selected_region != "Global":
+        mask &= level("Location") == selected_region
+    if genres:
+        mask &= level("GameGenre").isin(genres)
+    if genders:
+        mask &= level("Gender").isin(genders)
+    if purchase_filter == "Paid players":
+        mask &= level("InGamePurchases") == 1
+    elif purchase_filter == "Not-paid players":
+        mask &= level("InGamePurchases") == 0
+    return mask
+
+
+def cell_codes(df, keys):
+    # group number per row plus the key tuple of every group
+    if not keys:
+        return np.zeros(len(df), dtype=np.int64), [()]
+    grouped = df.groupby([df[k] for k in keys], observed=True, dropna=False)
+    index = grouped.size().index
+    cells = [tuple(_plain(v) for v in (cell if isinstance(cell, tuple) else (cell,))) for cell in index]
+    return grouped.ngroup().to_numpy(), cells
+
+
+def _plain(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def cell_index(cells, keys):
+    # key tuples from cell_codes() as an index cell_mask() can filter
+    return pd.MultiIndex.from_tuples(cells, names=keys) if cells else pd.MultiIndex.from_tuples([], names=keys)
+
+
+class AggregateCube:
+    def __init__(self, table, hists):
+        self.table = table
+        self.hists = {col: hist.reindex(table.index, fill_value=0) for col, hist in hists.items()}
+
+    @classmethod
+    def from_frame(cls, df, keys=CUBE_KEYS, hist_cols=HIST_COLS):
+        keys = [k for k in keys if k in df.columns]
+        stat_cols = [c for c in hist_cols if c in df.columns]
+        cube = None
+        for start in range(0, max(len(df), 1), CHUNK_ROWS):
+            part = cls(*_aggregate(df.iloc[start:start + CHUNK_ROWS], keys, stat_cols))
+            cube = part if cube is None else cube.merge(part)
+        return cube
+
+    def merge(self, other):
+        table = self.table.add(other.table, fill_value=0)
+        table["count"] = table["count"].astype("int64")
+        hists = {
+            col: self.hists[col].add(other.hists[col], fill_value=0).fillna(0).astype("int64")
+            for col in self.hists
+        }
+        return AggregateCube(table, hists)
+
+    def extend(self, tail):
+        # sums of the integer-valued stat columns stay exact in float64, so
+        # merging a tail cube gives the same cells as a full rebuild
+        if len(tail) == 0:
+            return self
+        return self.merge(AggregateCube.from_frame(tail))
+
+    @property
+    def keys(self):
+        return list(self.table.index.names)
+
+    def _level(self, key):
+        return self.table.index.get_level_values(key)
+
+    def query(self, selected_region, genres, genders, purchase_filter):
+        mask = cell_mask(self.table.index, selected_region, genres, genders, purchase_filter)
+        return AggregateCube(self.table[mask], {col: hist[mask] for col, hist in self.hists.items()})
+
+    def __len__(self):
+        return int(self.table["count"].sum())
+
+    def sum(self, col):
+        if col in self.keys:
+            return float((np.asarray(self._level(col), dtype="float64") * self.table["count"]).sum())
+        return float(self.table[f"sum_{col}"].sum())
+
+    def mean(self, col):
+        n = len(self)
+        return self.sum(col) / n if n else float("nan")
+
+    def std(self, col):
+        n = len(self)
+        if n < 2:
+            return float("nan")
+        total = self.sum(col)
+        var = (self.table[f"sumsq_{col}"].sum() - total * total / n) / (n - 1)
+        return float(np.sqrt(max(var, 0.0)))
+
+    def counts(self, by):
+        counts = self.table["count"].groupby(level=by, observed=True).sum()
+        return counts[counts > 0]
+
+    def share(self, col, value):
+        n = len(self)
+        return self.counts(col).get(value, 0) / n if n else 0
+
+    def histogram(self, col, by=None):
+        hist = self.hists[col]
+        if by is None:
+            return hist.sum()
+        return hist.groupby(level=by, observed=True).sum()
+
+    def count_at_least(self, col, threshold):
+        hist = self.histogram(col)
+        return int(hist[hist.index >= threshold].sum())
+
+
+def as_cube(data):
+    # modules accept either raw rows or an already filtered cube
+    return data if isinstance(data, AggregateCube) else AggregateCube.from_frame(data)
@@ -2,28 +2,80 @@
 # @File   : data_loader.py
 # @Time   : 2025/9/1 22:33
 
-import pandas as pd
+import os
+
+from store import load_store, cached_artifact, save_artifact, source_signature
+from filter_index import FilterIndex
+from cube import AggregateCube
+from incremental import CoMoments
+from trend_engine import Timeline
+from retention_engine import EVENTS_PATH, RetentionCurves
+
+CLEANED_CSV = "gaming_data_cleaned.csv"
+EUROPE_CSV = "gaming_data_europe.csv"
+
+# name -> (build from a frame, extend with appended rows)
+ARTIFACTS = {
+    "filter_index": (FilterIndex.build, FilterIndex.extend),
+    "cube": (AggregateCube.from_frame, AggregateCube.extend),
+    "moments": (CoMoments.from_frame, CoMoments.extend),
+    "timeline": (Timeline.from_frame, Timeline.extend),
+}
 
 def load_data():
-    df = pd.read_csv("gaming_data_cleaned.csv")
-    df_europe = pd.read_csv("gaming_data_europe.csv")
+    # the CSVs are ingested into a memory-mapped columnar store once and
+    # re-ingested only when the source file changes
+    df = load_store(CLEANED_CSV)
+    df_europe = load_store(EUROPE_CSV)
     return df, df_europe
 
-def filter_data(df, selected_region, genres, genders, purchase_filter):
-    if selected_region == "Global":
-        filtered_data = df.copy()
-    else:
-        filtered_data = df[df['Location'] == selected_region].copy()
+def load_artifact(df, name):
+    # built once per store version; after an append only the new rows are folded in
+    build, extend = ARTIFACTS[name]
+    return cached_artifact(df, name, build, extend)
+
+def load_filter_index(df):
+    # bitmaps are built once per store version and reused across reruns
+    return load_artifact(df, "filter_index")
+
+def load_cube(df):
+    # additive aggregates behind the overview and retention modules
+    return load_artifact(df, "cube")
+
+def load_moments(df):
+    # exact Pearson co-moments per cube cell for the correlation module
+    return load_artifact(df, "moments")
+
+def load_timeline(df):
+    # daily join / payer / session rollups (and cohorts) for the trend module
+    return load_artifact(df, "timeline")
 
-    if genres:
-        filtered_data = filtered_data[filtered_data["GameGenre"].isin(genres)].copy()
+def load_retention(df, events_path=EVENTS_PATH, jobs=None):
+    # retention cohorts from the session event log, None when there is none;
+    # rebuilt when the store or the event file changes
+    if not events_path or not os.path.exists(events_path):
+        return None
+    def build(frame):
+        return RetentionCurves.from_events(events_path, frame, jobs=jobs)
+    curves = cached_artifact(df, "retention", build)
+    if curves.signature != source_signature(events_path):
+        curves = build(df)
+        if df.attrs.get("store_path") and len(df) == df.attrs.get("store_rows"):
+            save_artifact(df.attrs["store_path"], "retention", curves)
+    return curves
 
-    if genders:
-        filtered_data = filtered_data[filtered_data["Gender"].isin(genders)].copy()
+def select_rows(df, selected_region, genres, genders, purchase_filter, index=None):
+    if index is None:
+        index = load_filter_index(df)
+    return index.select(selected_region, genres, genders, purchase_filter)
 
-    if purchase_filter == "Paid players":
-        filtered_data = filtered_data[filtered_data["InGamePurchases"] == 1].copy()
-    elif purchase_filter == "Not-paid players":
-        filtered_data = filtered_data[filtered_data["InGamePurchases"] == 0].copy()
+def take_rows(df, rows, columns=None):
+    # materialize only the columns a consumer actually needs
+    frame = df if columns is None else df[columns]
+    if len(rows) == len(frame):
+        return frame
+    return frame.take(rows)
 
-    return filtered_data
+def filter_data(df, selected_region, genres, genders, purchase_filter, index=None):
+    rows = select_rows(df, selected_region, genres, genders, purchase_filter, index)
+    return take_rows(df, rows)
@@ -0,0 +1,143 @@
+# @Author : Yulia
+# @File   : figure_data.py
+# @Time   : 2026/10/18
+
+import os
+from collections.abc import Mapping
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+from instrument import span
+
+# Keeps figure payloads bounded whatever the row count. Scatters get a
+# density-preserving sample (every occupied grid cell keeps at least one
+# point, dense cells keep a share proportional to their size) and box plots
+# are drawn from five-number summaries computed here instead of raw points.
+# Modules hand figures out as LazyFigures: the (small) figure data is ready,
+# the Plotly objects are only built when a chart is shown or exported.
+
+MAX_POINTS = int(os.environ.get("GDA_FIGURE_MAX_POINTS", "5000"))
+GRID_BINS = 64
+
+
+class LazyFigures(Mapping):
+    # title -> figure, each built on first access and then kept
+    def __init__(self):
+        self._builders = {}
+        self._built = {}
+
+    def add(self, name, build, /, *args, **kwargs):
+        # positional-only, so builders can still take a title= keyword
+        self._builders[name] = partial(build, *args, **kwargs)
+        self._built.pop(name, None)
+
+    def update(self, other):
+        for title in other:
+            self._builders[title] = other._builders[title]
+            if title in other._built:
+                self._built[title] = other._built[title]
+
+    def __getitem__(self, title):
+        if title not in self._built:
+            with span("build figure", title=title):
+                self._built[title] = self._builders[title]()
+        return self._built[title]
+
+    def __iter__(self):
+        return iter(self._builders)
+
+    def __len__(self):
+        return len(self._builders)
+
+    def __getstate__(self):
+        # cached and persisted results keep the builders, not the figures
+        return {"_builders": self._builders, "_built": {}}
+
+
+def _grid_cells(df, columns, by, bins):
+    cell = np.zeros(len(df), dtype=np.int64)
+    for col in columns:
+        values = df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+        lo, hi = np.nanmin(values), np.nanmax(values)
+        scaled = (values - lo) / (hi - lo) * bins if hi > lo else np.zeros(len(values))
+        # NaNs get a bin of their own
+        binned = np.where(np.isnan(scaled), bins, np.clip(np.nan_to_num(scaled), 0, bins - 1)).astype(np.int64)
+        cell = cell * (bins + 1) + binned
+    if by is not None:
+        codes, uniques = pd.factorize(df[by], use_na_sentinel=False)
+        cell = cell * len(uniques) + codes
+    return np.unique(cell, return_inverse=True, return_counts=True)[1:]
+
+
+def density_sample(df, columns, max_points=MAX_POINTS, by=None, bins=GRID_BINS, random_state=42):
+    if len(df) <= max_points:
+        return df
+    # coarsen the grid until the one-point-per-cell floor is a small share of
+    # the budget, otherwise sparse regions would be over-represented
+    inverse, counts = _grid_cells(df, columns, by, bins)
+    while len(counts) > max_points // 10 and bins > 4:
+        bins //= 2
+        inverse, counts = _grid_cells(df, columns, by, bins)
+
+    # proportional quotas (largest remainder), at least one point per cell
+    exact = counts * (max_points / len(df))
+    quota = np.maximum(np.floor(exact).astype(np.int64), 1)
+    spare = max_points - int(quota.sum())
+    if spare > 0:
+        quota[np.argsort(quota - exact, kind="stable")[:spare]] += 1
+    quota = np.minimum(quota, counts)
+
+    rng = np.random.default_rng(random_state)
+    order = np.lexsort((rng.random(len(df)), inverse))
+    starts = np.r_[0, np.cumsum(counts)[:-1]]
+    rank = np.arange(len(df)) - starts[inverse[order]]
+    rows = order[rank < quota[inverse[order]]]
+    if len(rows) > max_points:
+        rows = rng.choice(rows, max_points, replace=False)
+    return df.iloc[np.sort(rows)]
+
+
+def sampled_title(title, shown, total):
+    return title if shown == total else f"{title} ({shown:,} of {total:,} points)"
+
+
+def box_stats(df, x, y, max_points=MAX_POINTS):
+    # Tukey boxes: quartiles, whiskers at the furthest points within 1.5 IQR
+    data = df[[x, y]].dropna()
+    grouped = data.groupby(x, observed=True)[y]
+    stats = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+    stats.columns = ["q1", "median", "q3"]
+    iqr = stats["q3"] - stats["q1"]
+    low = data[x].map(stats["q1"] - 1.5 * iqr).astype("float64")
+    high = data[x].map(stats["q3"] + 1.5 * iqr).astype("float64")
+    inside = (data[y] >= low) & (data[y] <= high)
+    stats["lowerfence"] = data[y][inside].groupby(data[x][inside], observed=True).min()
+    stats["upperfence"] = data[y][inside].groupby(data[x][inside], observed=True).max()
+    stats["mean"] = grouped.mean()
+    stats["count"] = grouped.size()
+    return stats, density_sample(data[~inside], [y], max_points, by=x)
+
+
+def box_figure(stats, outliers, x, y, title):
+    colors = px.colors.qualitative.Plotly
+    fig = go.Figure()
+    for i, (group, row) in enumerate(stats.iterrows()):
+        color = colors[i % len(colors)]
+        name = str(group)
+        fig.add_trace(go.Box(
+            x=[name], q1=[row["q1"]], median=[row["median"]], q3=[row["q3"]],
+            lowerfence=[row["lowerfence"]], upperfence=[row["upperfence"]], mean=[row["mean"]],
+            name=name, legendgroup=name, marker_color=color,
+        ))
+        points = outliers.loc[outliers[x] == group, y]
+        if len(points):
+            fig.add_trace(go.Scatter(
+                x=[name] * len(points), y=points.to_numpy(), mode="markers", name=name,
+                legendgroup=name, showlegend=False, marker=dict(color=color, size=4),
+            ))
+    fig.update_layout(title=title, xaxis_title=x, yaxis_title=y, legend_title_text=x)
+    return fig
@@ -0,0 +1,200 @@
+# @Author : Yulia
+# @File   : filter_index.py
+# @Time   : 2026/10/18
+
+import os
+
+import numpy as np
+import pandas as pd
+
+# One packed bitmap (1 bit per row) for every value of the sidebar filter
+# columns. A filter combination is answered with bitwise OR inside a column
+# and AND across columns, which yields row ids without copying the frame.
+# The streaming ingest writes the bitmaps chunk by chunk to one file per value
+# next to the store, and loading maps those files instead of unpickling them.
+
+INDEX_COLUMNS = ["Location", "GameGenre", "Gender", "InGamePurchases"]
+
+# multiple of 8 so packed chunks can be concatenated byte-aligned
+CHUNK_ROWS = 1 << 20
+BITMAP_DIR = "filter_index"
+
+
+def _column_codes(series):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return np.asarray(series.cat.codes), [_key(c) for c in series.cat.categories]
+    values = series.to_numpy()
+    uniques, codes = np.unique(values, return_inverse=True)
+    return codes, [_key(v) for v in uniques]
+
+
+def _key(value):
+    # numpy scalars and python scalars must hit the same dict entry
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _append_bits(packed, n_rows, bits):
+    # re-pack only the trailing partial byte together with the new rows
+    used = n_rows % 8
+    if used == 0:
+        return np.concatenate([packed, np.packbits(bits)])
+    head = np.unpackbits(packed[-1:])[:used].astype(bool)
+    return np.concatenate([packed[:-1], np.packbits(np.concatenate([head, bits]))])
+
+
+class BitmapWriter:
+    # Appends each chunk's bits to one file per (column, value). A file always
+    # holds ceil(n_rows / 8) bytes: the trailing partial byte is rewritten in
+    # place by the next chunk, so files only grow and mapped readers stay valid.
+
+    def __init__(self, directory, n_rows=0, files=None, columns=INDEX_COLUMNS):
+        # directory: the artifact directory; file names are relative to it
+        self.directory = directory
+        self.n_rows = n_rows
+        self.columns = list(files) if files is not None else None
+        self.wanted = columns
+        self.files = {col: dict(values) for col, values in (files or {}).items()}
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _new_file(self, col, value):
+        name = os.path.join(BITMAP_DIR, col, f"{len(self.files[col])}.bits")
+        os.makedirs(os.path.dirname(self._path(name)), exist_ok=True)
+        with open(self._path(name), "wb") as f:
+            # no earlier row has this value
+            f.truncate((self.n_rows + 7) // 8)
+        self.files[col][value] = name
+        return name
+
+    def append(self, chunk):
+        if self.columns is None:
+            self.columns = [col for col in self.wanted if col in chunk.columns]
+            self.files = {col: {} for col in self.columns}
+        if len(chunk) == 0:
+            return
+        offset, used = divmod(self.n_rows, 8)
+        for col in self.columns:
+            codes, values = _column_codes(chunk[col])
+            positions = {value: k for k, value in enumerate(values)}
+            for value in positions:
+                if value not in self.files[col]:
+                    self._new_file(col, value)
+            for value, name in self.files[col].items():
+                bits = codes == positions[value] if value in positions else np.zeros(len(chunk), dtype=bool)
+                with open(self._path(name), "r+b") as f:
+                    if used:
+                        f.seek(offset)
+                        head = np.unpackbits(np.frombuffer(f.read(1), dtype=np.uint8))[:used].astype(bool)
+                        bits = np.concatenate([head, bits])
+                    f.seek(offset)
+                    f.write(np.packbits(bits).tobytes())
+        self.n_rows += len(chunk)
+
+    def finish(self):
+        # values in sorted order, like build()
+        index = FilterIndex(self.n_rows, None, {col: dict(sorted(values.items())) for col, values in self.files.items()})
+        index.attach(self.directory)
+        return index
+
+
+class FilterIndex:
+    def __init__(self, n_rows, bitmaps, files=None):
+        self.n_rows = n_rows
+        self.bitmaps = bitmaps
+        # col -> {value: bitmap file} when the bitmaps live in files
+        self.files = files
+        self.directory = None
+
+    def attach(self, directory):
+        # maps file-backed bitmaps from the artifact directory
+        if self.files is None:
+            return
+        n_bytes = (self.n_rows + 7) // 8
+        self.directory = directory
+        self.bitmaps = {
+            col: {value: np.memmap(os.path.join(directory, name), dtype=np.uint8, mode="r", shape=(n_bytes,))
+                  if n_bytes else np.zeros(0, dtype=np.uint8) for value, name in values.items()}
+            for col, values in self.files.items()
+        }
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        if self.files is not None:
+            # the bitmaps stay in their files
+            state.update(bitmaps=None, directory=None)
+        return state
+
+    @classmethod
+    def build(cls, df, columns=INDEX_COLUMNS):
+        n_rows = len(df)
+        bitmaps = {}
+        for col in columns:
+            if col not in df.columns:
+                continue
+            codes, values = _column_codes(df[col])
+            parts = {value: [] for value in values}
+            for start in range(0, n_rows, CHUNK_ROWS):
+                chunk = codes[start:start + CHUNK_ROWS]
+                for k, value in enumerate(values):
+                    parts[value].append(np.packbits(chunk == k))
+            bitmaps[col] = {
+                value: np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.uint8)
+                for value, chunks in parts.items()
+            }
+        return cls(n_rows, bitmaps)
+
+    def extend(self, tail):
+        if len(tail) == 0:
+            return self
+        if self.files is not None:
+            writer = BitmapWriter(self.directory, self.n_rows, self.files)
+            writer.append(tail)
+            return writer.finish()
+        bitmaps = {}
+        for col, column in self.bitmaps.items():
+            codes, values = _column_codes(tail[col])
+            positions = {value: k for k, value in enumerate(values)}
+            empty = np.zeros((self.n_rows + 7) // 8, dtype=np.uint8)
+            bitmaps[col] = {}
+            for value in sorted(set(column) | set(positions)):
+                bits = codes == positions[value] if value in positions else np.zeros(len(tail), dtype=bool)
+                bitmaps[col][value] = _append_bits(column.get(value, empty), self.n_rows, bits)
+        return FilterIndex(self.n_rows + len(tail), bitmaps)
+
+    def values(self, col):
+        return list(self.bitmaps.get(col, {}))
+
+    def _empty(self, fill=0):
+        return np.full((self.n_rows + 7) // 8, fill, dtype=np.uint8)
+
+    def match_any(self, col, values):
+        out = self._empty()
+        column = self.bitmaps[col]
+        for value in values:
+            bitmap = column.get(_key(value))
+            if bitmap is not None:
+                np.bitwise_or(out, bitmap, out=out)
+        return out
+
+    def select(self, selected_region, genres, genders, purchase_filter):
+        mask = None
+        conditions = []
+        if selected_region != "Global":
+            conditions.append(("Location", [selected_region]))
+        if genres:
+            conditions.append(("GameGenre", genres))
+        if genders:
+            conditions.append(("Gender", genders))
+        if purchase_filter == "Paid players":
+            conditions.append(("InGamePurchases", [1]))
+        elif purchase_filter == "Not-paid players":
+            conditions.append(("InGamePurchases", [0]))
+
+        for col, values in conditions:
+            bitmap = self.match_any(col, values)
+            mask = bitmap if mask is None else np.bitwise_and(mask, bitmap, out=mask)
+
+        if mask is None:
+            return np.arange(self.n_rows)
+        return np.flatnonzero(np.unpackbits(mask, count=self.n_rows))
@@ -0,0 +1,236 @@
+# @Author : Yulia
+# @File   : incremental.py
+# @Time   : 2026/10/18
+
+import math
+from fractions import Fraction
+
+import numpy as np
+
+from corr_engine import numeric_columns
+from cube import CUBE_KEYS, cell_codes, cell_index, cell_mask
+
+# Mergeable state for the row-level modules, kept per cube cell so it answers
+# any sidebar filter. Pearson co-moments are held as exact integers (floats
+# are converted to fixed point without rounding), so folding in an appended
+# batch gives bit-for-bit the same state as a rebuild from the full history,
+# whatever the order rows arrive in.
+
+CHUNK_ROWS = 1 << 18
+INT64_LIMIT = 2 ** 63 - 1
+
+
+def _required_scale(values):
+    # fractional bits needed to write every value as an integer
+    values = values[values != 0]
+    if not len(values):
+        return 0
+    mantissa, exponent = np.frexp(values)
+    m = np.ldexp(np.abs(mantissa), 53).astype(np.int64)
+    trailing = np.frexp((m & -m).astype(np.float64))[1] - 1
+    return max(0, int((53 - exponent - trailing).max()))
+
+
+def _fixed_point(values, scale):
+    scaled = np.ldexp(values, scale)
+    if not len(scaled) or np.abs(scaled).max() < 2 ** 62:
+        return scaled.astype(np.int64)
+    return np.array([int(v) for v in scaled.tolist()], dtype=object)
+
+
+def _product(a, b):
+    # int64 while the chunk sum provably cannot overflow, python ints beyond
+    if a.dtype != object and b.dtype != object and len(a):
+        bound = int(np.abs(a).max()) * int(np.abs(b).max()) * len(a)
+        if bound <= INT64_LIMIT:
+            return a * b
+    return a.astype(object) * b.astype(object)
+
+
+def _correlation(n, sxy, sx_i, sx_j, sxx_i, sxx_j):
+    cov = n * sxy - sx_i * sx_j
+    var_i = n * sxx_i - sx_i * sx_i
+    var_j = n * sxx_j - sx_j * sx_j
+    if n < 2 or var_i <= 0 or var_j <= 0:
+        return float("nan")
+    # r^2 is an exact fraction; one rounding to float, then the square root
+    r = math.sqrt(float(Fraction(cov * cov, var_i * var_j)))
+    return math.copysign(min(r, 1.0), cov)
+
+
+class CoMoments:
+    # per cell and column pair: rows where both are present, sum of x over
+    # those rows, sum of x^2 over those rows and sum of x*y (pairwise complete,
+    # like DataFrame.corr). Column c is stored scaled by 2**scales[c].
+
+    def __init__(self, keys, columns, scales, cells):
+        self.keys = list(keys)
+        self.columns = list(columns)
+        self.scales = dict(scales)
+        self.cells = cells
+
+    @classmethod
+    def from_frame(cls, df, keys=CUBE_KEYS):
+        keys = [k for k in keys if k in df.columns]
+        columns = numeric_columns(df)
+        return cls(keys, columns, {c: 0 for c in columns}, {}).extend(df)
+
+    def extend(self, tail):
+        moments = CoMoments(self.keys, self.columns, self.scales,
+                            {cell: sums.copy() for cell, sums in self.cells.items()})
+        for start in range(0, len(tail), CHUNK_ROWS):
+            moments._fold(tail.iloc[start:start + CHUNK_ROWS])
+        return moments
+
+    def _rescale(self, scales):
+        shift = np.array([2 ** (scales[c] - self.scales[c]) for c in self.columns], dtype=object)
+        if (shift == 1).all():
+            return
+        for sums in self.cells.values():
+            sums[1] *= shift[:, None]
+            sums[2] *= (shift * shift)[:, None]
+            sums[3] *= shift[:, None] * shift[None, :]
+        self.scales = scales
+
+    def _fold(self, chunk):
+        X = chunk[self.columns].to_numpy(dtype=np.float64, na_value=np.nan)
+        present = np.isfinite(X)
+        scales = {c: max(self.scales[c], _required_scale(X[present[:, i], i]))
+                  for i, c in enumerate(self.columns)}
+        self._rescale(scales)
+
+        k = len(self.columns)
+        codes, cells = cell_codes(chunk, self.keys)
+        order = np.argsort(codes, kind="stable")
+        starts = np.flatnonzero(np.r_[True, np.diff(codes[order]) != 0])
+        groups = codes[order][starts]
+
+        def group_sum(values):
+            # int64 only while the whole chunk's sum provably fits, like _product
+            values = values[order]
+            if values.dtype != object and len(values) and int(np.abs(values).max()) * len(values) > INT64_LIMIT:
+                values = values.astype(object)
+            return np.add.reduceat(values, starts).astype(object)
+
+        A = [_fixed_point(np.where(present[:, i], X[:, i], 0.0), scales[c]) for i, c in enumerate(self.columns)]
+        M = [None if present[:, i].all() else present[:, i].astype(np.int64) for i in range(k)]
+        squares = [_product(a, a) for a in A]
+        ones = np.ones(len(chunk), dtype=np.int64)
+        counts = group_sum(ones)
+        plain_sx = [group_sum(a) for a in A]
+        plain_sxx = [group_sum(sq) for sq in squares]
+
+        sums = np.empty((len(groups), 4, k, k), dtype=object)
+        for i in range(k):
+            for j in range(k):
+                mj = M[j]
+                if M[i] is None and mj is None:
+                    sums[:, 0, i, j] = counts
+                else:
+                    sums[:, 0, i, j] = group_sum((ones if M[i] is None else M[i]) * (ones if mj is None else mj))
+                sums[:, 1, i, j] = plain_sx[i] if mj is None else group_sum(_product(A[i], mj))
+                sums[:, 2, i, j] = plain_sxx[i] if mj is None else group_sum(_product(squares[i], mj))
+                if j >= i:
+                    sums[:, 3, i, j] = sums[:, 3, j, i] = group_sum(_product(A[i], A[j]))
+
+        for g, code in enumerate(groups):
+            cell = cells[code]
+            if cell in self.cells:
+                self.cells[cell] = self.cells[cell] + sums[g]
+            else:
+                self.cells[cell] = sums[g]
+
+    def query(self, selected_region, genres, genders, purchase_filter):
+        cells = list(self.cells)
+        if not cells:
+            return self
+        mask = cell_mask(cell_index(cells, self.keys), selected_region, genres, genders, purchase_filter)
+        return CoMoments(self.keys, self.columns, self.scales,
+                         {cell: self.cells[cell] for cell, keep in zip(cells, mask) if keep})
+
+    def totals(self):
+        k = len(self.columns)
+        total = np.zeros((4, k, k), dtype=np.int64).astype(object)
+        for sums in self.cells.values():
+            total = total + sums
+        return total
+
+    def pearson(self, columns=None):
+        # (r, n) in the layout corr_engine uses, or None if a column is missing
+        columns = self.columns if columns is None else list(columns)
+        if not set(columns) <= set(self.columns):
+            return None
+        pos = [self.columns.index(c) for c in columns]
+        n, sx, sxx, sxy = self.totals()
+        r = np.full((len(pos), len(pos)), np.nan)
+        counts = np.zeros((len(pos), len(pos)))
+        for a, i in enumerate(pos):
+            for b, j in enumerate(pos):
+                counts[a, b] = n[i, j]
+                if a == b:
+                    r[a, b] = 1.0 if n[i, i] > 1 else np.nan
+                else:
+                    r[a, b] = _correlation(n[i, j], sxy[i, j], sx[i, j], sx[j, i], sxx[i, j], sxx[j, i])
+        return r, counts
+
+    def same_as(self, other):
+        if (self.keys, self.columns, self.scales) != (other.keys, other.columns, other.scales):
+            return False
+        if set(self.cells) != set(other.cells):
+            return False
+        return all((self.cells[cell] == other.cells[cell]).all() for cell in self.cells)
+
+
+def _same_table(a, b):
+    a = a.sort_index().sort_index(axis=1)
+    b = b.sort_index().sort_index(axis=1)
+    return a.shape == b.shape and a.equals(b)
+
+
+def verify(df, filters=None):
+    # compares every incrementally maintained artifact with a rebuild from the
+    # full history; returns {artifact: True/False}
+    from data_loader import ARTIFACTS, load_artifact
+
+    filters = filters or [("Global", [], [], "All")]
+    report = {}
+    for name, (build, _) in ARTIFACTS.items():
+        kept, fresh = load_artifact(df, name), build(df)
+        if kept is None or fresh is None:
+            report[name] = kept is None and fresh is None
+        elif name == "filter_index":
+            report[name] = kept.n_rows == fresh.n_rows and all(
+                np.array_equal(kept.select(*f), fresh.select(*f)) for f in filters)
+        elif name == "cube":
+            same = _same_table(kept.table, fresh.table) and all(
+                _same_table(kept.hists[c], fresh.hists[c]) for c in fresh.hists)
+            report[name] = same
+        elif name == "moments":
+            report[name] = kept.same_as(fresh) and all(
+                np.array_equal(kept.query(*f).pearson()[0], fresh.query(*f).pearson()[0], equal_nan=True)
+                for f in filters)
+        else:
+            report[name] = kept.same_as(fresh)
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    from data_loader import CLEANED_CSV, EUROPE_CSV
+    from store import load_store
+
+    parser = argparse.ArgumentParser(description="Check incrementally updated state against a full recompute")
+    parser.add_argument("sources", nargs="*", default=[CLEANED_CSV, EUROPE_CSV])
+    args = parser.parse_args()
+
+    ok = True
+    for source in args.sources:
+        store = load_store(source)
+        filters = [("Global", [], [], "All"), ("Global", [], [], "Paid players")]
+        filters += [(region, [], [], "All") for region in store["Location"].unique()]
+        for name, same in verify(store, filters).items():
+            print(f"{source} {name}: {'identical' if same else 'MISMATCH'}")
+            ok &= same
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,233 @@
+# @Author : Yulia
+# @File   : ingest.py
+# @Time   : 2026/10/18
+
+import argparse
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_loader import ARTIFACTS, CLEANED_CSV, EUROPE_CSV, load_artifact
+from filter_index import BitmapWriter
+from store import (StoreWriter, append_store, artifact_dir, cached_artifact, open_store, read_manifest,
+                   save_artifact, store_path)
+
+# Streaming version of notebooks/data_clean.ipynb: reads the raw export in
+# chunks, drops duplicate rows, splits out the Europe subset and appends both
+# to the on-disk stores while folding each chunk into the derived artifacts.
+# Row hashes for de-duplication and the filter bitmaps are kept in files next
+# to the store, so peak memory is one chunk whatever the size of the history.
+# Daily batches are appended with --append, which only folds the new rows.
+
+RAW_CSV = "online_gaming_behavior_dataset.csv"
+EUROPE_REGION = "Europe"
+CHUNK_ROWS = 500_000
+HASH_DIR = "row_hashes"
+MERGE_BLOCK = 1 << 20
+
+
+def _row_hashes(chunk):
+    # raw CSV chunks and store frames hold the same rows in different dtypes
+    canonical = pd.DataFrame({
+        col: series.astype("float64") if pd.api.types.is_numeric_dtype(series) else series.astype(str)
+        for col, series in chunk.items()
+    })
+    return pd.util.hash_pandas_object(canonical, index=False).to_numpy()
+
+
+def _write_run(path, values):
+    tmp = f"{path}.tmp-{os.getpid()}"
+    values.tofile(tmp)
+    os.replace(tmp, path)
+
+
+class RowHashes:
+    # 64-bit hashes of every row kept so far, as sorted run files on disk. Each
+    # chunk is checked against the runs with a binary search and its new hashes
+    # become a run; runs of similar size are merged (like an LSM tree), so there
+    # are O(log n) runs and each hash is rewritten O(log n) times in total.
+
+    def __init__(self, directory):
+        # directory: the store's artifact directory
+        self.directory = directory
+        self.runs = []
+        self.serial = 0
+        self.mapped = []
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def attach(self, directory):
+        self.directory = directory
+        self.mapped = [np.memmap(self._path(name), dtype=np.uint64, mode="r", shape=(n,))
+                       for name, n in self.runs]
+
+    def __getstate__(self):
+        return dict(self.__dict__, directory=None, mapped=[])
+
+    @classmethod
+    def build(cls, df):
+        directory = artifact_dir(df.attrs["store_path"])
+        shutil.rmtree(os.path.join(directory, HASH_DIR), ignore_errors=True)
+        return cls(directory).extend(df)
+
+    def extend(self, tail):
+        for start in range(0, len(tail), CHUNK_ROWS):
+            self.keep_new(tail.iloc[start:start + CHUNK_ROWS])
+        return self
+
+    def _seen(self, hashes):
+        seen = np.zeros(len(hashes), dtype=bool)
+        for run in self.mapped:
+            pos = np.searchsorted(run, hashes)
+            pos[pos == len(run)] = 0
+            seen |= np.asarray(run[pos]) == hashes
+        return seen
+
+    def _new_run(self):
+        name = os.path.join(HASH_DIR, f"run-{self.serial}.bin")
+        self.serial += 1
+        return name
+
+    def _add(self, hashes):
+        name = self._new_run()
+        os.makedirs(os.path.dirname(self._path(name)), exist_ok=True)
+        _write_run(self._path(name), np.sort(hashes))
+        self.runs.append((name, len(hashes)))
+        self.mapped.append(np.memmap(self._path(name), dtype=np.uint64, mode="r", shape=(len(hashes),)))
+        while len(self.runs) > 1 and self.runs[-2][1] <= 2 * self.runs[-1][1]:
+            self._merge_last()
+
+    def _merge_last(self):
+        # block-wise merge of the two newest runs, so memory stays bounded
+        (_, n_a), (_, n_b) = self.runs[-2:]
+        a, b = self.mapped[-2:]
+        name = self._new_run()
+        tmp = f"{self._path(name)}.tmp-{os.getpid()}"
+        i = j = 0
+        with open(tmp, "wb") as f:
+            while i < n_a and j < n_b:
+                block_a, block_b = a[i:i + MERGE_BLOCK], b[j:j + MERGE_BLOCK]
+                pivot = min(block_a[-1], block_b[-1])
+                take_a = np.searchsorted(block_a, pivot, side="right")
+                take_b = np.searchsorted(block_b, pivot, side="right")
+                np.sort(np.concatenate([block_a[:take_a], block_b[:take_b]])).tofile(f)
+                i += take_a
+                j += take_b
+            for run, start, n in ((a, i, n_a), (b, j, n_b)):
+                for block in range(start, n, MERGE_BLOCK):
+                    np.asarray(run[block:block + MERGE_BLOCK]).tofile(f)
+        os.replace(tmp, self._path(name))
+        merged = self.runs[-2:]
+        self.runs[-2:] = [(name, n_a + n_b)]
+        self.mapped[-2:] = [np.memmap(self._path(name), dtype=np.uint64, mode="r", shape=(n_a + n_b,))]
+        for old, _ in merged:
+            os.remove(self._path(old))
+
+    def keep_new(self, chunk):
+        hashes = _row_hashes(chunk)
+        keep = ~pd.Series(hashes).duplicated().to_numpy()
+        keep[keep] = ~self._seen(hashes[keep])
+        if keep.any():
+            self._add(hashes[keep])
+        return chunk[keep]
+
+
+class _Target:
+    def __init__(self, name):
+        self.path = store_path(name)
+        self.writer = StoreWriter(self.path)
+        # the bitmaps go straight to files in the unpublished store
+        self.bitmaps = BitmapWriter(self.writer.artifact_dir)
+        self.artifacts = {}
+
+    def append(self, part):
+        if len(part) == 0 and self.writer.n_rows:
+            return
+        self.writer.append(part)
+        self.bitmaps.append(part)
+        for name, (build, extend) in ARTIFACTS.items():
+            if name == "filter_index":
+                continue
+            if name not in self.artifacts:
+                self.artifacts[name] = build(part)
+            elif self.artifacts[name] is not None:
+                self.artifacts[name] = extend(self.artifacts[name], part)
+
+    def finish(self, source, **extra):
+        artifacts = dict(self.artifacts, filter_index=self.bitmaps.finish(), **extra)
+        return self.writer.finalize(source, artifacts)
+
+
+def ingest_raw(raw_csv=RAW_CSV, chunk_rows=CHUNK_ROWS, progress=None):
+    cleaned = _Target(CLEANED_CSV)
+    europe = _Target(EUROPE_CSV)
+    seen = RowHashes(cleaned.writer.artifact_dir)
+    raw_rows = 0
+    try:
+        for chunk in pd.read_csv(raw_csv, chunksize=chunk_rows):
+            raw_rows += len(chunk)
+            chunk = seen.keep_new(chunk)
+            cleaned.append(chunk)
+            europe.append(chunk[chunk["Location"] == EUROPE_REGION])
+            if progress:
+                progress(raw_rows, cleaned.writer.n_rows, europe.writer.n_rows)
+        return cleaned.finish(raw_csv, row_hashes=seen), europe.finish(raw_csv)
+    except BaseException:
+        cleaned.writer.abort()
+        europe.writer.abort()
+        raise
+
+
+def ingest_batch(batch_csv, chunk_rows=CHUNK_ROWS, progress=None):
+    # appends a new batch of players to the existing stores; rows already in
+    # the history are skipped and derived artifacts fold only the new rows
+    cleaned_path, europe_path = store_path(CLEANED_CSV), store_path(EUROPE_CSV)
+    seen = cached_artifact(open_store(cleaned_path), "row_hashes", RowHashes.build, RowHashes.extend)
+    columns = list(read_manifest(cleaned_path)["columns"])
+    raw_rows = added = europe_added = 0
+    for chunk in pd.read_csv(batch_csv, chunksize=chunk_rows):
+        raw_rows += len(chunk)
+        chunk = seen.keep_new(chunk[columns])
+        if len(chunk):
+            append_store(cleaned_path, chunk)
+            added += len(chunk)
+        europe_part = chunk[chunk["Location"] == EUROPE_REGION]
+        if len(europe_part):
+            append_store(europe_path, europe_part)
+            europe_added += len(europe_part)
+        if progress:
+            progress(raw_rows, added, europe_added)
+
+    save_artifact(cleaned_path, "row_hashes", seen)
+    manifests = []
+    for path in (cleaned_path, europe_path):
+        df = open_store(path)
+        for name in ARTIFACTS:
+            load_artifact(df, name)
+        manifests.append(read_manifest(path))
+    return tuple(manifests)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream the raw export into the player stores")
+    parser.add_argument("raw_csv", nargs="?", default=RAW_CSV)
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--append", action="store_true", help="append a new batch to the existing stores")
+    args = parser.parse_args()
+
+    started = time.time()
+
+    def report(raw_rows, kept, europe_rows):
+        print(f"read {raw_rows} rows, kept {kept}, europe {europe_rows} ({time.time() - started:.1f}s)", flush=True)
+
+    # through the module, so the pickled row hashes name ingest.RowHashes, not __main__
+    import ingest as module
+
+    ingest = module.ingest_batch if args.append else module.ingest_raw
+    cleaned_manifest, europe_manifest = ingest(args.raw_csv, args.chunk_rows, progress=report)
+    print(f"{CLEANED_CSV}: {cleaned_manifest['n_rows']} rows, version {cleaned_manifest['version']}")
+    print(f"{EUROPE_CSV}: {europe_manifest['n_rows']} rows, version {europe_manifest['version']}")
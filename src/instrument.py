@@ -0,0 +1,229 @@
+# @Author : Yulia
+# @File   : instrument.py
+# @Time   : 2026/10/18
+
+import collections
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+
+# Timing spans, counters and an optional sampling profiler for one dashboard
+# run. A Trace is activated for the current context (script run); everything
+# started from it, including jobs handed to the shared pool, records into it.
+# With no active trace span() returns a shared no-op object, so instrumented
+# code pays a single context variable lookup.
+
+SAMPLE_INTERVAL = float(os.environ.get("GDA_PROFILE_INTERVAL_MS", "5")) / 1000
+ENABLED = os.environ.get("GDA_INSTRUMENT", "0") == "1"
+
+_current = contextvars.ContextVar("gda_trace", default=None)
+_PAGE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _rss():
+    # resident memory of the process in bytes, None where /proc is missing
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NULL = _NullSpan()
+
+
+class Span:
+    def __init__(self, trace, name, args):
+        self.trace = trace
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.thread = threading.get_ident()
+        self.rss = _rss()
+        self.trace._enter(self.thread)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        rss = _rss()
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        memory = rss - self.rss if rss is not None and self.rss is not None else None
+        self.trace._record(self.name, self.start, end, self.thread, self.args, memory)
+        self.trace._exit(self.thread)
+        return False
+
+    def set(self, **args):
+        # attach results known only inside the span (row counts, cache status)
+        self.args.update(args)
+
+
+class Trace:
+    def __init__(self, name="dashboard run", profile=False, max_seconds=120):
+        self.name = name
+        self.max_seconds = max_seconds
+        self.origin = time.perf_counter()
+        self.spans = []
+        self.counters = collections.Counter()
+        self.samples = collections.Counter()
+        self._threads = collections.Counter()
+        self._lock = threading.Lock()
+        self._sampler = None
+        self._stop = threading.Event()
+        if profile:
+            self._sampler = threading.Thread(target=self._sample, name="gda-profiler", daemon=True)
+
+    def __enter__(self):
+        self._token = self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+        _current.reset(self._token)
+        return False
+
+    def start(self):
+        # activates the trace for the current context (e.g. a script run)
+        self._owner = threading.current_thread()
+        token = _current.set(self)
+        if self._sampler is not None:
+            self._sampler.start()
+        return token
+
+    def stop(self):
+        if self._sampler is not None and self._sampler.is_alive():
+            self._stop.set()
+            self._sampler.join()
+
+    def _enter(self, thread):
+        with self._lock:
+            self._threads[thread] += 1
+
+    def _exit(self, thread):
+        with self._lock:
+            self._threads[thread] -= 1
+            if not self._threads[thread]:
+                del self._threads[thread]
+
+    def _record(self, name, start, end, thread, args, memory):
+        with self._lock:
+            self.spans.append({"name": name, "start": start - self.origin, "seconds": end - start,
+                               "thread": thread, "args": args, "memory": memory})
+
+    def _sample(self):
+        # only threads inside a span of this trace are sampled, so concurrent
+        # sessions do not show up in each other's profiles
+        own = threading.get_ident()
+        deadline = time.perf_counter() + self.max_seconds
+        # a run that never reaches stop() (st.stop, an exception) ends with its thread
+        while not self._stop.wait(SAMPLE_INTERVAL) and self._owner.is_alive() and time.perf_counter() < deadline:
+            with self._lock:
+                threads = set(self._threads)
+            frames = sys._current_frames()
+            for thread in threads:
+                frame = frames.get(thread)
+                if frame is None or thread == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                with self._lock:
+                    self.samples[";".join(reversed(stack))] += 1
+
+    def elapsed(self):
+        return time.perf_counter() - self.origin
+
+    def summary(self):
+        # spans in start order with their timings in milliseconds
+        rows = []
+        for s in sorted(self.spans, key=lambda s: s["start"]):
+            rows.append({"span": s["name"], "start ms": round(s["start"] * 1000, 1),
+                         "ms": round(s["seconds"] * 1000, 2),
+                         "memory MB": None if s["memory"] is None else round(s["memory"] / 2 ** 20, 1),
+                         **{k: v for k, v in s["args"].items()}})
+        return rows
+
+    def top_functions(self, limit=20):
+        # (function, samples where it was on the stack, samples where it was
+        # the running frame), hottest running frames first
+        inclusive, leaf = collections.Counter(), collections.Counter()
+        for stack, n in self.samples.items():
+            frames = stack.split(";")
+            for frame in set(frames):
+                inclusive[frame] += n
+            leaf[frames[-1]] += n
+        return [(frame, inclusive[frame], n) for frame, n in leaf.most_common(limit)]
+
+    def collapsed_stacks(self):
+        # flamegraph.pl / speedscope "collapsed" format
+        return "\n".join(f"{stack} {n}" for stack, n in self.samples.most_common())
+
+    def chrome_trace(self):
+        # chrome://tracing / Perfetto JSON
+        pid = os.getpid()
+        events = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": self.name}}]
+        for s in self.spans:
+            args = dict(s["args"])
+            if s["memory"] is not None:
+                args["memory_delta_mb"] = round(s["memory"] / 2 ** 20, 2)
+            events.append({"name": s["name"], "ph": "X", "pid": pid, "tid": s["thread"],
+                           "ts": s["start"] * 1e6, "dur": s["seconds"] * 1e6, "args": args})
+        end = max((s["start"] + s["seconds"] for s in self.spans), default=0.0)
+        for name, value in self.counters.items():
+            events.append({"name": name, "ph": "C", "pid": pid, "ts": end * 1e6, "args": {"value": value}})
+        trace = {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"counters": dict(self.counters)}}
+        if self.samples:
+            trace["otherData"]["collapsed_stacks"] = self.collapsed_stacks()
+        return json.dumps(trace, default=str)
+
+
+def current():
+    return _current.get()
+
+
+def span(name, **args):
+    trace = _current.get()
+    if trace is None:
+        return _NULL
+    return Span(trace, name, args)
+
+
+def count(name, n=1):
+    trace = _current.get()
+    if trace is not None:
+        with trace._lock:
+            trace.counters[name] += n
+
+
+def show_trace(trace, container):
+    # debug panel; `container` is a Streamlit container such as st.sidebar
+    container.caption(f"Run: {trace.elapsed() * 1000:.0f} ms, {len(trace.spans)} spans")
+    container.dataframe(trace.summary(), hide_index=True)
+    if trace.counters:
+        container.caption(", ".join(f"{name}: {n}" for name, n in sorted(trace.counters.items())))
+    if trace.samples:
+        container.caption(f"Profiler: {sum(trace.samples.values())} samples every {SAMPLE_INTERVAL * 1000:g} ms")
+        container.dataframe([{"function": frame, "samples": n, "self": leaf}
+                             for frame, n, leaf in trace.top_functions()], hide_index=True)
+        container.download_button("Download profile (collapsed stacks)", trace.collapsed_stacks(),
+                                  file_name="gda-profile.txt", mime="text/plain")
+    container.download_button("Download trace (chrome://tracing)", trace.chrome_trace(),
+                              file_name="gda-trace.json", mime="application/json")
@@ -0,0 +1,239 @@
+# @Author : Yulia
+# @File   : model_registry.py
+# @Time   : 2026/10/18
+
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.compose import ColumnTransformer
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import accuracy_score, confusion_matrix
+from sklearn.model_selection import cross_val_score, train_test_split
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+from store import STORE_ROOT, load_store
+
+# Registry of fitted payer-propensity pipelines. A model is trained once per
+# (dataset version, filter segment, feature set), saved with its metadata and
+# metrics, and reused for both the dashboard and offline batch scoring.
+
+MODEL_DIR = os.path.join(STORE_ROOT, "models", "prediction")
+TARGET = "InGamePurchases"
+BASE_FEATURES = ["Age", "SessionsPerWeek", "PlayerLevel"]
+SCORE_CHUNK_ROWS = 200_000
+# one model per segment fingerprint; the least recently used beyond this are removed
+MAX_MODELS = int(os.environ.get("GDA_MAX_MODELS", "500"))
+
+
+def feature_columns(df, all_features=False):
+    if not all_features:
+        return list(BASE_FEATURES)
+    return [c for c in df.columns if c != TARGET and not c.endswith("ID")]
+
+
+def build_pipeline(df, features):
+    categorical = [c for c in features if not pd.api.types.is_numeric_dtype(df[c])]
+    if not categorical and features == BASE_FEATURES:
+        # same model the dashboard has always shown
+        return Pipeline([("model", LogisticRegression(max_iter=1000))])
+
+    numeric = [c for c in features if c not in categorical]
+    prep = ColumnTransformer([
+        ("num", StandardScaler(), numeric),
+        ("cat", OneHotEncoder(handle_unknown="ignore"), categorical),
+    ])
+    return Pipeline([("prep", prep), ("model", LogisticRegression(max_iter=1000))])
+
+
+def _paths(key):
+    return os.path.join(MODEL_DIR, f"{key}.joblib"), os.path.join(MODEL_DIR, f"{key}.json")
+
+
+def save_model(key, pipeline, metadata):
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    model_path, meta_path = _paths(key)
+    # views on different threads may train the same key at once
+    suffix = f".tmp-{os.getpid()}-{threading.get_ident()}"
+    joblib.dump({"pipeline": pipeline, "metadata": metadata}, model_path + suffix)
+    os.replace(model_path + suffix, model_path)
+    with open(meta_path + suffix, "w", encoding="utf-8") as f:
+        json.dump(metadata, f, ensure_ascii=False, indent=1)
+    os.replace(meta_path + suffix, meta_path)
+    _prune()
+
+
+def _prune():
+    entries = []
+    for name in os.listdir(MODEL_DIR):
+        if name.endswith(".joblib"):
+            try:
+                entries.append((os.stat(os.path.join(MODEL_DIR, name)).st_mtime, name[:-len(".joblib")]))
+            except OSError:
+                continue
+    for _, key in sorted(entries)[:max(len(entries) - MAX_MODELS, 0)]:
+        for path in _paths(key):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def load_model(key):
+    model_path, _ = _paths(key)
+    try:
+        saved = joblib.load(model_path)
+        pipeline, metadata = saved["pipeline"], saved["metadata"]
+    except Exception:
+        # missing, truncated, or pickled by code that has since changed:
+        # the caller trains and saves a fresh model
+        return None, None
+    try:
+        # the modification time orders models for _prune
+        os.utime(model_path)
+    except OSError:
+        pass
+    return pipeline, metadata
+
+
+def list_models():
+    if not os.path.isdir(MODEL_DIR):
+        return []
+    models = []
+    for name in sorted(os.listdir(MODEL_DIR)):
+        if name.endswith(".json"):
+            with open(os.path.join(MODEL_DIR, name), encoding="utf-8") as f:
+                models.append(json.load(f))
+    return models
+
+
+def train_model(data, key, all_features=False, cv_folds=0, n_jobs=-1):
+    features = feature_columns(data, all_features)
+    model_data = data[features + [TARGET]].dropna()
+    X = model_data[features]
+    y = model_data[TARGET]
+
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=42, stratify=y)
+    pipeline = build_pipeline(model_data, features)
+    pipeline.fit(X_train, y_train)
+    y_pred = pipeline.predict(X_test)
+
+    metrics = {
+        "accuracy": float(accuracy_score(y_test, y_pred)),
+        "confusion_matrix": confusion_matrix(y_test, y_pred, labels=[0, 1]).tolist(),
+    }
+    if cv_folds:
+        # folds are independent fits, so they run in parallel
+        scores = cross_val_score(build_pipeline(model_data, features), X, y, cv=cv_folds, n_jobs=n_jobs)
+        metrics["cv_accuracy_mean"] = float(scores.mean())
+        metrics["cv_accuracy_std"] = float(scores.std())
+        metrics["cv_folds"] = int(cv_folds)
+
+    metadata = {
+        "key": key,
+        "dataset_version": data.attrs.get("store_version"),
+        "features": features,
+        "target": TARGET,
+        "n_rows": int(len(model_data)),
+        "payer_share": float(y.mean()),
+        "metrics": metrics,
+        "trained_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "sklearn_version": sklearn.__version__,
+    }
+    save_model(key, pipeline, metadata)
+    return pipeline, metadata
+
+
+def get_or_train(data, key, all_features=False, cv_folds=0):
+    pipeline, metadata = load_model(key)
+    if pipeline is not None:
+        return pipeline, metadata
+    return train_model(data, key, all_features=all_features, cv_folds=cv_folds)
+
+
+# --- batch scoring ---
+_worker_model = None
+
+
+def _init_worker(key):
+    global _worker_model
+    _worker_model = load_model(key)
+
+
+def _score_chunk(chunk):
+    pipeline, metadata = _worker_model
+    features = metadata["features"]
+    usable = chunk[features].notna().all(axis=1)
+    scores = np.full(len(chunk), np.nan)
+    if usable.any():
+        scores[usable.to_numpy()] = pipeline.predict_proba(chunk.loc[usable, features])[:, 1]
+    id_col = "PlayerID" if "PlayerID" in chunk.columns else None
+    out = pd.DataFrame({"PayerScore": scores}, index=chunk.index)
+    if id_col:
+        out.insert(0, id_col, chunk[id_col].to_numpy())
+    return out
+
+
+def score_file(key, input_csv, output_csv, chunk_rows=SCORE_CHUNK_ROWS, n_jobs=None):
+    if load_model(key)[0] is None:
+        raise FileNotFoundError(f"No registered model {key}")
+
+    n_jobs = n_jobs or os.cpu_count() or 1
+    written = 0
+    reader = pd.read_csv(input_csv, chunksize=chunk_rows)
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(key,)) as pool, \
+            open(output_csv, "w", encoding="utf-8", newline="") as out:
+        pending = []
+        header = True
+
+        def flush(limit):
+            nonlocal header, written
+            while len(pending) > limit:
+                result = pending.pop(0).result()
+                result.to_csv(out, index=False, header=header)
+                header = False
+                written += len(result)
+
+        # keep a bounded window of chunks in flight so memory stays flat
+        for chunk in reader:
+            pending.append(pool.submit(_score_chunk, chunk))
+            flush(2 * n_jobs)
+        flush(0)
+    return written
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Payer model registry")
+    sub = parser.add_subparsers(dest="command", required=True)
+    train_cmd = sub.add_parser("train", help="train a model on a player CSV")
+    train_cmd.add_argument("input_csv")
+    train_cmd.add_argument("--key", required=True)
+    train_cmd.add_argument("--all-features", action="store_true")
+    train_cmd.add_argument("--cv", type=int, default=0)
+    score_cmd = sub.add_parser("score", help="score a player CSV with a registered model")
+    score_cmd.add_argument("key")
+    score_cmd.add_argument("input_csv")
+    score_cmd.add_argument("output_csv")
+    score_cmd.add_argument("--chunk-rows", type=int, default=SCORE_CHUNK_ROWS)
+    score_cmd.add_argument("--jobs", type=int, default=None)
+    sub.add_parser("list", help="list registered models")
+    args = parser.parse_args()
+
+    if args.command == "train":
+        _, meta = train_model(load_store(args.input_csv), args.key, args.all_features, args.cv)
+        print(json.dumps(meta["metrics"], indent=1))
+    elif args.command == "score":
+        n = score_file(args.key, args.input_csv, args.output_csv, args.chunk_rows, args.jobs)
+        print(f"scored {n} players -> {args.output_csv}")
+    else:
+        for meta in list_models():
+            print(f"{meta['key']}  rows={meta['n_rows']}  acc={meta['metrics']['accuracy']:.3f}  {meta['trained_at']}")
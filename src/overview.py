@@ -4,54 +4,63 @@
 
 import streamlit as st
 import plotly.express as px
+from cube import as_cube
+from figure_data import LazyFigures
 
 def render_overview(filtered_data, selected_region, render=True):
+    # all metrics and figures come from pre-aggregated cube cells
+    cube = as_cube(filtered_data)
     metrics = {
-        "Total number of players": len(filtered_data),
-        "Average age": round(filtered_data["Age"].mean(), 1),
-        "Proportion of paying players": f"{filtered_data['InGamePurchases'].mean()*100:.1f}%",
-        "Average number of sessions": round(filtered_data["SessionsPerWeek"].mean(), 1),
-        "Proportion of highly engaged players": f"{(filtered_data['EngagementLevel'] == 'High').mean()*100:.1f}%"
+        "Total number of players": len(cube),
+        "Average age": round(cube.mean("Age"), 1),
+        "Proportion of paying players": f"{cube.mean('InGamePurchases')*100:.1f}%",
+        "Average number of sessions": round(cube.mean("SessionsPerWeek"), 1),
+        "Proportion of highly engaged players": f"{cube.share('EngagementLevel', 'High')*100:.1f}%"
     }
 
-    # figs
-    fig_location = px.histogram(filtered_data, x="Location", title=f"Geography ({selected_region})", text_auto=True)
-    fig_age = px.histogram(filtered_data, x="Age", nbins=20, title="Age Distribution")
-    fig_gender = px.pie(filtered_data, names="Gender", title="Gender Distribution")
-    fig_sessions = px.histogram(filtered_data, x="SessionsPerWeek", title="Weekly Sessions")
-    fig_engagement = px.pie(filtered_data, names="EngagementLevel", title="Engagement Level")
-    fig_purchase = px.histogram(filtered_data, x="PlayerLevel", color="InGamePurchases",
-                                barmode="group", title="Paying Players by Level")
-    fig_genre_purchase = px.histogram(filtered_data, x="GameGenre", color="InGamePurchases",
-                                      barmode="group", title="Paying Players by Game Type")
-
-    figs = {
-        "Geography": fig_location,
-        "Age": fig_age,
-        "Gender": fig_gender,
-        "Weekly Sessions": fig_sessions,
-        "Engagement Level": fig_engagement,
-        "Level vs Payment": fig_purchase,
-        "Genre vs Payment": fig_genre_purchase
-    }
+    # figs (pre-binned counts, plotly only sums them); built when shown or exported
+    location_counts = cube.counts("Location").reset_index(name="count")
+    age_hist = cube.histogram("Age").rename_axis("Age").reset_index(name="count")
+    gender_counts = cube.counts("Gender").reset_index(name="count")
+    sessions_hist = cube.histogram("SessionsPerWeek").rename_axis("SessionsPerWeek").reset_index(name="count")
+    engagement_counts = cube.counts("EngagementLevel").reset_index(name="count")
+    level_purchase = cube.histogram("PlayerLevel", by="InGamePurchases").stack().reset_index(name="count")
+    genre_purchase = cube.counts(["GameGenre", "InGamePurchases"]).reset_index(name="count")
+
+    figs = LazyFigures()
+    figs.add("Geography", _count_histogram, location_counts, x="Location",
+             title=f"Geography ({selected_region})", text_auto=True)
+    figs.add("Age", _count_histogram, age_hist, x="Age", nbins=20, title="Age Distribution")
+    figs.add("Gender", px.pie, gender_counts, names="Gender", values="count", title="Gender Distribution")
+    figs.add("Weekly Sessions", _count_histogram, sessions_hist, x="SessionsPerWeek", title="Weekly Sessions")
+    figs.add("Engagement Level", px.pie, engagement_counts, names="EngagementLevel", values="count",
+             title="Engagement Level")
+    figs.add("Level vs Payment", _count_histogram, level_purchase, x="PlayerLevel", color="InGamePurchases",
+             barmode="group", title="Paying Players by Level")
+    figs.add("Genre vs Payment", _count_histogram, genre_purchase, x="GameGenre", color="InGamePurchases",
+             barmode="group", title="Paying Players by Game Type")
 
     if render:
-        st.subheader("🧭 Overview")
-        col1, col2, col3, col4, col5 = st.columns(5)
-        col1.metric("Total number of players", metrics["Total number of players"])
-        col2.metric("Average age", metrics["Average age"])
-        col3.metric("Proportion of paying players", metrics["Proportion of paying players"])
-        col4.metric("Average number of sessions", metrics["Average number of sessions"])
-        col5.metric("Proportion of highly engaged players", metrics["Proportion of highly engaged players"])
-
-        st.divider()
-        st.plotly_chart(fig_location, use_container_width=True)
-        st.plotly_chart(fig_age, use_container_width=True)
-        st.plotly_chart(fig_gender, use_container_width=True)
-        st.plotly_chart(fig_sessions, use_container_width=True)
-        st.plotly_chart(fig_engagement, use_container_width=True)
-        st.plotly_chart(fig_purchase, use_container_width=True)
-        st.plotly_chart(fig_genre_purchase, use_container_width=True)
+        show_overview(metrics, figs)
 
     return metrics, figs
 
+
+def _count_histogram(counts, x, **kwargs):
+    fig = px.histogram(counts, x=x, y="count", histfunc="sum", **kwargs)
+    fig.update_layout(yaxis_title="count")
+    return fig
+
+
+def show_overview(metrics, figs):
+    st.subheader("🧭 Overview")
+    col1, col2, col3, col4, col5 = st.columns(5)
+    col1.metric("Total number of players", metrics["Total number of players"])
+    col2.metric("Average age", metrics["Average age"])
+    col3.metric("Proportion of paying players", metrics["Proportion of paying players"])
+    col4.metric("Average number of sessions", metrics["Average number of sessions"])
+    col5.metric("Proportion of highly engaged players", metrics["Proportion of highly engaged players"])
+
+    st.divider()
+    for fig in figs.values():
+        st.plotly_chart(fig, use_container_width=True)
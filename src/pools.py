@@ -0,0 +1,24 @@
+# @Author : Yulia
+# @File   : pools.py
+# @Time   : 2026/10/18
+
+import multiprocessing
+import sys
+import threading
+
+# Start method for process pools. Dashboard jobs run on the threads of a
+# multithreaded server, and fork copies only the calling thread: a child can
+# inherit a lock some other thread held (logging, imports, BLAS) and hang.
+# Fork is used only when the caller is the process's single thread, as in a
+# command-line run; otherwise workers come from forkserver (or spawn) and
+# receive their state through initializer arguments.
+
+
+def start_method():
+    if threading.active_count() > 1:
+        return "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return "fork" if sys.platform.startswith("linux") else None
+
+
+def mp_context(method=None):
+    return multiprocessing.get_context(method or start_method())
@@ -6,40 +6,48 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 
-from sklearn.model_selection import train_test_split
-from sklearn.linear_model import LogisticRegression
-from sklearn.metrics import accuracy_score, confusion_matrix
+from figure_data import LazyFigures
+from instrument import span
+from model_registry import TARGET, feature_columns, get_or_train
+from result_cache import frame_fingerprint
 
-def render_prediction(filtered_data, render=True):
-    needed = ["Age", "SessionsPerWeek", "PlayerLevel", "InGamePurchases"]
+def render_prediction(filtered_data, render=True, all_features=False, cv_folds=0):
+    needed = feature_columns(filtered_data, all_features) + [TARGET]
     if not all(c in filtered_data.columns for c in needed):
         if render:
             st.warning("Missing required columns for prediction model.")
-        return None, None
+        return None, LazyFigures()
 
     model_data = filtered_data[needed].dropna()
-    if len(model_data) <= 50:
+    if len(model_data) <= 50 or model_data[TARGET].nunique() < 2:
         if render:
             st.warning("Not enough data to train prediction model.")
-        return None, None
+        return None, LazyFigures()
 
-    X = model_data[["Age", "SessionsPerWeek", "PlayerLevel"]]
-    y = model_data["InGamePurchases"]
+    # trained once per dataset version + segment, then served from the registry
+    key = frame_fingerprint(model_data, needed + [f"cv={cv_folds}"])
+    with span("model train or load", rows=len(model_data), cv_folds=cv_folds):
+        _, metadata = get_or_train(model_data, key, all_features=all_features, cv_folds=cv_folds)
 
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=42, stratify=y)
-    clf = LogisticRegression(max_iter=1000)
-    clf.fit(X_train, y_train)
-    y_pred = clf.predict(X_test)
-
-    acc = accuracy_score(y_test, y_pred)
-    cm = confusion_matrix(y_test, y_pred, labels=[0, 1])
+    acc = metadata["metrics"]["accuracy"]
+    cm = metadata["metrics"]["confusion_matrix"]
     cm_df = pd.DataFrame(cm, index=["Actual: Not-paid", "Actual: Paid"],
                          columns=["Predicted: Not-paid", "Predicted: Paid"])
-    fig_cm = px.imshow(cm_df, text_auto=True, color_continuous_scale="Blues", title="Confusion Matrix")
+    figs = LazyFigures()
+    figs.add("Prediction Confusion Matrix", px.imshow, cm_df, text_auto=True, color_continuous_scale="Blues",
+             title="Confusion Matrix")
 
     if render:
-        st.subheader("🤖 Prediction Model")
-        st.metric("Model Accuracy", f"{acc*100:.2f}%")
-        st.plotly_chart(fig_cm, use_container_width=True)
+        show_prediction(acc, figs)
+
+    return acc, figs
+
+
+def show_prediction(acc, figs):
+    if acc is None:
+        st.warning("Not enough data to train prediction model.")
+        return
 
-    return acc, fig_cm
+    st.subheader("🤖 Prediction Model")
+    st.metric("Model Accuracy", f"{acc*100:.2f}%")
+    st.plotly_chart(figs["Prediction Confusion Matrix"], use_container_width=True)
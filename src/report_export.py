@@ -8,8 +8,17 @@ from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import cm
 
-def export_full_report(metrics, results_df, figs, model_acc, selected_charts):
-    buffer = BytesIO()
+from chart_render import render_images
+from instrument import span
+
+def export_full_report(metrics, results_df, figs, model_acc, selected_charts, output=None):
+    # charts are rasterized concurrently (and cached) while the text part of
+    # the story is assembled; the PDF is written straight into `output`.
+    # Only the selected charts are looked up, so lazy figures stay unbuilt.
+    charts = {title: figs[title] for title in figs if title in selected_charts}
+    images = render_images(charts, fmt="png")
+
+    buffer = output if output is not None else BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=A4)
     story = []
     styles = getSampleStyleSheet()
@@ -38,16 +47,14 @@ def export_full_report(metrics, results_df, figs, model_acc, selected_charts):
         story.append(Spacer(1, 12))
 
     # --- Figures ---
-    for title, fig in figs.items():
-        if title not in selected_charts:
-            continue
-        img_buf = BytesIO()
-        fig.write_image(img_buf, format="png")
-        img_buf.seek(0)
+    for title, png in images:
+        img_buf = BytesIO(png)
         story.append(Paragraph(title, styles["Heading2"]))
         story.append(Image(img_buf, width=12*cm, height=7*cm))
         story.append(Spacer(1, 12))
 
-    doc.build(story)
-    buffer.seek(0)
+    with span("pdf build", charts=len(charts)):
+        doc.build(story)
+    if output is None:
+        buffer.seek(0)
     return buffer
@@ -0,0 +1,168 @@
+# @Author : Yulia
+# @File   : result_cache.py
+# @Time   : 2026/10/18
+
+import hashlib
+import json
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Process-wide cache for module results (metrics, tables and figures), keyed
+# by a fingerprint of the dataset version and the sidebar filters. Memory use
+# is bounded by an LRU policy on the pickled size of each entry; entries can
+# optionally be persisted to disk so they survive server restarts.
+
+DEFAULT_MAX_MB = int(os.environ.get("GDA_RESULT_CACHE_MB", "256"))
+DEFAULT_DISK_MB = int(os.environ.get("GDA_RESULT_CACHE_DISK_MB", "1024"))
+
+
+def fingerprint(*parts):
+    def normalize(value):
+        # multiselect order does not change the result
+        if isinstance(value, (list, tuple, set)):
+            return sorted(str(v) for v in value)
+        return value
+
+    payload = json.dumps([normalize(p) for p in parts], default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:20]
+
+
+def frame_fingerprint(df, columns=None):
+    # identifies a filtered slice of a store by its version and row labels
+    columns = list(df.columns if columns is None else columns)
+    rows = hashlib.sha1(np.ascontiguousarray(df.index.to_numpy()).tobytes()).hexdigest()
+    return fingerprint(df.attrs.get("store_version"), columns, len(df), rows)
+
+
+class ResultCache:
+    def __init__(self, max_bytes=DEFAULT_MAX_MB << 20, persist_dir=None, max_disk_bytes=DEFAULT_DISK_MB << 20):
+        self.max_bytes = max_bytes
+        self.persist_dir = persist_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.misses = 0
+        self.current_bytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.RLock()
+        if persist_dir:
+            os.makedirs(persist_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.persist_dir, f"{key}.pkl")
+
+    def _load_disk(self, key):
+        if not self.persist_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                blob = f.read()
+        except OSError:
+            return None
+        try:
+            return blob, pickle.loads(blob)
+        except Exception:
+            # truncated, or pickled by code that has since been renamed or
+            # changed: drop the entry and recompute
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+    def _save_disk(self, key, blob):
+        path = self._disk_path(key)
+        tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        try:
+            # the directory may have been cleared since the cache was created
+            os.makedirs(self.persist_dir, exist_ok=True)
+            with open(tmp, "wb") as f:
+                f.write(blob)
+            os.replace(tmp, path)
+        except OSError:
+            return
+        self._prune_disk()
+
+    def _prune_disk(self):
+        entries = []
+        for name in os.listdir(self.persist_dir):
+            if not name.endswith(".pkl"):
+                continue
+            path = os.path.join(self.persist_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def _store(self, key, value, size):
+        if key in self._items:
+            self.current_bytes -= self._items.pop(key)[0]
+        if size > self.max_bytes:
+            return
+        self._items[key] = (size, value)
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes:
+            _, (old_size, _) = self._items.popitem(last=False)
+            self.current_bytes -= old_size
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key][1]
+
+        loaded = self._load_disk(key)
+        with self._lock:
+            if loaded is None:
+                self.misses += 1
+                return default
+            blob, value = loaded
+            self.hits += 1
+            self._store(key, value, len(blob))
+            return value
+
+    def put(self, key, value):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._store(key, value, len(blob))
+        if self.persist_dir:
+            self._save_disk(key, blob)
+
+    def get_or_compute(self, key, compute):
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._items),
+                "bytes": self.current_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
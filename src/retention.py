@@ -6,36 +6,77 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+from cube import as_cube
+from figure_data import LazyFigures
 
-def render_retention_funnel(filtered_data, render=True):
-    total_players = len(filtered_data)
-    day1_retained = (filtered_data['SessionsPerWeek'] >= 1).sum() / total_players if total_players else 0
-    day7_retained = (filtered_data['SessionsPerWeek'] >= 2).sum() / total_players if total_players else 0
-    day30_retained = (filtered_data['SessionsPerWeek'] >= 4).sum() / total_players if total_players else 0
+def render_retention_funnel(filtered_data, render=True, curves=None):
+    cube = as_cube(filtered_data)
+    total_players = len(cube)
+    if curves is not None:
+        # session event log available: measured retention of the filtered cells
+        return _event_retention(curves, total_players, render)
+
+    day1_retained = cube.count_at_least("SessionsPerWeek", 1) / total_players if total_players else 0
+    day7_retained = cube.count_at_least("SessionsPerWeek", 2) / total_players if total_players else 0
+    day30_retained = cube.count_at_least("SessionsPerWeek", 4) / total_players if total_players else 0
 
     retention = pd.DataFrame({
         "Day": ["Day1", "Day7", "Day30"],
         "RetentionRate": [day1_retained, day7_retained, day30_retained]
     })
-    fig_retention = px.bar(retention, x="Day", y="RetentionRate",
-                           text=[f"{x:.1%}" for x in retention["RetentionRate"]],
-                           title="Player Retention Rate")
 
     funnel_stages = {
         "All Players": total_players,
-        "Active (≥2/wk)": (filtered_data['SessionsPerWeek'] >= 2).sum(),
-        "Highly Engaged": (filtered_data['EngagementLevel'] == "High").sum(),
-        "Paying Players": filtered_data['InGamePurchases'].sum()
+        "Active (≥2/wk)": cube.count_at_least("SessionsPerWeek", 2),
+        "Highly Engaged": int(cube.counts("EngagementLevel").get("High", 0)),
+        "Paying Players": int(cube.sum("InGamePurchases"))
     }
-    fig_funnel = go.Figure(go.Funnel(
+
+    figs = LazyFigures()
+    figs.add("Retention Rate", px.bar, retention, x="Day", y="RetentionRate",
+             text=[f"{x:.1%}" for x in retention["RetentionRate"]], title="Player Retention Rate")
+    figs.add("Funnel Analysis", _funnel_figure, funnel_stages)
+
+    if render:
+        show_retention_funnel(figs)
+
+    return retention, funnel_stages, figs
+
+
+def _event_retention(curves, total_players, render):
+    retention = pd.DataFrame({
+        "Day": ["Day1", "Day7", "Day30"],
+        "RetentionRate": curves.retention_at([1, 7, 30])
+    })
+    funnel_stages = {"All Players": total_players, **curves.funnel}
+    curve = curves.curve()
+    cohorts = curves.cohort_matrix("W")
+
+    figs = LazyFigures()
+    figs.add("Retention Rate", px.bar, retention, x="Day", y="RetentionRate",
+             text=[f"{x:.1%}" for x in retention["RetentionRate"]], title="Player Retention Rate (session events)")
+    figs.add("Funnel Analysis", _funnel_figure, funnel_stages)
+    figs.add("Retention Curve", px.line, curve, x="Day", y="RetentionRate", markers=True,
+             title="N-day Retention Curve")
+    if cohorts is not None and len(cohorts):
+        figs.add("Cohort Day-N Retention", px.imshow, cohorts, aspect="auto", color_continuous_scale="Blues",
+                 title="Day-N Retention by Weekly Cohort")
+
+    if render:
+        show_retention_funnel(figs)
+
+    return retention, funnel_stages, figs
+
+
+def _funnel_figure(funnel_stages):
+    return go.Figure(go.Funnel(
         y=list(funnel_stages.keys()),
         x=list(funnel_stages.values()),
         textinfo="value+percent initial"
     ))
 
-    if render:
-        st.subheader("📈 Retention & Funnel")
-        st.plotly_chart(fig_retention, use_container_width=True)
-        st.plotly_chart(fig_funnel, use_container_width=True)
 
-    return fig_retention, fig_funnel
+def show_retention_funnel(figs):
+    st.subheader("📈 Retention & Funnel")
+    for fig in figs.values():
+        st.plotly_chart(fig, use_container_width=True)
@@ -0,0 +1,234 @@
+# @Author : Yulia
+# @File   : retention_engine.py
+# @Time   : 2026/10/18
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from cube import cell_codes, cell_index, cell_mask
+from filter_index import INDEX_COLUMNS
+from pools import mp_context
+from store import source_signature
+
+# Retention and funnel from per-player session events instead of thresholds
+# on SessionsPerWeek. The event file is streamed once and split into player-id
+# shards on disk; a process pool sorts each shard by (player, day) and derives
+# first/last seen days, the distinct active day offsets and the funnel flags
+# of every player in one pass. The result is kept per filter cell and join-day
+# cohort: counts of players active exactly N days after their first session,
+# for N up to RETENTION_DAYS. Players are matched to the player table by id.
+
+EVENTS_PATH = os.environ.get("GDA_EVENTS_PATH", "session_events.csv")
+PLAYER_COLUMN = "PlayerID"
+TIME_COLUMN = "Timestamp"
+TYPE_COLUMN = "EventType"
+PURCHASE_EVENT = "purchase"
+RETENTION_DAYS = 30
+CHUNK_ROWS = 1_000_000
+SHARDS = 64
+FUNNEL_STAGES = ["Played", "Returned (Day 1+)", "Retained (Day 7+)", "Purchased"]
+
+_players = None
+
+
+def _init_shard_worker(ids, cells):
+    # sorted player ids of the player table and their filter cell
+    global _players
+    _players = ids, cells
+
+
+def _event_days(chunk):
+    return pd.to_datetime(chunk[TIME_COLUMN]).to_numpy(dtype="datetime64[D]").astype(np.int64)
+
+
+def _spill(directory, chunk, n_shards):
+    # appends (player, day, purchase) of a chunk to the files of its shards
+    players = chunk[PLAYER_COLUMN].to_numpy(dtype=np.int64)
+    days = _event_days(chunk)
+    purchase = np.zeros(len(chunk), dtype=np.int8)
+    if TYPE_COLUMN in chunk.columns:
+        purchase = (chunk[TYPE_COLUMN].astype(str).str.lower() == PURCHASE_EVENT).to_numpy(dtype=np.int8)
+    shard = players % n_shards
+    order = np.argsort(shard, kind="stable")
+    bounds = np.searchsorted(shard[order], np.arange(n_shards + 1))
+    for s in np.flatnonzero(np.diff(bounds)):
+        part = order[bounds[s]:bounds[s + 1]]
+        for name, values in (("players", players), ("days", days), ("purchase", purchase)):
+            with open(os.path.join(directory, f"{s}.{name}"), "ab") as f:
+                values[part].tofile(f)
+    return int(days.min()), int(days.max())
+
+
+def _shard_counts(directory, shard, first_day, n_cohorts, n_cells):
+    ids, cell_of = _players
+    path = os.path.join(directory, str(shard))
+    players = np.fromfile(f"{path}.players", dtype=np.int64)
+    days = np.fromfile(f"{path}.days", dtype=np.int64)
+    purchase = np.fromfile(f"{path}.purchase", dtype=np.int8)
+
+    order = np.lexsort((days, players))
+    players, days, purchase = players[order], days[order], purchase[order]
+    starts = np.flatnonzero(np.r_[True, players[1:] != players[:-1]])
+    player = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(players)]))
+    first = days[starts]
+    last = days[np.r_[starts[1:], len(days)] - 1]
+
+    pos = np.minimum(np.searchsorted(ids, players[starts]), max(len(ids) - 1, 0))
+    known = (ids[pos] == players[starts]) if len(ids) else np.zeros(len(starts), dtype=bool)
+    cell = np.where(known, cell_of[pos], -1) if len(ids) else np.full(len(starts), -1)
+
+    # one entry per distinct (player, day) inside the retention window
+    offset = days - first[player]
+    distinct = np.r_[True, (players[1:] != players[:-1]) | (days[1:] != days[:-1])]
+    keep = distinct & (offset <= RETENTION_DAYS) & known[player]
+    width = RETENTION_DAYS + 1
+    flat = (cell[player[keep]] * n_cohorts + (first[player[keep]] - first_day)) * width + offset[keep]
+    # a shard touches few cohort cells, so only the non-zero counts travel back
+    cohort_cells, active = np.unique(flat, return_counts=True)
+
+    bought = np.zeros(len(starts), dtype=bool)
+    bought[player[purchase == 1]] = True
+    flags = np.stack([np.ones(len(starts), dtype=bool), last - first >= 1, last - first >= 7, bought], axis=1)
+    funnel = np.zeros((n_cells, len(FUNNEL_STAGES)), dtype=np.int64)
+    np.add.at(funnel, cell[known], flags[known].astype(np.int64))
+    return cohort_cells, active, funnel, len(players), int((~known).sum())
+
+
+class RetentionCurves:
+    # active[cell, cohort, n]: players of the cell whose first session was on
+    # day first_day + cohort and who were active again exactly n days later
+
+    def __init__(self, keys, cells, first_day, last_day, active, funnel, has_purchases, signature, stats):
+        self.keys = list(keys)
+        self.cells = cells
+        self.first_day = first_day
+        self.last_day = last_day
+        self.active = active
+        self.funnel = funnel
+        self.has_purchases = has_purchases
+        self.signature = signature
+        self.stats = stats
+
+    @classmethod
+    def from_events(cls, events_path, players, jobs=None, chunk_rows=CHUNK_ROWS, n_shards=SHARDS):
+        keys = [k for k in INDEX_COLUMNS if k in players.columns]
+        codes, cells = cell_codes(players, keys)
+        ids = players[PLAYER_COLUMN].to_numpy(dtype=np.int64)
+        order = np.argsort(ids, kind="stable")
+        ids, cell_of = ids[order], codes[order]
+
+        directory = tempfile.mkdtemp(prefix="gda-events-")
+        try:
+            first_day, last_day, has_purchases = None, None, False
+            for chunk in pd.read_csv(events_path, chunksize=chunk_rows):
+                chunk = chunk.dropna(subset=[PLAYER_COLUMN, TIME_COLUMN])
+                if not len(chunk):
+                    continue
+                has_purchases |= TYPE_COLUMN in chunk.columns
+                lo, hi = _spill(directory, chunk, n_shards)
+                first_day = lo if first_day is None else min(first_day, lo)
+                last_day = hi if last_day is None else max(last_day, hi)
+            signature = source_signature(events_path)
+            if first_day is None:
+                active = np.zeros((len(cells), 0, RETENTION_DAYS + 1), dtype=np.int32)
+                funnel = np.zeros((len(cells), len(FUNNEL_STAGES)), dtype=np.int64)
+                return cls(keys, cells, 0, 0, active, funnel, has_purchases, signature, {"events": 0})
+
+            n_cohorts = last_day - first_day + 1
+            shards = [s for s in range(n_shards) if os.path.exists(os.path.join(directory, f"{s}.players"))]
+            args = (first_day, n_cohorts, len(cells))
+            active = np.zeros(len(cells) * n_cohorts * (RETENTION_DAYS + 1), dtype=np.int32)
+            funnel = np.zeros((len(cells), len(FUNNEL_STAGES)), dtype=np.int64)
+            stats = {"events": 0, "unknown_players": 0}
+            # the id mapping reaches each worker once, through its initializer
+            with ProcessPoolExecutor(max_workers=jobs, mp_context=mp_context(),
+                                     initializer=_init_shard_worker, initargs=(ids, cell_of)) as pool:
+                for cohort_cells, counts, shard_funnel, n_events, unknown in pool.map(
+                        _shard_counts, *zip(*[(directory, s) + args for s in shards])):
+                    active[cohort_cells] += counts.astype(np.int32)
+                    funnel += shard_funnel
+                    stats["events"] += n_events
+                    stats["unknown_players"] += unknown
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        active = active.reshape(len(cells), n_cohorts, RETENTION_DAYS + 1)
+        return cls(keys, cells, first_day, last_day, active, funnel, has_purchases, signature, stats)
+
+    def query(self, selected_region, genres, genders, purchase_filter):
+        mask = np.zeros(0, dtype=bool)
+        if self.cells:
+            mask = cell_mask(cell_index(self.cells, self.keys), selected_region, genres, genders, purchase_filter)
+        funnel = dict(zip(FUNNEL_STAGES, self.funnel[mask].sum(axis=0).tolist()))
+        if not self.has_purchases:
+            funnel.pop("Purchased")
+        return RetentionView(self.first_day, self.last_day, self.active[mask].sum(axis=0, dtype=np.int64), funnel)
+
+
+class RetentionView:
+    # the cohorts of one filter selection, summed over its cells
+
+    def __init__(self, first_day, last_day, active, funnel):
+        self.first_day = first_day
+        self.last_day = last_day
+        self.active = active
+        self.funnel = funnel
+
+    def _mature(self):
+        # day N of a cohort can only be judged once the log covers it
+        cohort_day = self.first_day + np.arange(len(self.active))
+        return cohort_day[:, None] + np.arange(self.active.shape[1])[None, :] <= self.last_day
+
+    def curve(self):
+        # N-day retention over every cohort old enough for day N
+        mature = self._mature()
+        sizes = self.active[:, :1]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rate = (self.active * mature).sum(axis=0) / (sizes * mature).sum(axis=0)
+        return pd.DataFrame({"Day": np.arange(self.active.shape[1]), "RetentionRate": rate})
+
+    def retention_at(self, days):
+        rate = self.curve()["RetentionRate"].to_numpy()
+        return [float(rate[d]) if d < len(rate) else float("nan") for d in days]
+
+    def cohort_matrix(self, freq="W"):
+        # day-N retention of weekly (or monthly) join cohorts
+        if not len(self.active):
+            return None
+        days = (self.first_day + np.arange(len(self.active))).astype("datetime64[D]")
+        periods = pd.DatetimeIndex(days).to_period(freq)
+        bounds = np.flatnonzero(np.r_[True, periods[1:] != periods[:-1]])
+        mature = np.logical_and.reduceat(self._mature(), bounds, axis=0)
+        active = np.add.reduceat(self.active, bounds, axis=0)
+        sizes = active[:, 0]
+        keep = sizes > 0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rate = np.where(mature, active / np.maximum(sizes, 1)[:, None], np.nan)
+        label = periods[bounds].start_time.strftime("%Y-%m-%d")
+        return pd.DataFrame(rate[keep], index=pd.Index(label[keep], name="Cohort"),
+                            columns=pd.RangeIndex(self.active.shape[1], name="Days since first session"))
+
+
+if __name__ == "__main__":
+    from data_loader import CLEANED_CSV, load_retention
+    from store import load_store
+
+    parser = argparse.ArgumentParser(description="Compute retention cohorts from a session event log")
+    parser.add_argument("events", nargs="?", default=EVENTS_PATH)
+    parser.add_argument("--players", default=CLEANED_CSV)
+    parser.add_argument("--jobs", type=int, default=None, help="shard worker processes")
+    args = parser.parse_args()
+
+    started = time.time()
+    curves = load_retention(load_store(args.players), args.events, jobs=args.jobs)
+    view = curves.query("Global", [], [], "All")
+    print(f"{curves.stats} in {time.time() - started:.1f}s")
+    print("Day1 / Day7 / Day30 retention:", ", ".join(f"{r:.1%}" for r in view.retention_at([1, 7, 30])))
+    print("funnel:", view.funnel)
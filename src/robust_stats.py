@@ -0,0 +1,305 @@
+# @Author : Yulia
+# @File   : robust_stats.py
+# @Time   : 2026/10/18
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from corr_engine import _rank_columns, correlation_matrices, pair_table
+from pools import mp_context
+
+# Bootstrap confidence intervals and permutation p-values for every Pearson
+# and Spearman pair, with Benjamini-Hochberg correction across all tests.
+# Up to EXACT_ROWS rows each resample is an index matrix over the rows, and
+# Spearman re-ranks every resample in one batched rankdata(axis=1) call.
+# Larger inputs are split into random blocks and the bootstrap resamples the
+# per-block co-moment sums (Spearman on the full-sample ranks), so a resample
+# costs O(blocks) instead of O(rows). Permutation tests shuffle every column
+# independently; above PERMUTATION_ROWS rows the permutation null is normal to
+# many digits and the asymptotic p-value is used instead. Resamples run in fixed-size
+# batches, each seeded from one SeedSequence, spread over a process pool and
+# stop early once the interval endpoints (or all test decisions) settle;
+# the result depends on the seed only, not on the number of workers.
+
+N_RESAMPLES = 2000
+MIN_RESAMPLES = 400
+BATCH = 100
+ROUND_BATCHES = 4
+CONFIDENCE = 0.95
+CI_TOLERANCE = 0.005
+ALPHA = 0.05
+# a permutation p-value is settled once this many null values beat the observed one
+DECIDED_EXCEEDANCES = 10
+EXACT_ROWS = 5_000
+PERMUTATION_ROWS = 5_000
+BLOCKS = 2000
+# elements of one gathered (resamples x rows x columns) chunk
+CHUNK_ELEMENTS = 4_000_000
+WORKERS = int(os.environ.get("GDA_ROBUST_WORKERS", min(4, os.cpu_count() or 1)))
+
+
+def bh_adjust(p):
+    # Benjamini-Hochberg q-values; NaNs are left out of the family
+    p = np.asarray(p, dtype=np.float64)
+    q = np.full(p.shape, np.nan)
+    present = np.flatnonzero(~np.isnan(p))
+    if not len(present):
+        return q
+    order = present[np.argsort(p[present], kind="stable")]
+    m = len(order)
+    scaled = p[order] * m / np.arange(1, m + 1)
+    q[order] = np.minimum(np.minimum.accumulate(scaled[::-1])[::-1], 1.0)
+    return q
+
+
+def _swap(a):
+    return np.swapaxes(a, -1, -2)
+
+
+def _r_from_sums(n, sx, sxx, sxy):
+    # sx[..., i, j]: sum of column i over the rows where i and j are present
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = sxy - sx * _swap(sx) / n
+        var = sxx - sx * sx / n
+        r = cov / np.sqrt(var * _swap(var))
+    return np.clip(r, -1.0, 1.0)
+
+
+def _sums(X):
+    # pairwise-complete co-moment sums of (..., rows, k) -> 4 x (..., k, k)
+    valid = ~np.isnan(X)
+    M = valid.astype(np.float64)
+    X0 = np.where(valid, X, 0.0)
+    return (_swap(M) @ M, _swap(X0) @ M, _swap(X0 * X0) @ M, _swap(X0) @ X0)
+
+
+def _batch_r(X):
+    return _r_from_sums(*_sums(X))
+
+
+def _centred(X, axis=0):
+    # centring keeps the raw sums well conditioned; it does not change r
+    with np.errstate(invalid="ignore"):
+        means = np.nanmean(X, axis=axis, keepdims=True)
+    return X - np.nan_to_num(means)
+
+
+def _resample_ranks(Xb):
+    # re-ranks every resample of a (resamples, rows, k) batch in one call
+    from scipy.stats import rankdata
+
+    return _centred(rankdata(Xb, axis=1, nan_policy="omit"), axis=1)
+
+
+def _block_sums(X, n_blocks, rng):
+    # co-moment sums of a random partition of the rows into n_blocks blocks;
+    # the last block is padded with NaN rows, which count for nothing
+    n, k = X.shape
+    size = -(-n // n_blocks)
+    order = rng.permutation(n)
+    sums = np.empty((n_blocks, 4, k, k))
+    step = max(1, CHUNK_ELEMENTS // (size * k))
+    for first in range(0, n_blocks, step):
+        last = min(first + step, n_blocks)
+        rows = order[first * size:last * size]
+        part = np.full(((last - first) * size, k), np.nan)
+        part[:len(rows)] = X[rows]
+        sums[first:last] = np.stack(_sums(part.reshape(last - first, size, k)), axis=1)
+    return sums
+
+
+def _bootstrap_task(args):
+    kind, data, seed, size = args
+    rng = np.random.default_rng(seed)
+    if kind == "blocks":
+        out = []
+        for sums in data:
+            n_blocks, _, k, _ = sums.shape
+            weights = rng.multinomial(n_blocks, np.full(n_blocks, 1.0 / n_blocks), size=size).astype(np.float64)
+            resampled = (weights @ sums.reshape(n_blocks, -1)).reshape(size, 4, k, k)
+            out.append(_r_from_sums(*np.moveaxis(resampled, 1, 0)))
+        return out
+
+    X = data
+    n, k = X.shape
+    step = max(1, CHUNK_ELEMENTS // (n * k))
+    pearson, spearman = [], []
+    for start in range(0, size, step):
+        index = rng.integers(0, n, (min(step, size - start), n))
+        Xb = X[index]
+        pearson.append(_batch_r(Xb))
+        spearman.append(_batch_r(_resample_ranks(Xb)))
+    return [np.concatenate(pearson), np.concatenate(spearman)]
+
+
+def _permutation_task(args):
+    data, seed, size = args
+    rng = np.random.default_rng(seed)
+    n, k = data[0].shape
+    step = max(1, CHUNK_ELEMENTS // (n * k))
+    out = [[] for _ in data]
+    for start in range(0, size, step):
+        b = min(step, size - start)
+        for values, null in zip(data, out):
+            # every column shuffled on its own: the null for all pairs at once
+            shuffled = rng.permuted(np.repeat(values[None], b, axis=0), axis=1)
+            null.append(_batch_r(shuffled))
+    return [np.concatenate(null) for null in out]
+
+
+class _Runner:
+    # runs task batches inline or on a process pool, always in batch order
+    def __init__(self, jobs, start_method=None):
+        self.jobs = WORKERS if jobs is None else jobs
+        self.start_method = start_method
+        self.pool = None
+
+    def __enter__(self):
+        if self.jobs > 1:
+            self.pool = ProcessPoolExecutor(max_workers=self.jobs, mp_context=mp_context(self.start_method))
+        return self
+
+    def __exit__(self, *exc):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+        return False
+
+    def map(self, fn, tasks):
+        return list(self.pool.map(fn, tasks) if self.pool is not None and len(tasks) > 1 else map(fn, tasks))
+
+
+def _rounds(runner, task, head, seeds, n_resamples, settled, min_resamples=MIN_RESAMPLES):
+    # fixed rounds of fixed-size batches, so the stopping point (and every
+    # draw) depends on the seed alone
+    results, done = [], 0
+    while done < n_resamples:
+        sizes = []
+        while len(sizes) < ROUND_BATCHES and done + sum(sizes) < n_resamples:
+            sizes.append(min(BATCH, n_resamples - done - sum(sizes)))
+        batches = runner.map(task, [head + (seed, size) for seed, size in zip(seeds.spawn(len(sizes)), sizes)])
+        for batch in batches:
+            results = batch if not results else [np.concatenate([a, b]) for a, b in zip(results, batch)]
+        done += sum(sizes)
+        if done >= min_resamples and settled(results):
+            break
+    return results, done
+
+
+def _interval(samples, confidence):
+    tail = (1 - confidence) / 2 * 100
+    with np.errstate(invalid="ignore"):
+        lo, hi = np.nanpercentile(samples, [tail, 100 - tail], axis=0)
+    return lo, hi
+
+
+def _segment(runner, frame, columns, n_resamples, confidence, seed, permutations, matrices=None):
+    X = frame[columns].to_numpy(dtype=np.float64)
+    # column ranks are shared with the observed Spearman matrix
+    R = _rank_columns(X)
+    matrices = matrices if matrices is not None else correlation_matrices(frame, columns, ranks=R)
+    table = pair_table(matrices, min_rows=5)
+    if not len(table):
+        return table
+    pos = {c: i for i, c in enumerate(columns)}
+    iu, ju = table["col1"].map(pos).to_numpy(), table["col2"].map(pos).to_numpy()
+
+    X, R = _centred(X), _centred(R)
+    rng = np.random.default_rng(np.random.SeedSequence([seed, 0]))
+    if len(X) <= EXACT_ROWS:
+        kind, data = "rows", X
+    else:
+        n_blocks = min(BLOCKS, len(X) // 10)
+        kind, data = "blocks", [_block_sums(X, n_blocks, rng), _block_sums(R, n_blocks, rng)]
+    state = {"previous": None}
+
+    def converged(results):
+        ends = np.concatenate([np.concatenate(_interval(r[:, iu, ju], confidence)) for r in results])
+        previous, state["previous"] = state["previous"], ends
+        return previous is not None and np.nanmax(np.abs(ends - previous), initial=0.0) < CI_TOLERANCE
+
+    boot, used = _rounds(runner, _bootstrap_task, (kind, data), np.random.SeedSequence([seed, 1]),
+                         n_resamples, converged)
+    for name, samples in zip(("pearson", "spearman"), boot):
+        lo, hi = _interval(samples[:, iu, ju], confidence)
+        table[f"{name}_lo"], table[f"{name}_hi"] = lo, hi
+    table["bootstrap"] = "rows" if kind == "rows" else f"{data[0].shape[0]} blocks"
+    table["resamples"] = used
+
+    table["pearson_perm_p"], table["spearman_perm_p"], table["permutations"] = np.nan, np.nan, 0
+    if permutations and len(X) <= PERMUTATION_ROWS:
+        perm_data = [X, R]
+        observed = [np.abs(_batch_r(v[None])[0][iu, ju]) for v in perm_data]
+        m = len(table) * 2
+
+        def decided(results):
+            settled = True
+            for null, obs in zip(results, observed):
+                exceed = (np.abs(null[:, iu, ju]) >= obs - 1e-12).sum(axis=0)
+                p = (exceed + 1) / (len(null) + 1)
+                settled &= bool(((exceed >= DECIDED_EXCEEDANCES) | (p < ALPHA / m)).all())
+            return settled
+
+        nulls, n_perm = _rounds(runner, _permutation_task, (perm_data,), np.random.SeedSequence([seed, 2]),
+                                n_resamples, decided)
+        for name, null, obs in zip(("pearson", "spearman"), nulls, observed):
+            exceed = (np.abs(null[:, iu, ju]) >= obs - 1e-12).sum(axis=0)
+            table[f"{name}_perm_p"] = (exceed + 1) / (n_perm + 1)
+        table["permutations"] = n_perm
+    return table
+
+
+def robust_correlations(df, columns, by=None, n_resamples=N_RESAMPLES, confidence=CONFIDENCE, seed=0,
+                        permutations=True, jobs=None, matrices=None, start_method=None):
+    # one row per (segment,) column pair: r, bootstrap interval, permutation
+    # p-value, and BH q-values over every test in the table
+    segments = [(None, df)] if by is None else list(df.groupby(by, observed=True))
+    tables = []
+    with _Runner(jobs, start_method) as runner:
+        for i, (segment, frame) in enumerate(segments):
+            table = _segment(runner, frame, columns, n_resamples, confidence, [seed, i], permutations,
+                             matrices=matrices if by is None else None)
+            if by is not None:
+                table.insert(0, by if isinstance(by, str) else "segment", [segment] * len(table))
+            tables.append(table)
+    table = pd.concat(tables, ignore_index=True) if tables else pd.DataFrame()
+    if not len(table):
+        return table
+
+    # the family is every test reported: both coefficients of every pair (and
+    # segment), by permutation where it ran and asymptotically elsewhere
+    p = np.stack([table[f"{name}_perm_p"].fillna(table[f"{name}_p"]) for name in ("pearson", "spearman")], axis=1)
+    q = bh_adjust(p.ravel()).reshape(p.shape)
+    table["pearson_q"], table["spearman_q"] = q[:, 0], q[:, 1]
+    table["significant"] = (table["pearson_q"] < ALPHA) | (table["spearman_q"] < ALPHA)
+    return table
+
+
+if __name__ == "__main__":
+    from corr_engine import numeric_columns
+    from data_loader import CLEANED_CSV
+    from store import load_store
+
+    parser = argparse.ArgumentParser(description="Bootstrap intervals and permutation tests for all correlation pairs")
+    parser.add_argument("--players", default=CLEANED_CSV)
+    parser.add_argument("--by", default=None, help="segment column, e.g. Location or GameGenre")
+    parser.add_argument("--resamples", type=int, default=N_RESAMPLES)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes")
+    parser.add_argument("--out", default=None, help="write the table to this CSV file")
+    args = parser.parse_args()
+
+    df = load_store(args.players)
+    started = time.time()
+    table = robust_correlations(df, numeric_columns(df), by=args.by, n_resamples=args.resamples, seed=args.seed,
+                                jobs=args.jobs)
+    print(f"{len(table)} tests on {len(df)} rows in {time.time() - started:.1f}s, "
+          f"{int(table['significant'].sum())} significant after BH correction")
+    if args.out:
+        table.to_csv(args.out, index=False)
+    else:
+        print(table.to_string(index=False))
@@ -0,0 +1,225 @@
+# @Author : Yulia
+# @File   : segment_compare.py
+# @Time   : 2026/10/18
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from cluster_engine import CLUSTER_FEATURES, fit_clusters
+from cube import CUBE_KEYS, cell_index, cell_mask
+from incremental import CoMoments
+from instrument import span
+from model_registry import TARGET, feature_columns, get_or_train
+from result_cache import frame_fingerprint
+from retention_engine import FUNNEL_STAGES, RetentionView
+
+# Every module for many segments at once. A segment is a sidebar filter,
+# optionally narrowed to one value of a dimension (Location, GameGenre, ...).
+# The cube, co-moment and retention tables are keyed by the same cells, so a
+# (segments x cells) membership matrix turns each per-cell table into the
+# per-segment totals of all segments in one product. Only the models need
+# rows: the selection is scanned once, split by segment, and each segment's
+# KMeans and payer model is fitted in parallel (and kept in the registries
+# under the same keys the single-segment views use).
+
+DIMENSIONS = list(CUBE_KEYS)
+VALUE_LABELS = {"InGamePurchases": {0: "Not-paid", 1: "Paid"}}
+RETENTION_DAYS = [1, 7, 30]
+
+
+class Segment:
+    def __init__(self, label, selected_region="Global", genres=(), genders=(), purchase_filter="All", by=None,
+                 value=None):
+        self.label = label
+        self.filters = (selected_region, list(genres), list(genders), purchase_filter)
+        self.by = by
+        self.value = value
+
+    def mask(self, index):
+        # cells of a cell-keyed index in this segment; None if the index is
+        # not split by the segment's dimension
+        if self.by is not None and self.by not in index.names:
+            return None
+        mask = cell_mask(index, *self.filters)
+        if self.by is not None:
+            mask &= index.get_level_values(self.by) == self.value
+        return mask
+
+    def rows(self, df, index):
+        rows = index.select(*self.filters)
+        if self.by is not None:
+            rows = rows[df[self.by].to_numpy()[rows] == self.value]
+        return rows
+
+
+def segments_by(cube, by, selected_region="Global", genres=(), genders=(), purchase_filter="All"):
+    # one segment per value of `by` present under the base filter
+    values = cube.query(selected_region, genres, genders, purchase_filter).counts(by).index
+    labels = VALUE_LABELS.get(by, {})
+    return [Segment(str(labels.get(v, v)), selected_region, genres, genders, purchase_filter, by=by, value=v)
+            for v in sorted(values)]
+
+
+def membership(index, segments):
+    # (segments x cells) 0/1 matrix, or None if any segment cannot be told apart
+    masks = [segment.mask(index) for segment in segments]
+    if any(mask is None for mask in masks):
+        return None
+    return np.stack(masks).astype(np.int64) if masks else np.zeros((0, len(index)), dtype=np.int64)
+
+
+def segment_metrics(cube, segments):
+    # overview metrics of every segment, segments as columns
+    S = membership(cube.table.index, segments)
+    table = cube.table
+    level = table.index.get_level_values
+    count = table["count"].to_numpy(dtype=np.float64)
+    players = S @ count
+    with np.errstate(invalid="ignore", divide="ignore"):
+        metrics = pd.DataFrame({
+            "Players": players.astype(np.int64),
+            "Average age": S @ table["sum_Age"].to_numpy() / players,
+            "Paying share": S @ (np.asarray(level("InGamePurchases"), dtype=np.float64) * count) / players,
+            "Average sessions": S @ table["sum_SessionsPerWeek"].to_numpy() / players,
+            "High engagement share": S @ ((level("EngagementLevel") == "High") * count) / players,
+        }, index=[s.label for s in segments])
+    return metrics.T
+
+
+def segment_retention(cube, segments, curves=None):
+    # Day-N retention, funnel counts and (with an event log) retention curves
+    # per segment; without a log, or when the log's cells are not split by
+    # the compared dimension, retention is approximated from SessionsPerWeek
+    labels = [s.label for s in segments]
+    C = membership(cube.table.index, segments)
+    count = cube.table["count"].to_numpy(dtype=np.float64)
+    players = C @ count
+
+    S = membership(cell_index(curves.cells, curves.keys), segments) if curves is not None else None
+    if S is not None:
+        active = np.tensordot(S, curves.active, axes=1)
+        views = [RetentionView(curves.first_day, curves.last_day, a, None) for a in active]
+        retention = pd.DataFrame([v.retention_at(RETENTION_DAYS) for v in views], index=labels,
+                                 columns=[f"Day{d}" for d in RETENTION_DAYS])
+        funnels = pd.DataFrame(S @ curves.funnel, index=labels, columns=FUNNEL_STAGES)
+        if not curves.has_purchases:
+            funnels = funnels.drop(columns="Purchased")
+        funnels.insert(0, "All Players", players.astype(np.int64))
+        curve = pd.concat([v.curve().assign(Segment=label) for v, label in zip(views, labels)], ignore_index=True)
+        return retention, funnels, curve, "session events"
+
+    level = cube.table.index.get_level_values
+    hist = cube.hists["SessionsPerWeek"]
+    sessions = hist.columns.to_numpy()
+
+    def at_least(threshold):
+        return C @ hist.to_numpy()[:, sessions >= threshold].sum(axis=1)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        retention = pd.DataFrame({"Day1": at_least(1) / players, "Day7": at_least(2) / players,
+                                  "Day30": at_least(4) / players}, index=labels)
+    funnels = pd.DataFrame({
+        "All Players": players,
+        "Active (≥2/wk)": at_least(2),
+        "Highly Engaged": C @ ((level("EngagementLevel") == "High") * count),
+        "Paying Players": C @ (np.asarray(level("InGamePurchases"), dtype=np.float64) * count),
+    }, index=labels).astype(np.int64)
+    return retention, funnels, None, "SessionsPerWeek"
+
+
+def segment_correlations(moments, segments, columns=None):
+    # Pearson matrix of every segment from the exact per-cell co-moments
+    cells = list(moments.cells)
+    S = membership(cell_index(cells, moments.keys), segments)
+    columns = moments.columns if columns is None else list(columns)
+    matrices = {}
+    for segment, mask in zip(segments, S.astype(bool)):
+        subset = CoMoments(moments.keys, moments.columns, moments.scales,
+                           {cell: moments.cells[cell] for cell, keep in zip(cells, mask) if keep})
+        r, n = subset.pearson(columns)
+        matrices[segment.label] = pd.DataFrame(np.where(n >= 5, r, np.nan), index=columns, columns=columns)
+    return matrices
+
+
+def pair_columns(matrices):
+    # correlation pairs as rows, segments side by side
+    if not matrices:
+        return pd.DataFrame()
+    columns = next(iter(matrices.values())).columns.tolist()
+    iu, ju = np.triu_indices(len(columns), k=1)
+    pairs = [f"{columns[i]} vs {columns[j]}" for i, j in zip(iu, ju)]
+    return pd.DataFrame({label: m.to_numpy()[iu, ju] for label, m in matrices.items()},
+                        index=pd.Index(pairs, name="Variable Pairs"))
+
+
+def _fit_segment(frame):
+    # same model keys as the Cluster Analysis and Predictive Modeling views
+    out = {"Rows": len(frame), "Clusters": np.nan, "Silhouette": np.nan, "Accuracy": np.nan}
+    data_clu = frame[CLUSTER_FEATURES].dropna()
+    if len(data_clu) > 10:
+        key = frame_fingerprint(data_clu, CLUSTER_FEATURES + ["k=None"])
+        # segments already run in parallel, so candidates are fitted in turn
+        model = fit_clusters(data_clu.to_numpy(dtype="float64"), CLUSTER_FEATURES, key=key, n_jobs=1)
+        out.update(Clusters=model.k, Silhouette=model.silhouette)
+    needed = feature_columns(frame) + [TARGET]
+    model_data = frame[needed].dropna()
+    if len(model_data) > 50 and model_data[TARGET].nunique() >= 2:
+        key = frame_fingerprint(model_data, needed + ["cv=0"])
+        _, metadata = get_or_train(model_data, key)
+        out["Accuracy"] = metadata["metrics"]["accuracy"]
+    return out
+
+
+def segment_models(df, index, segments, n_jobs=-1):
+    # KMeans and payer model per segment, fitted in parallel
+    columns = list(dict.fromkeys(CLUSTER_FEATURES + feature_columns(df) + [TARGET]))
+    frames = [df[columns].take(segment.rows(df, index)) for segment in segments]
+    results = Parallel(n_jobs=n_jobs if len(frames) > 1 else 1)(delayed(_fit_segment)(frame) for frame in frames)
+    return pd.DataFrame(results, index=[s.label for s in segments]).T
+
+
+def compare_segments(df, index, cube, moments, segments, curves=None, models=True, n_jobs=-1):
+    result = {"segments": [s.label for s in segments]}
+    with span("segment metrics", segments=len(segments)):
+        result["metrics"] = segment_metrics(cube, segments)
+    with span("segment retention", segments=len(segments)):
+        retention, funnels, curve, source = segment_retention(cube, segments, curves)
+    result.update(retention=retention, funnels=funnels, curves=curve, retention_source=source)
+    with span("segment correlations", segments=len(segments)):
+        result["correlations"] = segment_correlations(moments, segments)
+    if models:
+        with span("segment models", segments=len(segments)):
+            result["models"] = segment_models(df, index, segments, n_jobs=n_jobs)
+    return result
+
+
+if __name__ == "__main__":
+    from data_loader import load_data, load_filter_index, load_cube, load_moments, load_retention
+
+    parser = argparse.ArgumentParser(description="Compare every module across the values of one dimension")
+    parser.add_argument("--by", default="Location", choices=DIMENSIONS)
+    parser.add_argument("--region", default="Global")
+    parser.add_argument("--purchase", default="All", choices=["All", "Paid players", "Not-paid players"])
+    parser.add_argument("--no-models", action="store_true", help="skip the per-segment KMeans and payer models")
+    parser.add_argument("--jobs", type=int, default=-1, help="parallel model fits")
+    args = parser.parse_args()
+
+    df, _ = load_data()
+    started = time.time()
+    cube = load_cube(df)
+    segments = segments_by(cube, args.by, args.region, purchase_filter=args.purchase)
+    result = compare_segments(df, load_filter_index(df), cube, load_moments(df), segments,
+                              curves=load_retention(df), models=not args.no_models, n_jobs=args.jobs)
+    print(f"{len(segments)} segments by {args.by} in {time.time() - started:.1f}s\n")
+    print(result["metrics"].round(3).to_string(), "\n")
+    print(f"Retention ({result['retention_source']}):")
+    print(result["retention"].round(3).to_string(), "\n")
+    print(result["funnels"].to_string(), "\n")
+    print(pair_columns(result["correlations"]).round(3).to_string())
+    if "models" in result:
+        print()
+        print(result["models"].round(3).to_string())
@@ -0,0 +1,123 @@
+# @Author : Yulia
+# @File   : shared.py
+# @Time   : 2026/10/18
+
+import contextvars
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from data_loader import CLEANED_CSV, EUROPE_CSV, load_data, load_filter_index, load_cube, load_moments, load_timeline, load_retention
+from instrument import count
+from retention_engine import EVENTS_PATH
+from store import is_stale, read_manifest, source_signature, store_path
+
+# Process-wide objects shared by every session of the dashboard server: one
+# read-only, memory-mapped dataset with its index and aggregates, and one
+# bounded pool for heavy jobs. Identical requests that are already running
+# are merged onto the same future, so concurrent sessions compute them once.
+
+JOB_WORKERS = int(os.environ.get("GDA_JOB_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+SOURCES = [CLEANED_CSV, EUROPE_CSV]
+
+
+def _events_signature():
+    return source_signature(EVENTS_PATH) if EVENTS_PATH and os.path.exists(EVENTS_PATH) else None
+
+
+class Dataset:
+    # one immutable snapshot of the stores; sessions only ever read it
+    def __init__(self):
+        self.df, self.df_europe = load_data()
+        self.versions = (self.df.attrs.get("store_version"), self.df_europe.attrs.get("store_version"))
+        self.events = _events_signature()
+        self.index = load_filter_index(self.df)
+        self.cube = load_cube(self.df)
+        self.moments = load_moments(self.df)
+        self.timeline = load_timeline(self.df)
+        # None when no session event log is configured
+        self.retention = load_retention(self.df)
+
+
+class DataService:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dataset = None
+
+    def _current(self):
+        if any(is_stale(source) for source in SOURCES):
+            return False
+        manifests = [read_manifest(store_path(source)) for source in SOURCES]
+        if self._dataset.events != _events_signature():
+            return False
+        return self._dataset.versions == tuple(m and m["version"] for m in manifests)
+
+    def dataset(self):
+        # a rebuilt or appended store is picked up on the next rerun; sessions
+        # holding the old snapshot keep a consistent view until they rerun
+        with self._lock:
+            if self._dataset is None or not self._current():
+                self._dataset = Dataset()
+            return self._dataset
+
+
+def _done(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+class JobPool:
+    def __init__(self, cache, max_workers=JOB_WORKERS):
+        self.cache = cache
+        self.max_workers = max_workers
+        self.merged = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gda-job")
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key):
+        # called with the lock held
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.merged += 1
+            count("job merged with in-flight request")
+        return future
+
+    def submit(self, key, compute):
+        missing = object()
+        with self._lock:
+            future = self._join(key)
+        if future is not None:
+            return future
+        # the lookup may unpickle from disk, so it must not hold up other sessions;
+        # a job finishing in between only means this request computes it again
+        value = self.cache.get(key, missing)
+        if value is not missing:
+            count("result cache hit")
+            return _done(value)
+        with self._lock:
+            future = self._join(key)
+            if future is not None:
+                return future
+            count("result cache miss")
+            # the job runs in the caller's context, so its spans land in the caller's trace
+            future = self._executor.submit(contextvars.copy_context().run, self._run, key, compute)
+            self._in_flight[key] = future
+            return future
+
+    def _run(self, key, compute):
+        try:
+            value = compute()
+            self.cache.put(key, value)
+            return value
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def run(self, key, compute):
+        return self.submit(key, compute).result()
+
+    def stats(self):
+        with self._lock:
+            return {"workers": self.max_workers, "in_flight": len(self._in_flight), "merged": self.merged}
@@ -3,52 +3,54 @@
 # @Time   : 2025/9/3
 
 import streamlit as st
-import pandas as pd
-import numpy as np
 import plotly.express as px
-
-
-def render_trend(filtered_data, render=True):
-    # Make a copy of the data to avoid contaminating the original data
-    tmp = filtered_data.copy()
-
-    if "JoinDate" not in tmp.columns:
-        np.random.seed(42)
-        tmp["JoinDate"] = pd.to_datetime(
-            np.random.choice(pd.date_range("2024-01-01", "2024-12-31"), size=len(tmp))
-        )
-
-    tmp["Month"] = tmp["JoinDate"].dt.to_period("M").astype(str)
-    if "PlayerID" not in tmp.columns:
-        tmp["PlayerID"] = range(1, len(tmp) + 1)
-
-    # Generate trend data
-    trend = tmp.groupby("Month").agg({
-        "PlayerID": "count",
-        "InGamePurchases": "sum",
-        "SessionsPerWeek": "mean"
-    }).reset_index()
-
-    trend.rename(columns={
-        "PlayerID": "New Players",
-        "InGamePurchases": "Paying Players",
-        "SessionsPerWeek": "Average Sessions"
-    }, inplace=True)
-
-    fig_new = px.line(trend, x="Month", y="New Players", markers=True,
-                      title="📈 New Players per Month")
-    fig_purchase_trend = px.line(trend, x="Month", y="Paying Players", markers=True,
-                                 title="💰 Paying Players per Month")
-    fig_sessions_trend = px.line(trend, x="Month", y="Average Sessions", markers=True,
-                                 title="🕹️ Average Sessions per Month")
+from figure_data import LazyFigures
+from trend_engine import FREQS, Timeline
+
+
+def render_trend(filtered_data, render=True, timeline=None, freq="M", window=1):
+    # timeline: the maintained rollups already narrowed to the sidebar filters;
+    # without one they are built from the rows (no copy of the frame)
+    view = timeline if timeline is not None else Timeline.from_frame(filtered_data).view()
+    trend = view.series(freq, window=window)
+    cohorts = view.cohort_matrix("W" if freq == "D" else freq, window) if view.has_cohorts else None
+    return _trend_figures(trend, cohorts, freq, window, render)
+
+
+def _trend_figures(trend, cohorts, freq, window, render):
+    period = FREQS[freq]
+    suffix = f" ({window}-{period.lower()} rolling)" if window > 1 else ""
+    figs = LazyFigures()
+    figs.add("New Players Trend", px.line, trend, x=period, y="New Players", markers=True,
+             title=f"📈 New Players per {period}{suffix}")
+    figs.add("Purchase Trend", px.line, trend, x=period, y="Paying Players", markers=True,
+             title=f"💰 Paying Players per {period}{suffix}")
+    figs.add("Average Sessions Trend", px.line, trend, x=period, y="Average Sessions", markers=True,
+             title=f"🕹️ Average Sessions per {period}{suffix}")
+    if "Active Players" in trend.columns:
+        figs.add("Active Players Trend", px.line, trend, x=period, y="Active Players", markers=True,
+                 title=f"👥 Active Players at the end of each {period}")
+    if cohorts is not None:
+        figs.add("Cohort Retention", px.imshow, cohorts.drop(columns="Players"), text_auto=".0%",
+                 aspect="auto", color_continuous_scale="Blues", title="📅 Cohort Retention")
 
     if render:
-        st.subheader("📊 Simulation Trend Analysis")
-        col10, col11 = st.columns(2)
-        with col10:
-            st.plotly_chart(fig_new, use_container_width=True)
-        with col11:
-            st.plotly_chart(fig_purchase_trend, use_container_width=True)
-        st.plotly_chart(fig_sessions_trend, use_container_width=True)
-
-    return fig_new, fig_purchase_trend, fig_sessions_trend
+        show_trend(trend, figs)
+
+    return trend, figs
+
+
+def show_trend(trend, figs):
+    simulated = trend.attrs.get("simulated", True)
+    st.subheader("📊 Simulation Trend Analysis" if simulated else "📊 Trend Analysis")
+    if simulated:
+        st.caption("No JoinDate column in the data: join dates are simulated over 2024.")
+    col10, col11 = st.columns(2)
+    with col10:
+        st.plotly_chart(figs["New Players Trend"], use_container_width=True)
+    with col11:
+        st.plotly_chart(figs["Purchase Trend"], use_container_width=True)
+    st.plotly_chart(figs["Average Sessions Trend"], use_container_width=True)
+    for title in ("Active Players Trend", "Cohort Retention"):
+        if title in figs:
+            st.plotly_chart(figs[title], use_container_width=True)
@@ -0,0 +1,456 @@
+# @Author : Yulia
+# @File   : store.py
+# @Time   : 2026/10/18
+
+import glob
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+# Columnar on-disk player store: one raw binary file per column plus a JSON
+# manifest. Text columns (Location, GameGenre, Gender, ...) are dictionary
+# encoded, numeric columns use the narrowest dtype that holds them losslessly,
+# and everything is memory-mapped read-only when loaded. Each build goes to its
+# own versioned directory; the store path is a symlink switched atomically to
+# the newest one, so it always resolves to a complete store.
+
+STORE_ROOT = os.environ.get("GDA_STORE_DIR", ".store")
+MANIFEST = "manifest.json"
+ARTIFACT_DIR = "artifacts"
+FORMAT_VERSION = 1
+
+INT_DTYPES = [np.int8, np.int16, np.int32, np.int64]
+CHUNK_ROWS = 1 << 20
+
+_publish_lock = threading.Lock()
+
+
+def store_path(source):
+    name = os.path.splitext(os.path.basename(source))[0]
+    return os.path.join(STORE_ROOT, name)
+
+
+def source_signature(source):
+    st = os.stat(source)
+    return {"path": os.path.abspath(source), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _narrow_int(lo, hi):
+    for dtype in INT_DTYPES:
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def _rewrite_column(src, dst, src_dtype, n_rows, convert):
+    # converts a column file chunk by chunk, so peak memory stays one chunk
+    tmp = f"{dst}.tmp-{os.getpid()}"
+    if n_rows:
+        values = np.memmap(src, dtype=src_dtype, mode="r", shape=(n_rows,))
+        with open(tmp, "wb") as f:
+            for start in range(0, n_rows, CHUNK_ROWS):
+                np.ascontiguousarray(convert(values[start:start + CHUNK_ROWS])).tofile(f)
+        del values
+    else:
+        open(tmp, "wb").close()
+    os.replace(tmp, dst)
+
+
+def _version_dir(path):
+    # names sort by publish time; the pid and thread keep concurrent builds apart
+    return f"{path}.v{time.time_ns():020d}-{os.getpid()}-{threading.get_ident()}"
+
+
+def _publish(tmp, path):
+    # build in a private directory, move it to a versioned one and switch the
+    # symlink at `path` with os.replace: readers resolve either the previous
+    # complete store or the new one, never a missing or half-written one.
+    # Publishes are serialized, so versions become current in name order.
+    with _publish_lock:
+        previous = os.path.realpath(path) if os.path.islink(path) else None
+        if previous is None and os.path.isdir(path):
+            # a store from before versioned directories: moved aside once
+            previous = _version_dir(path)
+            os.rename(path, previous)
+        target = _version_dir(path)
+        try:
+            os.rename(tmp, target)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        link = f"{path}.link-{os.getpid()}-{threading.get_ident()}"
+        os.symlink(os.path.basename(target), link, target_is_directory=True)
+        os.replace(link, path)
+        if previous is not None:
+            # the version just replaced stays for readers that resolved it a
+            # moment ago; anything older is no longer reachable
+            for old in glob.glob(glob.escape(path) + ".v" + "[0-9]" * 20 + "-*"):
+                if os.path.basename(old) < os.path.basename(previous):
+                    shutil.rmtree(old, ignore_errors=True)
+
+
+class StoreWriter:
+    # Appends DataFrame chunks column by column. Numeric columns are staged as
+    # float64 and text columns as int32 codes; finalize() narrows every column
+    # in a streaming rewrite, so peak memory is one chunk regardless of size.
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        shutil.rmtree(self.tmp, ignore_errors=True)
+        os.makedirs(self.tmp)
+        self.n_rows = 0
+        self.columns = {}
+
+    def _file(self, col):
+        return os.path.join(self.tmp, f"{col}.bin")
+
+    def _new_column(self, series):
+        if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+            return {"kind": "numeric", "lo": np.inf, "hi": -np.inf, "integral": True,
+                    "has_nan": False, "f32_exact": True}
+        return {"kind": "categorical", "codes": {}}
+
+    def append(self, df):
+        if not self.columns:
+            self.columns = {col: self._new_column(df[col]) for col in df.columns}
+        elif list(df.columns) != list(self.columns):
+            raise ValueError("All chunks must have the same columns in the same order")
+
+        for col, state in self.columns.items():
+            series = df[col]
+            if state["kind"] == "numeric":
+                if not (pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series)):
+                    raise ValueError(f"Column {col} changed from numeric to text")
+                values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+                self._track(state, values)
+            else:
+                codes = state["codes"]
+                for value in pd.unique(series.dropna()):
+                    codes.setdefault(str(value), len(codes))
+                cat = pd.Categorical(series.astype("string"), categories=list(codes))
+                values = cat.codes.astype(np.int32)
+            with open(self._file(col), "ab") as f:
+                np.ascontiguousarray(values).tofile(f)
+        self.n_rows += len(df)
+
+    @staticmethod
+    def _track(state, values):
+        present = values[~np.isnan(values)]
+        state["has_nan"] |= len(present) < len(values)
+        if len(present):
+            state["lo"] = min(state["lo"], float(present.min()))
+            state["hi"] = max(state["hi"], float(present.max()))
+            state["integral"] &= bool((np.floor(present) == present).all())
+            state["f32_exact"] &= bool((present.astype(np.float32).astype(np.float64) == present).all())
+
+    def _target(self, state):
+        if state["kind"] == "categorical":
+            categories = sorted(state["codes"])
+            # staged codes follow first appearance; remap them to sorted order
+            remap = np.empty(len(categories) + 1, dtype=np.int64)
+            remap[-1] = -1
+            for new_code, value in enumerate(categories):
+                remap[state["codes"][value]] = new_code
+            dtype = _narrow_int(-1, max(len(categories) - 1, 0))
+            meta = {"kind": "categorical", "dtype": dtype.name, "categories": categories}
+            return np.dtype(np.int32), lambda codes: remap[codes].astype(dtype), meta
+
+        if state["integral"] and not state["has_nan"]:
+            lo, hi = (state["lo"], state["hi"]) if self.n_rows else (0, 0)
+            dtype = _narrow_int(lo, hi)
+        else:
+            dtype = np.dtype(np.float32) if state["f32_exact"] else np.dtype(np.float64)
+        return np.dtype(np.float64), lambda values: values.astype(dtype), {"kind": "numeric", "dtype": dtype.name}
+
+    def _rewrite(self, col, staged_dtype, convert):
+        _rewrite_column(self._file(col), self._file(col), staged_dtype, self.n_rows, convert)
+
+    @property
+    def artifact_dir(self):
+        # writers may stream artifact side files here before the store is published
+        return artifact_dir(self.tmp)
+
+    def finalize(self, source=None, artifacts=None):
+        columns = {}
+        for col, state in self.columns.items():
+            staged_dtype, convert, meta = self._target(state)
+            self._rewrite(col, staged_dtype, convert)
+            columns[col] = meta
+
+        signature = source_signature(source) if source else None
+        version = hashlib.sha1(json.dumps([signature, self.n_rows, columns], sort_keys=True).encode()).hexdigest()[:16]
+        manifest = {
+            "format": FORMAT_VERSION,
+            "version": version,
+            "source": signature,
+            "n_rows": self.n_rows,
+            "columns": columns,
+        }
+        with open(os.path.join(self.tmp, MANIFEST), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        for name, obj in (artifacts or {}).items():
+            # published together with the columns, so no reader sees the store without them
+            _write_artifact(os.path.join(self.artifact_dir, f"{name}.pkl"), version, obj)
+        _publish(self.tmp, self.path)
+        return manifest
+
+    def abort(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+
+def build_store(source, path=None, chunk_rows=CHUNK_ROWS):
+    writer = StoreWriter(path or store_path(source))
+    try:
+        for chunk in pd.read_csv(source, chunksize=chunk_rows):
+            writer.append(chunk)
+        return writer.finalize(source)
+    except BaseException:
+        writer.abort()
+        raise
+
+
+def _fits(values, dtype):
+    present = values[~np.isnan(values)]
+    if dtype.kind == "i":
+        info = np.iinfo(dtype)
+        return len(present) == len(values) and bool((np.floor(present) == present).all()) \
+            and (not len(present) or (info.min <= present.min() and present.max() <= info.max))
+    if dtype == np.float32:
+        return bool((present.astype(np.float32).astype(np.float64) == present).all())
+    return True
+
+
+def _holds(dtype, old):
+    if old.kind == "f":
+        return dtype.kind == "f" and dtype.itemsize >= old.itemsize
+    if dtype.kind == "i":
+        return dtype.itemsize >= old.itemsize
+    # float32 is exact for int8/int16 values, float64 for anything up to int32
+    return old.itemsize <= (2 if dtype.itemsize == 4 else 4)
+
+
+def _widen(dtype, values):
+    # smallest dtype that holds both the stored column and the new values
+    ladder = [np.dtype(d) for d in INT_DTYPES + [np.float32, np.float64]]
+    return next((d for d in ladder if _holds(d, dtype) and _fits(values, d)), np.dtype(np.float64))
+
+
+def _write_manifest(path, manifest):
+    tmp = os.path.join(path, f"{MANIFEST}.tmp-{os.getpid()}")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, os.path.join(path, MANIFEST))
+
+
+def _column_file(path, col, meta):
+    return os.path.join(path, meta.get("file", f"{col}.bin"))
+
+
+def append_store(path, df):
+    # Appends rows to a published store in place. Column files only grow, so
+    # readers that mapped the previous manifest keep a consistent view; a column
+    # that needs new categories or a wider dtype is rewritten to a new file.
+    # The previous (version, n_rows) is recorded in the manifest lineage so
+    # derived artifacts can fold just the appended tail.
+    path = os.path.realpath(path)
+    manifest = read_manifest(path)
+    if manifest is None:
+        raise FileNotFoundError(f"No player store found at {path}")
+    if list(df.columns) != list(manifest["columns"]):
+        raise ValueError("Appended rows must have the store's columns in the same order")
+
+    n_rows = manifest["n_rows"]
+    digest = hashlib.sha1(f"{manifest['version']}:{len(df)}".encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    version = digest.hexdigest()[:16]
+
+    columns, replaced = {}, []
+    for col, meta in manifest["columns"].items():
+        meta = dict(meta)
+        src = _column_file(path, col, meta)
+        dtype = np.dtype(meta["dtype"])
+        series = df[col]
+        if meta["kind"] == "categorical":
+            old = meta["categories"]
+            new = {str(v) for v in pd.unique(series.dropna())} - set(old)
+            categories = sorted(old + list(new))
+            target = _narrow_int(-1, max(len(categories) - 1, 0)) if new else dtype
+            if new:
+                remap = np.empty(len(old) + 1, dtype=np.int64)
+                remap[-1] = -1
+                remap[:len(old)] = [categories.index(v) for v in old]
+                meta.update(categories=categories, dtype=target.name)
+                convert = lambda codes, remap=remap, target=target: remap[codes].astype(target)
+            values = pd.Categorical(series.astype("string"), categories=categories).codes.astype(target)
+        else:
+            values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+            target = dtype if _fits(values, dtype) else _widen(dtype, values)
+            meta["dtype"] = target.name
+            convert = lambda chunk, target=target: chunk.astype(target)
+            values = values.astype(target)
+
+        if meta != manifest["columns"][col]:
+            meta["file"] = f"{col}.{version}.bin"
+            _rewrite_column(src, _column_file(path, col, meta), dtype, n_rows, convert)
+            replaced.append(src)
+        else:
+            # drop anything a failed earlier append left past the last row
+            os.truncate(src, n_rows * dtype.itemsize)
+        with open(_column_file(path, col, meta), "ab") as f:
+            np.ascontiguousarray(values).tofile(f)
+        columns[col] = meta
+
+    lineage = manifest.get("lineage", []) + [[manifest["version"], n_rows]]
+    manifest = dict(manifest, version=version, n_rows=n_rows + len(df), columns=columns, lineage=lineage)
+    _write_manifest(path, manifest)
+    for src in replaced:
+        # mapped readers keep the old inode alive until they close it
+        os.remove(src)
+    return manifest
+
+
+def read_manifest(path):
+    try:
+        with open(os.path.join(path, MANIFEST), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_stale(source, path=None):
+    manifest = read_manifest(path or store_path(source))
+    if manifest is None or manifest.get("format") != FORMAT_VERSION:
+        return True
+    signature = manifest.get("source") or {}
+    if signature.get("path") != os.path.abspath(source) or not os.path.exists(source):
+        # written by another pipeline (the raw ingest), which owns its refresh
+        return False
+    current = source_signature(source)
+    return signature.get("size") != current["size"] or signature.get("mtime_ns") != current["mtime_ns"]
+
+
+def _map_column(path, col, meta, n_rows):
+    dtype = np.dtype(meta["dtype"])
+    if n_rows == 0:
+        values = np.empty(0, dtype=dtype)
+    else:
+        values = np.memmap(_column_file(path, col, meta), dtype=dtype, mode="r", shape=(n_rows,))
+    if meta["kind"] == "categorical":
+        return pd.Categorical.from_codes(values, categories=meta["categories"])
+    return values
+
+
+def open_store(path):
+    # resolved once, so the manifest and the columns come from the same
+    # version; retried if a newer build replaced that version meanwhile
+    while True:
+        resolved = os.path.realpath(path)
+        try:
+            return _open_version(resolved)
+        except (OSError, ValueError):
+            if os.path.realpath(path) == resolved:
+                raise
+
+
+def _open_version(path):
+    manifest = read_manifest(path)
+    if manifest is None:
+        raise FileNotFoundError(f"No player store found at {path}")
+
+    n_rows = manifest["n_rows"]
+    data = {col: _map_column(path, col, meta, n_rows) for col, meta in manifest["columns"].items()}
+    df = pd.DataFrame(data, copy=False)
+    df.attrs["store_version"] = manifest["version"]
+    df.attrs["store_path"] = path
+    df.attrs["store_rows"] = n_rows
+    df.attrs["store_lineage"] = {version: rows for version, rows in manifest.get("lineage", [])}
+    return df
+
+
+def load_store(source, path=None):
+    path = path or store_path(source)
+    if is_stale(source, path):
+        build_store(source, path)
+    return open_store(path)
+
+
+def artifact_dir(path):
+    return os.path.join(path, ARTIFACT_DIR)
+
+
+def _artifact_path(df, name):
+    path = df.attrs.get("store_path")
+    # attrs survive filtering in pandas, so only the full store frame qualifies
+    if not path or len(df) != df.attrs.get("store_rows"):
+        return None
+    return os.path.join(artifact_dir(path), f"{name}.pkl")
+
+
+def read_artifact(path):
+    try:
+        with open(path, "rb") as f:
+            version, obj = pickle.load(f)
+        if hasattr(obj, "attach"):
+            # artifacts that keep their arrays in side files map them here
+            obj.attach(os.path.dirname(path))
+        return version, obj
+    except Exception:
+        # unreadable, or pickled by an older version of the code: rebuilt and
+        # overwritten by the caller
+        return None, None
+
+
+def cached_artifact(df, name, build, extend=None):
+    # derived structures (filter index, aggregates, ...) are built once per
+    # store version and pickled next to the columns. After an append, an
+    # artifact with an extend(obj, tail) hook only folds in the new rows.
+    path = _artifact_path(df, name)
+    if path is None:
+        return build(df)
+
+    version = df.attrs.get("store_version")
+    saved_version, obj = read_artifact(path)
+    if saved_version == version:
+        return obj
+
+    start = df.attrs.get("store_lineage", {}).get(saved_version)
+    if extend is not None and start is not None and obj is not None:
+        obj = extend(obj, df.iloc[start:])
+    else:
+        obj = build(df)
+    _write_artifact(path, version, obj)
+    return obj
+
+
+def _write_artifact(path, version, obj):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp, "wb") as f:
+        pickle.dump((version, obj), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def save_artifact(path, name, obj):
+    # lets writers (e.g. the streaming ingest) publish aggregates they already
+    # maintained, so loading never has to rescan the columns
+    path = os.path.realpath(path)
+    manifest = read_manifest(path)
+    _write_artifact(os.path.join(artifact_dir(path), f"{name}.pkl"), manifest["version"], obj)
+
+
+if __name__ == "__main__":
+    import sys
+
+    # one-time ingest: python store.py gaming_data_cleaned.csv gaming_data_europe.csv
+    for csv_path in sys.argv[1:]:
+        info = build_store(csv_path)
+        print(f"{csv_path} -> {store_path(csv_path)} ({info['n_rows']} rows, version {info['version']})")
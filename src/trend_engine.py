@@ -0,0 +1,286 @@
+# @Author : Yulia
+# @File   : trend_engine.py
+# @Time   : 2026/10/18
+
+import numpy as np
+import pandas as pd
+
+from cube import CUBE_KEYS, cell_codes, cell_index, cell_mask
+
+# Daily rollups of new players, payers and sessions per cube cell, built once
+# per store version with bincount and folded forward on appends. Weekly and
+# monthly series are reduceat sums over the day axis, range totals come from
+# prefix sums and rolling windows from cumulative-sum differences, so a render
+# costs O(cells x days) whatever the row count. With a LastActiveDate column
+# the cohort matrices (players still active k periods after joining) are kept
+# as well. Data without a JoinDate gets a simulated join day in 2024 derived
+# from the PlayerID, stable across filters and appends.
+
+JOIN_COLUMN = "JoinDate"
+ACTIVE_COLUMN = "LastActiveDate"
+SIMULATED_START = np.datetime64("2024-01-01", "D").astype(np.int64)
+SIMULATED_DAYS = 366
+FREQS = {"D": "Day", "W": "Week", "M": "Month"}
+COHORT_FREQS = ["W", "M"]
+NAT = np.iinfo(np.int64).min
+
+
+def _days(series):
+    return pd.to_datetime(series).to_numpy(dtype="datetime64[D]").astype(np.int64)
+
+
+def _simulated_days(df):
+    ids = df["PlayerID"] if "PlayerID" in df.columns else df
+    if isinstance(ids, pd.Series) and pd.api.types.is_numeric_dtype(ids):
+        # the store may widen the id column on append; hash the value, not the dtype
+        ids = ids.astype("float64")
+    hashes = pd.util.hash_pandas_object(ids, index=False).to_numpy()
+    return SIMULATED_START + (hashes % SIMULATED_DAYS).astype(np.int64)
+
+
+def _period(days, freq):
+    if freq == "D":
+        return days
+    if freq == "W":
+        # weeks start on Monday; 1970-01-01 was a Thursday
+        return (days + 3) // 7
+    return days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+
+
+def _labels(periods, freq):
+    if freq == "M":
+        return periods.astype("datetime64[M]").astype(str)
+    days = periods * 7 - 3 if freq == "W" else periods
+    return days.astype("datetime64[D]").astype(str)
+
+
+def _weights(df, col, valid):
+    if col not in df.columns:
+        return None
+    return np.nan_to_num(df[col].to_numpy(dtype=np.float64, na_value=np.nan)[valid])
+
+
+def _rolling_sum(values, window):
+    # sum of the last `window` entries along axis 0 (fewer at the start)
+    if window <= 1:
+        return values
+    total = np.concatenate([np.zeros((1,) + values.shape[1:], dtype=values.dtype), np.cumsum(values, axis=0)])
+    end = np.arange(1, len(values) + 1)
+    return total[end] - total[np.maximum(end - window, 0)]
+
+
+def _combine(n_cells, parts):
+    # parts are (rows, first, array) with arrays shaped cells x periods (x ages);
+    # returns the aligned sum over the union of their period ranges
+    parts = [(rows, first, a) for rows, first, a in parts if a.shape[1]]
+    if not parts:
+        return 0, None
+    first = min(f for _, f, _ in parts)
+    end = max(f + a.shape[1] for _, f, a in parts)
+    tail = tuple(max(a.shape[d] for _, _, a in parts) for d in range(2, parts[0][2].ndim))
+    out = np.zeros((n_cells, end - first) + tail, dtype=parts[0][2].dtype)
+    for rows, f, a in parts:
+        index = (rows, slice(f - first, f - first + a.shape[1])) + tuple(slice(0, s) for s in a.shape[2:])
+        out[index] += a
+    return first, out
+
+
+class Timeline:
+    # daily[name] is cells x days starting at first_day (days since 1970-01-01);
+    # cohorts[freq] is (first period, cells x join periods x periods active)
+
+    def __init__(self, keys, cells, first_day, daily, cohorts, last_seen, simulated):
+        self.keys = list(keys)
+        self.cells = cells
+        self.first_day = first_day
+        self.daily = daily
+        self.cohorts = cohorts
+        self.last_seen = last_seen
+        self.simulated = simulated
+
+    @classmethod
+    def from_frame(cls, df, keys=CUBE_KEYS):
+        keys = [k for k in keys if k in df.columns]
+        simulated = JOIN_COLUMN not in df.columns
+        join = _simulated_days(df) if simulated else _days(df[JOIN_COLUMN])
+        last = _days(df[ACTIVE_COLUMN]) if ACTIVE_COLUMN in df.columns and not simulated else None
+
+        codes, cells = cell_codes(df, keys)
+        valid = join != NAT
+        codes, join = codes[valid], join[valid]
+        if last is not None:
+            last = last[valid]
+            active = (last != NAT) & (last >= join)
+        if not len(join):
+            return cls(keys, cells, 0, {}, {}, NAT, simulated)
+
+        first_day = int(join.min())
+        end = int(join.max()) + 1
+        if last is not None and active.any():
+            end = max(end, int(last[active].max()) + 2)
+        span = end - first_day
+
+        def per_day(days, rows, weights=None):
+            flat = rows * span + (days - first_day)
+            return np.bincount(flat, weights, minlength=len(cells) * span).reshape(len(cells), span)
+
+        daily = {"joined": per_day(join, codes)}
+        for name, col in (("payers", "InGamePurchases"), ("sessions", "SessionsPerWeek")):
+            weights = _weights(df, col, valid)
+            if weights is not None:
+                daily[name] = per_day(join, codes, weights)
+
+        cohorts = {}
+        last_seen = int(join.max())
+        if last is not None:
+            # a player counts as active until the day after their last activity
+            daily["churned"] = per_day(last[active] + 1, codes[active])
+            if active.any():
+                last_seen = max(last_seen, int(last[active].max()))
+            for freq in COHORT_FREQS:
+                cohorts[freq] = cls._cohort_counts(codes[active], join[active], last[active], len(cells), freq)
+        return cls(keys, cells, first_day, daily, cohorts, last_seen, simulated)
+
+    @staticmethod
+    def _cohort_counts(codes, join, last, n_cells, freq):
+        if not len(join):
+            return 0, np.zeros((n_cells, 0, 0), dtype=np.int64)
+        start, age = _period(join, freq), _period(last, freq) - _period(join, freq)
+        first = int(start.min())
+        n_periods, n_ages = int(start.max()) - first + 1, int(age.max()) + 1
+        flat = (codes * n_periods + (start - first)) * n_ages + age
+        counts = np.bincount(flat, minlength=n_cells * n_periods * n_ages)
+        return first, counts.reshape(n_cells, n_periods, n_ages)
+
+    def extend(self, tail):
+        if len(tail) == 0:
+            return self
+        other = Timeline.from_frame(tail, self.keys)
+        if other.simulated != self.simulated:
+            raise ValueError("appended rows and history disagree on having a JoinDate column")
+        position = {cell: i for i, cell in enumerate(self.cells)}
+        cells = self.cells + [cell for cell in other.cells if cell not in position]
+        position = {cell: i for i, cell in enumerate(cells)}
+        mine = np.arange(len(self.cells))
+        theirs = np.array([position[cell] for cell in other.cells], dtype=np.int64)
+
+        daily = {}
+        first_day = self.first_day
+        for name in set(self.daily) | set(other.daily):
+            parts = [(rows, t.first_day, t.daily[name]) for rows, t in ((mine, self), (theirs, other)) if name in t.daily]
+            first_day, daily[name] = _combine(len(cells), parts)
+        if any(a is None for a in daily.values()):
+            daily = {}
+        # every daily array spans the same days, so they share one first day
+        cohorts = {}
+        for freq in set(self.cohorts) | set(other.cohorts):
+            parts = [(rows, *t.cohorts[freq]) for rows, t in ((mine, self), (theirs, other)) if freq in t.cohorts]
+            first, counts = _combine(len(cells), parts)
+            cohorts[freq] = (first, counts if counts is not None else np.zeros((len(cells), 0, 0), dtype=np.int64))
+        return Timeline(self.keys, cells, first_day, daily, cohorts,
+                        max(self.last_seen, other.last_seen), self.simulated)
+
+    def query(self, selected_region, genres, genders, purchase_filter):
+        mask = np.zeros(0, dtype=bool)
+        if self.cells:
+            mask = cell_mask(cell_index(self.cells, self.keys), selected_region, genres, genders, purchase_filter)
+        daily = {name: values[mask].sum(axis=0) for name, values in self.daily.items()}
+        cohorts = {freq: (first, counts[mask].sum(axis=0)) for freq, (first, counts) in self.cohorts.items()}
+        return TimelineView(self.first_day, daily, cohorts, self.last_seen, self.simulated)
+
+    def view(self):
+        return self.query("Global", [], [], "All")
+
+    def same_as(self, other):
+        if (self.keys, self.simulated, self.last_seen) != (other.keys, other.simulated, other.last_seen):
+            return False
+        if set(self.cells) != set(other.cells) or self.first_day != other.first_day:
+            return False
+        if set(self.daily) != set(other.daily) or set(self.cohorts) != set(other.cohorts):
+            return False
+        # same cells, possibly in another order
+        position = {cell: i for i, cell in enumerate(other.cells)}
+        order = np.array([position[cell] for cell in self.cells], dtype=np.int64)
+        return all(np.array_equal(values, other.daily[name][order]) for name, values in self.daily.items()) and all(
+            first == other.cohorts[freq][0] and np.array_equal(counts, other.cohorts[freq][1][order])
+            for freq, (first, counts) in self.cohorts.items())
+
+
+class TimelineView:
+    # the rollups of one filter selection, summed over its cells
+
+    def __init__(self, first_day, daily, cohorts, last_seen, simulated):
+        self.first_day = first_day
+        self.daily = daily
+        self.cohorts = cohorts
+        self.last_seen = last_seen
+        self.simulated = simulated
+        self._prefix = {name: np.concatenate([[0], np.cumsum(values)]) for name, values in daily.items()}
+
+    @property
+    def has_cohorts(self):
+        return any(counts.size for _, counts in self.cohorts.values())
+
+    def _day_range(self, start=None, end=None):
+        # inclusive start / end dates -> half-open positions on the day axis
+        n = len(self.daily.get("joined", ()))
+        lo = 0 if start is None else int(np.datetime64(start, "D").astype(np.int64)) - self.first_day
+        hi = n if end is None else int(np.datetime64(end, "D").astype(np.int64)) - self.first_day + 1
+        return min(max(lo, 0), n), min(max(hi, 0), n)
+
+    def totals(self, start=None, end=None):
+        # O(1) range query over the prefix sums
+        lo, hi = self._day_range(start, end)
+        return {name: prefix[max(hi, lo)] - prefix[lo] for name, prefix in self._prefix.items()}
+
+    def series(self, freq="M", start=None, end=None, window=1):
+        label = FREQS[freq]
+        joined = self.daily.get("joined")
+        lo, hi = self._day_range(start, end)
+        if joined is not None:
+            # trim to the days that have joins in this selection
+            joins = np.flatnonzero(joined[lo:hi])
+            lo, hi = (lo + joins[0], lo + joins[-1] + 1) if len(joins) else (lo, lo)
+        if hi <= lo:
+            trend = pd.DataFrame(columns=[label, "New Players", "Paying Players", "Average Sessions"])
+            trend.attrs["simulated"] = self.simulated
+            return trend
+
+        periods = _period(self.first_day + np.arange(lo, hi), freq)
+        bounds = np.flatnonzero(np.r_[True, periods[1:] != periods[:-1]])
+        sums = {name: _rolling_sum(np.add.reduceat(values[lo:hi], bounds), window)
+                for name, values in self.daily.items() if name != "churned"}
+        new = sums["joined"]
+        trend = pd.DataFrame({label: _labels(periods[bounds], freq), "New Players": new})
+        if "payers" in sums:
+            trend["Paying Players"] = np.rint(sums["payers"]).astype(np.int64)
+        if "sessions" in sums:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                trend["Average Sessions"] = np.where(new > 0, sums["sessions"] / np.maximum(new, 1), np.nan)
+        if "churned" in self._prefix:
+            # players active at the end of each period
+            ends = lo + np.r_[bounds[1:], hi - lo]
+            trend["Active Players"] = self._prefix["joined"][ends] - self._prefix["churned"][ends]
+        trend.attrs["simulated"] = self.simulated
+        return trend
+
+    def cohort_matrix(self, freq="M", window=1):
+        # share of each join cohort still active k periods later; rolling
+        # windows pool `window` consecutive cohorts (labelled by the newest)
+        if freq not in self.cohorts:
+            return None
+        first, counts = self.cohorts[freq]
+        if not counts.size:
+            return None
+        pooled = _rolling_sum(counts, window)
+        survivors = np.cumsum(pooled[:, ::-1], axis=1)[:, ::-1]
+        size = survivors[:, 0]
+        cohort = first + np.arange(len(pooled))
+        observable = cohort[:, None] + np.arange(pooled.shape[1])[None, :] <= _period(np.int64(self.last_seen), freq)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rate = np.where(observable & (size[:, None] > 0), survivors / np.maximum(size, 1)[:, None], np.nan)
+        keep = size > 0
+        matrix = pd.DataFrame(rate[keep], index=pd.Index(_labels(cohort[keep], freq), name=FREQS[freq]),
+                              columns=pd.RangeIndex(pooled.shape[1], name=f"{FREQS[freq]}s since joining"))
+        matrix.insert(0, "Players", size[keep])
+        return matrix
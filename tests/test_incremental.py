@@ -0,0 +1,46 @@
+# @Author : Yulia
+# @File   : test_incremental.py
+# @Time   : 2026/10/18
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import incremental
+from incremental import CoMoments
+
+
+def _exact_sums(values):
+    ints = [int(v) for v in values]
+    return sum(ints), sum(v * v for v in ints)
+
+
+def test_single_chunk_near_int64_limit():
+    # scale 0, every value fits int64 but their sum does not
+    values = np.array([2 ** 61, 2 ** 61 - 2, 2 ** 61 - 4, 2 ** 61 - 8], dtype=np.float64)
+    df = pd.DataFrame({"A": values, "B": values[::-1]})
+    moments = CoMoments.from_frame(df)
+    n, sx, sxx, _ = moments.totals()
+    total, squares = _exact_sums(values)
+    assert n[0, 0] == len(values)
+    assert sx[0, 0] == total
+    assert sxx[0, 0] == squares
+
+
+def test_multi_chunk_matches_single_chunk(monkeypatch):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "Location": rng.choice(["USA", "Europe"], 5000),
+        "PlayTimeHours": rng.uniform(0, 24, 5000),
+        "Age": rng.integers(15, 50, 5000),
+    })
+    whole = CoMoments.from_frame(df)
+    monkeypatch.setattr(incremental, "CHUNK_ROWS", 700)
+    chunked = CoMoments.from_frame(df)
+    assert chunked.same_as(whole)
+    r, _ = chunked.pearson(["PlayTimeHours", "Age"])
+    assert np.isclose(r[0, 1], df["PlayTimeHours"].corr(df["Age"]))